@@ -2,4 +2,8 @@ from flask import Blueprint
 
 bp = Blueprint('api', __name__, url_prefix='/api/v1')
 
-from app.api import users, errors, login, transactions, recurring_transactions, overview, settings
+# Records the latency, queries and response size of every API request
+from app.metrics.instrumentation import instrument
+instrument(bp)
+
+from app.api import users, errors, login, transactions, recurring_transactions, overview, settings, imports
@@ -1,12 +1,112 @@
+from collections import namedtuple
 from functools import wraps
 
-from flask import request, jsonify
-from flask_jwt_extended import verify_jwt_in_request, verify_jwt_refresh_token_in_request
+from flask import request, jsonify, g, current_app
+from flask_jwt_extended import verify_jwt_in_request, verify_jwt_refresh_token_in_request, get_jwt_identity, get_jwt_claims, create_access_token, create_refresh_token
+
+from app import jwt, rate_limiter
+from app.api import bp
+from app.cache import TTLCache
+from app.models import User
+
+import time
+
+# The identity a token is issued for. The full phone number is the JWT identity,
+# and the user id and first name travel along as custom claims so that requests
+# do not have to look the user up
+TokenIdentity = namedtuple('TokenIdentity', ['full_phone_number', 'user_id', 'first_name'])
+
+# Maps a JWT identity (the full phone number) to the user's id, so that each
+# worker only looks a user up once per time to live
+identity_cache = TTLCache()
+
+@bp.record_once
+def configure_identity_cache(state):
+    identity_cache.configure(maxsize=state.app.config['IDENTITY_CACHE_SIZE'], ttl=state.app.config['IDENTITY_CACHE_TTL'])
+
+def unknown_phone_number_key(full_phone_number):
+    '''
+    The key /login marks a phone number it found no user for with, so that
+    repeated attempts against it are refused without touching the database
+
+    The marks live in the rate limit backend, so with a shared backend
+    creating the user clears the mark for every worker at once
+    '''
+
+    return 'login:unknown:' + full_phone_number
+
+def resolve_user_id(full_phone_number):
+    '''
+    Resolves a full phone number to the user's id, going to the database only
+    when it is not cached
+
+    Unknown phone numbers are not cached, since a verified phone number is used
+    to create the user right after
+    '''
+
+    user_id = identity_cache.get(full_phone_number)
+    if user_id is None:
+        user = User.query.with_entities(User.id).filter(User.full_phone_number == full_phone_number).first()
+        if user is not None:
+            user_id = user.id
+            identity_cache.set(full_phone_number, user_id)
+
+    return user_id
+
+def forget_identity(*full_phone_numbers):
+    # Drops identities from the caches, used when a user is created or changes their phone number
+    identity_cache.delete(*full_phone_numbers)
+    rate_limiter.reset(*[unknown_phone_number_key(full_phone_number) for full_phone_number in full_phone_numbers])
+
+@jwt.user_identity_loader
+def user_identity_lookup(identity):
+    # Tokens can be issued for a user, a TokenIdentity or a bare phone number
+    if isinstance(identity, (User, TokenIdentity)):
+        return identity.full_phone_number
+    return identity
+
+@jwt.user_claims_loader
+def add_claims_to_token(identity):
+    # Embeds the user id and first name when the user is known
+    if isinstance(identity, User):
+        return {'user_id': identity.id, 'first_name': identity.first_name}
+    if isinstance(identity, TokenIdentity) and identity.user_id is not None:
+        return {'user_id': identity.user_id, 'first_name': identity.first_name}
+    return {}
+
+def create_tokens(identity):
+    '''
+    Creates the access and refresh tokens for an identity along with when the
+    access token expires. Both tokens carry the same claims
+    '''
+
+    return {
+        'token': create_access_token(identity=identity),
+        'expires_at': int(time.time()) + current_app.config['JWT_ACCESS_TOKEN_EXPIRES'] - 1,
+        'refresh_token': create_refresh_token(identity=identity)
+    }
+
+def current_identity():
+    '''
+    Builds the TokenIdentity of the verified token. Tokens issued before the
+    claims were added only carry the phone number, so the user id is resolved
+    for them instead
+    '''
+
+    full_phone_number = get_jwt_identity()
+    claims = get_jwt_claims()
+    if 'user_id' in claims:
+        return TokenIdentity(full_phone_number, claims['user_id'], claims.get('first_name'))
+
+    return TokenIdentity(full_phone_number, resolve_user_id(full_phone_number), None)
 
 def verify_request(fn):
     @wraps(fn)
     def wrapper(*args, **kwargs):
         verify_jwt_in_request()
+        identity = current_identity()
+        g.user_id = identity.user_id
+        g.first_name = identity.first_name
         return fn(*args, **kwargs)
 
     return wrapper
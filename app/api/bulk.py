@@ -0,0 +1,78 @@
+from app import db
+from app.models import User
+from app.money import to_cents
+
+from datetime import datetime
+
+
+class BulkValidationError(ValueError):
+    # Raised when an item of a bulk payload is not formatted correctly
+    pass
+
+
+def parse_items(items, required, dates):
+    '''
+    Validates a list of items in one pass and turns them into rows ready to be
+    inserted
+
+    The required parameter lists the keys every item needs, and dates maps the
+    keys holding dates to (column, format). Dates are parsed once per distinct
+    value, since offline batches tend to share a handful of days
+    '''
+
+    parsed_dates = {}
+    rows = []
+    for index, item in enumerate(items):
+        # Makes sure that the data is formatted correctly
+        missing = [key for key in required if key not in item]
+        if missing:
+            raise BulkValidationError('item {0} is missing required parameters: {1}'.format(index, ', '.join(missing)))
+
+        # Converts the price to cents, which is how it is stored
+        try:
+            row = {'name': item['name'], 'category': item['category'], 'price_cents': to_cents(item['price'])}
+        except (TypeError, ValueError):
+            raise BulkValidationError('item {0} has an invalid price: {1}'.format(index, item['price']))
+        for key, (column, date_format) in dates.items():
+            value = item[key]
+            if (value, date_format) not in parsed_dates:
+                try:
+                    parsed_dates[(value, date_format)] = datetime.strptime(value, date_format)
+                except (TypeError, ValueError):
+                    raise BulkValidationError('item {0} has an invalid {1}: {2}'.format(index, key, value))
+            row[column] = parsed_dates[(value, date_format)]
+        rows.append(row)
+
+    return rows
+
+def insert_rows(model, user_id, rows, chunk_size=1000):
+    '''
+    Inserts the rows for a user through Core executemany inserts, chunk_size
+    rows at a time, and returns the ids of the inserted rows in order
+
+    executemany does not hand back the generated ids (MySQL has no RETURNING),
+    so they are read back as the user's newest len(rows) ids. That only holds
+    if nothing else inserts for the user in between, whatever the isolation
+    level, so the user's row is locked with SELECT ... FOR UPDATE first. Every
+    insert for a user goes through here, so a concurrent bulk create or import
+    for the same user waits for our commit. SQLite has no FOR UPDATE, but
+    holds its database wide write lock from our first insert until the commit
+    '''
+
+    if not rows:
+        return []
+
+    table = model.__table__
+    for row in rows:
+        row['user_id'] = user_id
+
+    # Locks the user's row until the caller commits
+    db.session.query(User.id).filter(User.id == user_id).with_for_update().one_or_none()
+
+    # Inserts the rows in chunks
+    for offset in range(0, len(rows), chunk_size):
+        db.session.execute(table.insert(), rows[offset:offset + chunk_size])
+
+    # Reads the generated ids back, which are the user's newest
+    ids = [id for id, in db.session.query(table.c.id).filter(table.c.user_id == user_id).order_by(table.c.id.desc()).limit(len(rows))]
+    return ids[::-1]
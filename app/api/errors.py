@@ -1,4 +1,4 @@
-from flask import jsonify
+from app.serialization import jsonify
 from werkzeug.http import HTTP_STATUS_CODES
 
 def error_response(status_code, message=None):
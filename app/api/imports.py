@@ -0,0 +1,240 @@
+from flask import request, g, current_app, stream_with_context
+from app.serialization import dumps_line
+from app import db, response_cache
+from app.api import bp
+from app.models import Transaction
+from app.api.auth import verify_request
+from app.api.errors import error_response, bad_request
+from app.api.transactions import insert_transactions
+from app.money import to_cents
+from app.months import month_of
+from sqlalchemy import func
+
+import codecs
+import csv
+import itertools
+from datetime import datetime
+
+
+# Maps the column names banks commonly use onto the transaction fields
+CSV_COLUMNS = {
+    'date': 'date', 'createdat': 'date', 'posted': 'date', 'transaction date': 'date',
+    'name': 'name', 'description': 'name', 'payee': 'name', 'merchant': 'name',
+    'price': 'price',
+    'amount': 'amount',
+    'category': 'category'
+}
+
+
+@bp.route('/transactions/import', methods=['POST'])
+@verify_request
+def import_transactions():
+    '''
+    Imports a bank statement as transactions
+
+    The statement is either the request body or a multipart upload named 'file',
+    as CSV or OFX. The format comes from the 'format' query parameter, and falls
+    back to the file extension or content type. CSV files need a header row with
+    a date, a name (or description) and a price or signed amount column, and may
+    have a category. OFX files have no categories, so the 'category' query
+    parameter (defaults to 'Needs') is used for them and for CSV rows without one
+
+    The file is parsed as a stream and committed in chunks of IMPORT_CHUNK_SIZE
+    rows, so memory stays bounded no matter how big it is. Rows that already
+    existed before the import started, by (date, name, price), are skipped. The
+    response streams one JSON line of progress per chunk, ending with a line
+    where 'done' is true. Chunks committed before an error are kept
+    '''
+
+    # Checks that the identity of the JWT belongs to a user
+    user_id = g.user_id
+    if user_id is None:
+        return error_response(403)
+
+    # Gets the upload and works out its format
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    statement_format = __get_format(upload)
+    if statement_format not in ('csv', 'ofx'):
+        return bad_request('format must be csv or ofx')
+
+    category = request.args.get('category', 'Needs')
+    date_format = request.args.get('dateFormat', '%Y-%m-%d')
+    reader = codecs.getreader('utf-8-sig')(stream, errors='replace')
+
+    if statement_format == 'csv':
+        rows = parse_csv(reader, category, date_format)
+    else:
+        rows = parse_ofx(reader, category)
+
+    return current_app.response_class(stream_with_context(__import_rows(user_id, rows)), mimetype='application/x-ndjson')
+
+def __get_format(upload):
+    # Gets the format from the query string, then the file name, then the content type
+    statement_format = request.args.get('format')
+    if statement_format:
+        return statement_format.lower()
+    if upload and upload.filename and '.' in upload.filename:
+        return upload.filename.rsplit('.', 1)[1].lower()
+    content_type = (upload.mimetype if upload else request.mimetype) or ''
+    if 'ofx' in content_type:
+        return 'ofx'
+    if 'csv' in content_type:
+        return 'csv'
+    return None
+
+def parse_csv(lines, category, date_format):
+    '''
+    Yields a row for every line of a CSV statement, or None for lines that can
+    not be parsed
+
+    A price column is taken as is. A signed amount column follows the bank
+    convention where spending is negative, so only negative amounts are kept
+    '''
+
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = [CSV_COLUMNS.get(column.strip().lower()) for column in header]
+
+    for values in reader:
+        if not any(value.strip() for value in values):
+            continue
+        record = {column: value.strip() for column, value in zip(columns, values) if column}
+        try:
+            if 'price' in record:
+                price_cents = to_cents(record['price'])
+            else:
+                price_cents = -to_cents(record['amount'])
+                if price_cents <= 0:
+                    continue
+            yield {
+                'name': record['name'],
+                'category': record.get('category') or category,
+                'price_cents': price_cents,
+                'created_at': datetime.strptime(record['date'], date_format)
+            }
+        except (KeyError, ValueError):
+            yield None
+
+def __ofx_tokens(reader, chunk_size=8192):
+    '''
+    Splits an OFX document into (tag, value) tokens while reading it in chunks.
+    This handles both the SGML flavour, where leaf tags are not closed, and the
+    XML one
+    '''
+
+    buffer = ''
+    for chunk in iter(lambda: reader.read(chunk_size), ''):
+        buffer += chunk
+        parts = buffer.split('<')
+        buffer = parts.pop()
+        for part in parts:
+            if '>' in part:
+                tag, value = part.split('>', 1)
+                yield tag.strip().upper(), value.strip()
+    if '>' in buffer:
+        tag, value = buffer.split('>', 1)
+        yield tag.strip().upper(), value.strip()
+
+def parse_ofx(reader, category):
+    '''
+    Yields a row for every STMTTRN of an OFX statement, or None for the ones that
+    can not be parsed. Only debits (negative TRNAMT) are kept
+    '''
+
+    transaction = None
+    for tag, value in __ofx_tokens(reader):
+        if tag == 'STMTTRN':
+            transaction = {}
+        elif tag == '/STMTTRN' and transaction is not None:
+            try:
+                price_cents = -to_cents(transaction['TRNAMT'])
+                if price_cents > 0:
+                    yield {
+                        'name': transaction.get('NAME') or transaction['MEMO'],
+                        'category': category,
+                        'price_cents': price_cents,
+                        'created_at': datetime.strptime(transaction['DTPOSTED'][:8], '%Y%m%d')
+                    }
+            except (KeyError, ValueError):
+                yield None
+            transaction = None
+        elif transaction is not None and not tag.startswith('/'):
+            transaction[tag] = value
+
+def __import_rows(user_id, rows):
+    '''
+    Imports the parsed rows chunk by chunk, yielding a line of progress after
+    every chunk is committed
+    '''
+
+    progress = {'processed': 0, 'imported': 0, 'duplicates': 0, 'invalid': 0, 'done': False}
+
+    try:
+        # Only rows that existed before the import count as duplicates, so that
+        # identical rows within the statement are all imported
+        max_id = db.session.query(func.max(Transaction.id)).filter(Transaction.user_id == user_id).scalar() or 0
+        db.session.commit()
+
+        chunk_size = current_app.config['IMPORT_CHUNK_SIZE']
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+
+            progress['processed'] += len(chunk)
+            valid = [row for row in chunk if row is not None]
+            progress['invalid'] += len(chunk) - len(valid)
+
+            new_rows = __remove_duplicates(user_id, max_id, valid)
+            progress['duplicates'] += len(valid) - len(new_rows)
+
+            # Inserts and commits the chunk
+            if new_rows:
+                insert_transactions(user_id, new_rows)
+                db.session.commit()
+                response_cache.invalidate(user_id, months=[month_of(row['created_at']) for row in new_rows])
+                progress['imported'] += len(new_rows)
+
+            current_app.logger.info('imported %s of %s transactions for user %s', progress['imported'], progress['processed'], user_id)
+            yield dumps_line(progress)
+
+        progress['done'] = True
+        yield dumps_line(progress)
+    except Exception as e:
+        # Logs the exception that has been raised and rolls back the current chunk
+        current_app.logger.fatal(str(e))
+        db.session.rollback()
+        yield dumps_line(dict(progress, error='import failed after {0} transactions'.format(progress['imported'])))
+
+def __remove_duplicates(user_id, max_id, rows):
+    '''
+    Drops the rows that match a transaction that existed before the import by
+    (date, name, price). Each existing transaction only cancels out one row
+    '''
+
+    if not rows:
+        return rows
+
+    # Counts the existing transactions in the chunk's date range with the same names
+    dates = [row['created_at'] for row in rows]
+    existing = db.session.query(Transaction.created_at, Transaction.name, Transaction.price_cents, func.count(Transaction.id)).filter(
+        Transaction.user_id == user_id,
+        Transaction.id <= max_id,
+        Transaction.created_at >= min(dates),
+        Transaction.created_at <= max(dates),
+        Transaction.name.in_(set(row['name'] for row in rows))
+    ).group_by(Transaction.created_at, Transaction.name, Transaction.price_cents)
+    counts = {(created_at, name, price): count for created_at, name, price, count in existing}
+
+    new_rows = []
+    for row in rows:
+        key = (row['created_at'], row['name'], row['price_cents'])
+        if counts.get(key):
+            counts[key] -= 1
+        else:
+            new_rows.append(row)
+
+    return new_rows
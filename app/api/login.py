@@ -1,11 +1,15 @@
-from flask import jsonify, g, request, current_app
-from app import db, jwt
+from flask import g, request, current_app
+from app.serialization import jsonify
+from app import db, jwt, rate_limiter
 from app.models import User
 from app.api import bp
-from app.api.auth import verify_refresh_request
+from app.api.auth import verify_refresh_request, create_tokens, current_identity, unknown_phone_number_key
+from app.api.errors import error_response
+from app.hashing import PasswordHasherBusy
 
 from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt_identity
 
+import math
 import time
 
 
@@ -36,29 +40,49 @@ def get_token():
     if not password:
         return jsonify({"msg": "Missing password parameter"}), 400
 
+    # Limits the attempts per phone number and per client IP over a sliding window
+    # Refuses the attempt before any database or hashing work when over either limit
+    # Behind the load balancer, ProxyFix has already set remote_addr to the client's address
+    full_phone_number = '+' + country_code + phone_number
+    retry_after = rate_limiter.hit([
+        ('login:phone:' + full_phone_number, current_app.config['LOGIN_RATE_LIMIT_PHONE']),
+        ('login:ip:' + str(request.remote_addr), current_app.config['LOGIN_RATE_LIMIT_IP'])
+    ], current_app.config['LOGIN_RATE_LIMIT_WINDOW'])
+    if retry_after:
+        current_app.logger.warning('rate limited login for %s from %s', full_phone_number, request.remote_addr)
+        response = error_response(429)
+        response.headers['Retry-After'] = str(int(math.ceil(retry_after)))
+        return response
+
+    # Refuses phone numbers that were recently found not to belong to any user
+    if rate_limiter.marked(unknown_phone_number_key(full_phone_number)):
+        return jsonify({"msg": "Phone number or password is incorrect"}), 401
+
     # Tries to find a user by the given email
-    user = User.query.filter(User.full_phone_number == '+' + country_code + phone_number).first()
+    # and remembers the phone number if there is none
+    user = User.query.filter(User.full_phone_number == full_phone_number).first()
+    if user is None:
+        rate_limiter.mark(unknown_phone_number_key(full_phone_number), current_app.config['UNKNOWN_PHONE_CACHE_TTL'])
     # Returns false if the user does not exist
-    if user is None or not user.check_password(password):
-        return jsonify({"msg": "Phone number or password is incorrect"}), 401
+    # Sheds the login when too many passwords are waiting to be hashed
+    try:
+        if user is None or not user.check_password(password):
+            return jsonify({"msg": "Phone number or password is incorrect"}), 401
+    except PasswordHasherBusy as e:
+        current_app.logger.error(str(e))
+        return error_response(503)
 
-    # Generates the access token
-    access_token = create_access_token(identity='+'+country_code+phone_number)
-    refresh_token = create_refresh_token(identity='+'+country_code+phone_number)
+    # Saves the password hash if it was upgraded to the configured parameters
+    if db.session.is_modified(user):
+        db.session.commit()
+        current_app.logger.info('rehashed the password of user %s', user.id)
 
-    # Returns the access token
-    return jsonify({
-        'token': access_token,
-        'expires_at': int(time.time()) + current_app.config['JWT_ACCESS_TOKEN_EXPIRES'] - 1,
-        'refresh_token': refresh_token
-    }), 200
+    # Generates and returns the access token
+    # The user's id and first name are embedded as claims
+    return jsonify(create_tokens(user)), 200
 
 @bp.route('/refresh', methods=['GET'])
 @verify_refresh_request
 def refresh_token():
-    current_user = get_jwt_identity()
-    return jsonify({
-        'token': create_access_token(identity=current_user),
-        'expires_at': int(time.time()) + current_app.config['JWT_ACCESS_TOKEN_EXPIRES'] - 1,
-        'refresh_token': create_refresh_token(identity=current_user)
-    }), 200
+    # Carries the claims of the refresh token over to the new tokens
+    return jsonify(create_tokens(current_identity())), 200
@@ -1,44 +1,77 @@
-from flask import jsonify, request, url_for, g, abort, current_app
-from app import db
+from flask import request, url_for, g, abort, current_app
+from app.serialization import jsonify
+from app import db, response_cache
 from app.api import bp
 from app.models import User, Transaction, RecurringTransaction, Settings
 from app.api.auth import verify_request
-from app.api.errors import error_response
+from app.routing import read_replica
+from app.api.errors import error_response, bad_request
+from app import rollups, settings_history
+from app.money import to_cents, to_amount
+from app.months import parse_month, format_month, month_of, add_months, months_between
 from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt_identity, jwt_required, get_jwt_claims, jwt_refresh_token_required
-from app.api.settings import get_settings
 
 import json
 import sys
 import calendar
+import itertools
 
 from datetime import datetime
 
 
 @bp.route('/overview', methods=['GET'])
 @verify_request
+@read_replica
 def get_overview():
     # Checks if a date has been passed through
     date_param = request.args.get('date', None)
 
     # Gets today's YYYY-MM as a string to use later on
-    date_today = datetime.today().strftime('%Y-%m')
-    # Gets the users full phone number
-    full_phone_number = get_jwt_identity()
+    date_today = format_month(datetime.today())
+    # Gets the user id resolved from the JWT
+    user_id = g.user_id
 
     # if the date was not passed we get today's YYYY-MM
     # and set is_curent to True
     if not date_param:
-        return __get_overview(full_phone_number, date_today, is_current=True)
+        return __get_overview(user_id, date_today, is_current=True)
     else:
+        # Normalizes the date, so that 2020-6 and 2020-06 are the same month
+        # and share the cache key the writes invalidate
+        try:
+            date_param = format_month(parse_month(date_param))
+        except ValueError:
+            return bad_request('date must be formatted as YYYY-MM')
+
         # If the date was set, we first need to check if it is todays YYYY-MM
         # If so, then sick
         if date_today == date_param:
-            return __get_overview(full_phone_number, date_today, is_current=True)
+            return __get_overview(user_id, date_today, is_current=True)
+        # Future months are not cached either, like for /transactions
+        elif date_param > date_today:
+            return __get_overview(user_id, date_param, is_current=False)
         else:
-            return __get_overview(full_phone_number, date_param, is_current=False)
+            # Past months are cached until a write invalidates them
+            return response_cache.response(user_id, 'overview', date_param, lambda: __get_overview(user_id, date_param, is_current=False))
+
+
+@bp.route('/overview/trend', methods=['GET'])
+@verify_request
+@read_replica
+def get_overview_trend():
+    # Gets how many months to return, ending with the current month
+    # unless an end month is passed through
+    try:
+        count = int(request.args.get('months', 12))
+        end = parse_month(request.args['to']) if 'to' in request.args else month_of(datetime.today())
+    except ValueError:
+        return bad_request('months must be a number and to must be formatted as YYYY-MM')
+    if count < 1 or count > current_app.config['TREND_MAX_MONTHS']:
+        return bad_request('months must be between 1 and {0}'.format(current_app.config['TREND_MAX_MONTHS']))
 
+    return __get_overview_trend(g.user_id, add_months(end, -(count - 1)), end)
 
-def __get_overview(full_phone_number, date, is_current=False):
+def __get_overview(user_id, date, is_current=False):
     '''
     Per the designs, we will pass back:
         - A header ("Hello, David", "Well Done", "Over Budget")
@@ -80,63 +113,42 @@ def __get_overview(full_phone_number, date, is_current=False):
             }
         }
 
-        # Makes the call to get the users settings for that month
+        # Reformats the date
+        date = parse_month(date)
+
+        # Makes the call to get the users first name and settings for that month
         # And sets the response object
-        settings = get_settings(full_phone_number, date)
+        first_name, settings = __get_user_and_settings(user_id, date, first_name=g.first_name)
         response['monthlyIncome'] = settings['income']
 
-        # Reformats the date
-        date = datetime.strptime(date, '%Y-%m')
-
         # Checks what link to show on the app
         if is_current:
             response['showInfo'] = True
         else:
             response['showTransactions'] = True
 
-        # Gets both the monthly transactions
-        # and the recurring payments
-        transactions_by_month = Transaction.query.filter(Transaction.created_at >= date, Transaction.created_at < date.replace(month=date.month+1)).join(Transaction.author).filter(User.full_phone_number == full_phone_number)
-        recurring_transactions_by_user = RecurringTransaction.query.filter(RecurringTransaction.effective_at < date.replace(month=date.month+1)).join(RecurringTransaction.recurring_author).filter(User.full_phone_number == full_phone_number)
-
-        # Initializes the variables
-        needs_spent = 0
-        wants_spent = 0
-        savings_spent = 0
-
-        # Loops through the transactions to get the totals
-        for transaction in transactions_by_month:
-            if transaction.category == 'Needs':
-                response['settings']['needs']['spent'] += transaction.price
-            elif transaction.category == 'Wants':
-                response['settings']['wants']['spent'] += transaction.price
-            else:
-                response['settings']['savings']['spent'] += transaction.price
-
-        # Loops through the recurring transactions to get the totals
-        for recurring_transaction in recurring_transactions_by_user:
-            if recurring_transaction.category == 'Needs':
-                response['settings']['needs']['spent'] += recurring_transaction.price
-            elif recurring_transaction.category == 'Wants':
-                response['settings']['wants']['spent'] += recurring_transaction.price
-            else:
-                response['settings']['savings']['spent'] += recurring_transaction.price
+        # Gets the totals per category in cents from the monthly rollups,
+        # including the recurring payments, and adds them to the matching bucket
+        spent = {'needs': 0, 'wants': 0, 'savings': 0}
+        for category, category_spent in rollups.spent_by_category(user_id, date):
+            spent[__get_bucket(category)] += category_spent
 
-        # Gets the allowed for each category
-        response['settings']['needs']['allowed'] = settings['income'] * settings['needsPercentage']
-        response['settings']['wants']['allowed'] = settings['income'] * settings['wantsPercentage']
-        response['settings']['savings']['allowed'] = settings['income'] * settings['savingsPercentage']
+        # Gets the allowed for each category, in whole cents
+        income = to_cents(settings['income'])
+        allowed = {bucket: round(income * settings[bucket + 'Percentage']) for bucket in spent}
 
-        # Gets the percentaage for each category
-        response['settings']['needs']['percentage'] = (response['settings']['needs']['spent'] / response['settings']['needs']['allowed']) * 100
-        response['settings']['wants']['percentage'] = (response['settings']['wants']['spent'] / response['settings']['wants']['allowed']) * 100
-        response['settings']['savings']['percentage'] = (response['settings']['savings']['spent'] / response['settings']['savings']['allowed']) * 100
+        # Gets the spent, allowed and percentage for each category
+        for bucket in spent:
+            response['settings'][bucket]['spent'] = to_amount(spent[bucket])
+            response['settings'][bucket]['allowed'] = to_amount(allowed[bucket])
+            response['settings'][bucket]['percentage'] = (spent[bucket] / allowed[bucket]) * 100
 
         # Calculates the amount spent
-        response['amountSpent'] = response['settings']['needs']['spent'] + response['settings']['wants']['spent'] + response['settings']['savings']['spent']
+        amount_spent = sum(spent.values())
+        response['amountSpent'] = to_amount(amount_spent)
 
         # Gets the total percentage
-        response['totalPercentage'] = (response['amountSpent'] / response['monthlyIncome']) * 100
+        response['totalPercentage'] = (amount_spent / income) * 100
 
         # Gets the number of days left
         now = datetime.now()
@@ -144,19 +156,103 @@ def __get_overview(full_phone_number, date, is_current=False):
 
         # If it is not current we set the header
         if not is_current:
-            if response['amountSpent'] > response['monthlyIncome']:
+            if amount_spent > income:
                 response['header'] = 'Over Budget'
             else:
                 response['header'] = 'Well Done!'
         else:
-            # Gets the User so that we can get their first name
-            user = User.query.filter(User.full_phone_number == full_phone_number).first()
             # Sets the header
-            response['header'] = 'Hello, ' + user.first_name
+            response['header'] = 'Hello, ' + first_name
 
         return jsonify(response), 200
     except Exception as e:
         # Logs the response and
         # Returns a 500 response (Internal Server Error)
-        current_app.logger.fatal('Error on line {0} {1}'.format(sys.exc_info()[-1].tb_lineno, str(e)))
+        current_app.logger.fatal('Error on line %s %s', sys.exc_info()[-1].tb_lineno, str(e))
         return error_response(500)
+
+
+def __get_user_and_settings(user_id, date, first_name=None):
+    '''
+    Gets the users first name and the settings in effect for the month
+
+    The settings come from the user's cached settings history, so a user
+    without any settings gets an empty settings dictionary. When the first name
+    is already known from the token claims, the user is not queried at all
+    '''
+
+    if first_name is None:
+        first_name = db.session.query(User.first_name).filter(User.id == user_id).scalar()
+
+        # Checks if the user exists
+        # If not, we raise so that the caller can return 500
+        if first_name is None:
+            raise LookupError('no user found for id {0}'.format(user_id))
+
+    return first_name, settings_history.settings_at(user_id, date)
+
+def __get_overview_trend(user_id, start, end):
+    '''
+    Gets the spent vs allowed figures of the overview for every month from start
+    to end at once
+
+    The rollups are read with one grouped query and laid out as one array per
+    category, indexed by month. The recurring transactions are then projected
+    across the months with a running sum, and each month is matched with the
+    settings in effect for it
+    '''
+
+    try:
+        count = months_between(start, end) + 1
+        categories = ('needs', 'wants', 'savings')
+
+        # Lays the rollups out by category and month, in cents
+        # Recurring transactions from before the range are carried into the first month
+        spent = {category: [0] * count for category in categories}
+        recurring = {category: [0] * count for category in categories}
+        for month, category, month_spent, month_recurring in rollups.totals_by_month_and_category(user_id, end):
+            category = __get_bucket(category)
+            index = max(months_between(start, month), 0)
+            if month >= start:
+                spent[category][index] += month_spent
+            recurring[category][index] += month_recurring
+
+        # Projects the recurring transactions across the months
+        # and adds them to what was spent
+        for category in categories:
+            spent[category] = [a + b for a, b in zip(spent[category], itertools.accumulate(recurring[category]))]
+
+        # Gets the settings in effect for each month
+        settings_by_month = settings_history.get_history(user_id).between(start, count)
+
+        months = []
+        for index, settings in enumerate(settings_by_month):
+            income = to_cents(settings.get('income') or 0)
+            month = {
+                'month': format_month(add_months(start, index)),
+                'monthlyIncome': to_amount(income),
+                'amountSpent': to_amount(sum(spent[category][index] for category in categories))
+            }
+            for category in categories:
+                allowed = round(income * (settings.get(category + 'Percentage') or 0))
+                month[category] = {
+                    'spent': to_amount(spent[category][index]),
+                    'allowed': to_amount(allowed),
+                    'percentage': (spent[category][index] / allowed) * 100 if allowed else 0
+                }
+            months.append(month)
+
+        return jsonify({'months': months}), 200
+    except Exception as e:
+        # Logs the response and
+        # Returns a 500 response (Internal Server Error)
+        current_app.logger.fatal('Error on line %s %s', sys.exc_info()[-1].tb_lineno, str(e))
+        return error_response(500)
+
+def __get_bucket(category):
+    # Anything that is not a need or a want counts as savings, like in the overview
+    if category == 'Needs':
+        return 'needs'
+    elif category == 'Wants':
+        return 'wants'
+    return 'savings'
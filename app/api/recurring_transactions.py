@@ -1,9 +1,15 @@
-from flask import jsonify, request, url_for, g, abort, current_app
-from app import db
+from flask import request, url_for, g, abort, current_app
+from app.serialization import jsonify
+from app import db, response_cache
 from app.api import bp
 from app.models import User, RecurringTransaction
 from app.api.auth import verify_request
-from app.api.errors import error_response
+from app.routing import read_replica
+from app.api.errors import error_response, bad_request
+from app.api import bulk
+from app import rollups
+from app.money import to_amount
+from app.months import month_of
 from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt_identity, jwt_required, get_jwt_claims, jwt_refresh_token_required
 from sqlalchemy import and_
 
@@ -12,50 +18,52 @@ import json
 
 @bp.route('/recurring-transactions', methods=['GET', 'POST'])
 @verify_request
+@read_replica
 def recurring_transactions():
     # Checks the method being passed through to the API
     if request.method == 'GET':
         # Executes/Returns the data need whether it is recurring or non-recurring
-        return __get_recurring_transactions(get_jwt_identity())
+        return __get_recurring_transactions(g.user_id)
     # The else statement means that it is a POST request
     # In this case, we create a transaction
     else:
-        return __create_recurring_transactions(get_jwt_identity(), json.loads(request.data))
+        return __create_recurring_transactions(g.user_id, json.loads(request.data))
 
 @bp.route('/recurring-transactions/<id>', methods=['PUT', 'DELETE'])
 @verify_request
 def update_recurring_transactions(id):
     if request.method == 'PUT':
-        return __update_recurring_transaction(id, get_jwt_identity(), json.loads(request.data))
+        return __update_recurring_transaction(id, g.user_id, json.loads(request.data))
     else:
-        return __delete_recurring_transaction(id, get_jwt_identity())
+        return __delete_recurring_transaction(id, g.user_id)
 
 
-def __get_recurring_transactions(full_phone_number):
+def __get_recurring_transactions(user_id):
     '''
-    Passing through the full phone number, we get the full list of recurring
+    Passing through the user id, we get the full list of recurring
     transactions without worrying about dates
 
     Once we get all recurring transactions, we calculate the total amount spent
     '''
 
     try:
-        # Gets all recurring transactions by phone number
-        recurring_transactions_by_user = RecurringTransaction.query.join(RecurringTransaction.recurring_author).filter(User.full_phone_number == full_phone_number)
+        # Gets all recurring transactions by user id
+        # as plain rows, since they are only serialized
+        recurring_transactions_by_user = db.session.query(*RecurringTransaction.listing_columns()).filter(RecurringTransaction.user_id == user_id)
 
         # Initializes local variables for json output
         recurring_transactions = []
         amount_spent = 0
 
         # Loops through all transactions and puts them in a list
-        # Continues to add up the values
+        # Continues to add up the values in cents, which is exact
         for recurring_transaction in recurring_transactions_by_user:
-            amount_spent += recurring_transaction.price
-            recurring_transactions.append(recurring_transaction.to_dict())
+            amount_spent += recurring_transaction.price_cents or 0
+            recurring_transactions.append(RecurringTransaction.row_to_dict(recurring_transaction))
 
         # returns the jsonified version
         return jsonify({
-            'amountSpent': round(amount_spent, 2),
+            'amountSpent': to_amount(amount_spent),
             'recurringTransactions': recurring_transactions
         }), 200
     except Exception as e:
@@ -64,13 +72,14 @@ def __get_recurring_transactions(full_phone_number):
         current_app.logger.fatal(str(e))
         return error_response(500)
 
-def __create_recurring_transactions(full_phone_number, request_data):
+def __create_recurring_transactions(user_id, request_data):
     '''
-    Passing through the full phone number and recurring transaction request data,
-    we first get the user, and then create the transaction with the author
+    Passing through the user id and recurring transaction request data, we
+    create the transactions for that user
 
-    Since this can accept many transactions we do this for as many transactions
-    as there are
+    Since this can accept many transactions, the whole payload is validated
+    first and the rows are then inserted in bulk. The ids of the created
+    transactions are returned in order
 
     If it fails at any point, we roll back the changes and do not add any
     transaction
@@ -80,42 +89,44 @@ def __create_recurring_transactions(full_phone_number, request_data):
         # Loads the request body
         # and checks whether all information is present
         if ('transactions' not in request_data):
-            current_app.logger.error('request body not formatted correctly, body is missing required parameters: {0}'.format(request_data))
+            current_app.logger.error('request body not formatted correctly, body is missing required parameters: %s', request_data)
             return error_response(400)
 
-        # Gets the identity of the JWT
-        # and gets the user from the DB
-        author = User.query.filter(User.full_phone_number == full_phone_number).first()
+        # Checks that the identity of the JWT belongs to a user
+        if user_id is None:
+            return error_response(403)
 
-        # Gets the list of transactions
-        # And creates transactions for that User
+        # Checks that the batch is not too big
         transactions_list = request_data['transactions']
-        for item in transactions_list:
-            # Makes sure that the data is formatted correctly
-            if ('name' not in item or
-                'category' not in item or
-                'price' not in item or
-                'createdAt' not in item or
-                'effectiveAt' not in item):
-                current_app.logger.error('transaction not formatted correctly, missing required parameters: {0}'.format(item))
-                return error_response(400)
-
-            # Creates the new Transaction
-            # and attaches the author to it
-            recurring_transaction = RecurringTransaction()
-            recurring_transaction.from_dict(item, author=author)
-
-            # Logs that the user is being added to the database and then adds to the database
-            # We will commit later once everything has been processed correctly
-            db.session.add(recurring_transaction)
-            current_app.logger.info('added transaction {0} {1} to the database session'.format(recurring_transaction.category, recurring_transaction.name))
+        if len(transactions_list) > current_app.config['BULK_INSERT_MAX_ROWS']:
+            return bad_request('at most {0} transactions can be created at once'.format(current_app.config['BULK_INSERT_MAX_ROWS']))
+
+        # Validates the list of transactions
+        try:
+            rows = bulk.parse_items(transactions_list, ('name', 'category', 'price', 'createdAt', 'effectiveAt'), {
+                'createdAt': ('created_at', '%Y-%m-%d'),
+                'effectiveAt': ('effective_at', '%Y-%m')
+            })
+        except bulk.BulkValidationError as e:
+            current_app.logger.error('transaction not formatted correctly: %s', e)
+            return bad_request(str(e))
+
+        # Creates the transactions for that User
+        # and updates the monthly rollups in the same database transaction
+        ids = bulk.insert_rows(RecurringTransaction, user_id, rows, chunk_size=current_app.config['BULK_INSERT_CHUNK_SIZE'])
+        rollups.apply_changes(user_id, [(month_of(row['effective_at']), row['category'], 0, row['price_cents']) for row in rows])
+        current_app.logger.info('added %s recurring transactions to the database session', len(ids))
 
         # Commits the user to the database and logs that is has been commited
         db.session.commit()
         current_app.logger.info('commited transactions to the database session')
 
-        # Returns the response with status code 201 to indicate the user has been created
-        return error_response(201)
+        # Invalidates every cached month of the user, since recurring
+        # transactions count towards every month after they take effect
+        response_cache.invalidate(user_id)
+
+        # Returns the ids with status code 201 to indicate the transactions have been created
+        return jsonify({'ids': ids}), 201
     except Exception as e:
         # Logs the exception that has been raised and rolls back all the changes made
         current_app.logger.fatal(str(e))
@@ -123,10 +134,10 @@ def __create_recurring_transactions(full_phone_number, request_data):
         # Returns a 500 response (Internal Server Error)
         return error_response(500)
 
-def __update_recurring_transaction(id, full_phone_number, request_data):
+def __update_recurring_transaction(id, user_id, request_data):
     '''
-    Updates a transaction when given the id for that transaction, the full phone
-    number, and the new request data
+    Updates a transaction when given the id for that transaction, the user id,
+    and the new request data
     '''
 
     try:
@@ -137,28 +148,36 @@ def __update_recurring_transaction(id, full_phone_number, request_data):
             'price' not in request_data or
             'createdAt' not in request_data or
             'effectiveAt' not in request_data):
-            current_app.logger.error('request data not formatted correctly, missing required parameters: {0}'.format(request_data))
+            current_app.logger.error('request data not formatted correctly, missing required parameters: %s', request_data)
             return error_response(400)
 
         # Loads the user from the identity in the JWT
         # and queries the database
-        recurring_transaction = RecurringTransaction.query.filter(RecurringTransaction.id == id).join(RecurringTransaction.recurring_author).filter(User.full_phone_number == full_phone_number).first()
+        recurring_transaction = RecurringTransaction.query.filter(RecurringTransaction.id == id, RecurringTransaction.user_id == user_id).first()
 
         # checks if the row exists
         if not recurring_transaction:
             return error_response(403)
 
         # updates all fields in the transaction
+        # and moves its price in the monthly rollups
+        rollup_changes = [rollups.recurring_change(recurring_transaction, sign=-1)]
         recurring_transaction.from_dict(request_data)
+        rollup_changes.append(rollups.recurring_change(recurring_transaction))
 
         # Adds the transaction to the session
         db.session.add(recurring_transaction)
-        current_app.logger.info('added transaction {0} {1} to the database session'.format(recurring_transaction.category, recurring_transaction.name))
+        rollups.apply_changes(recurring_transaction.user_id, rollup_changes)
+        current_app.logger.info('added transaction %s %s to the database session', recurring_transaction.category, recurring_transaction.name)
 
         # Commits the user to the database and logs that is has been commited
         db.session.commit()
         current_app.logger.info('commited transactions to the database session')
 
+        # Invalidates every cached month of the user, since recurring
+        # transactions count towards every month after they take effect
+        response_cache.invalidate(user_id)
+
         return error_response(204)
     except Exception as e:
         # Logs the exception that has been raised and rolls back all the changes made
@@ -167,9 +186,9 @@ def __update_recurring_transaction(id, full_phone_number, request_data):
         # Returns a 500 response (Internal Server Error)
         return error_response(500)
 
-def __delete_recurring_transaction(id, full_phone_number):
+def __delete_recurring_transaction(id, user_id):
     '''
-    Deletes the recurring transaction given the id and the full phone number
+    Deletes the recurring transaction given the id and the user id
 
     If no transaction is found, we return a 403
     '''
@@ -177,20 +196,26 @@ def __delete_recurring_transaction(id, full_phone_number):
     try:
         # Loads the user from the identity in the JWT
         # and queries the database
-        recurring_transaction = RecurringTransaction.query.filter(RecurringTransaction.id == id).join(RecurringTransaction.recurring_author).filter(User.full_phone_number == full_phone_number).first()
+        recurring_transaction = RecurringTransaction.query.filter(RecurringTransaction.id == id, RecurringTransaction.user_id == user_id).first()
 
         # checks if the row exists
         if not recurring_transaction:
             return error_response(403)
 
         # deletes the transaction from the session
+        # and removes it from the monthly rollups
         db.session.delete(recurring_transaction)
-        current_app.logger.info('deleted transaction {0} {1} to the database session'.format(recurring_transaction.id, recurring_transaction.name))
+        rollups.apply_changes(recurring_transaction.user_id, [rollups.recurring_change(recurring_transaction, sign=-1)])
+        current_app.logger.info('deleted transaction %s %s to the database session', recurring_transaction.id, recurring_transaction.name)
 
         # Commits the user to the database and logs that is has been commited
         db.session.commit()
         current_app.logger.info('commited transactions to the database session')
 
+        # Invalidates every cached month of the user, since recurring
+        # transactions count towards every month after they take effect
+        response_cache.invalidate(user_id)
+
         return error_response(204)
     except Exception as e:
         # Logs the exception that has been raised and rolls back all the changes made
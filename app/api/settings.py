@@ -1,21 +1,30 @@
-from flask import jsonify, request, url_for, g, abort, current_app
-from app import db
+from flask import request, url_for, g, abort, current_app
+from app.serialization import jsonify
+from app import db, response_cache, settings_history
 from app.api import bp
 from app.models import User, Settings
 from app.api.auth import verify_request
+from app.routing import read_replica
 from app.api.errors import error_response
 from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt_identity, jwt_required, get_jwt_claims, jwt_refresh_token_required
+from app.months import parse_month
 from sqlalchemy import desc, asc
 
 import json
 from datetime import datetime
 
+
+@bp.record_once
+def configure_settings_cache(state):
+    settings_history.history_cache.configure(maxsize=state.app.config['SETTINGS_CACHE_SIZE'], ttl=state.app.config['SETTINGS_CACHE_TTL'])
+
 @bp.route('/settings', methods=['GET', 'POST'])
 @verify_request
+@read_replica
 def settings():
     try:
-        # Gets the full phone number
-        full_phone_number = get_jwt_identity()
+        # Gets the user id
+        user_id = g.user_id
 
         # Checks the method being passed through to the API
         if request.method == 'GET':
@@ -31,7 +40,7 @@ def settings():
                 date = date_param
 
             # Gets the settings
-            settings = get_settings(full_phone_number, date)
+            settings = get_settings(user_id, date)
 
             # Creates the object to send in the response
             # and returns the response
@@ -40,36 +49,28 @@ def settings():
             }
             return jsonify(response), 200
         else:
-            return __create_settings(full_phone_number, json.loads(request.data))
+            return __create_settings(user_id, json.loads(request.data))
     except Exception as e:
         # logs the error
         current_app.logger.fatal(str(e))
         # Returns a 500 response (Internal Server Error)
         return error_response(500)
 
-def get_settings(full_phone_number, date):
+def get_settings(user_id, date):
     '''
-    Gets the users settings based on the full phone number
+    Gets the users settings based on the user id
     '''
 
     try:
-        # Gets the settings based on the full_phone_number
-        settings = Settings.query.filter(Settings.effective_at <= datetime.strptime(date, '%Y-%m')).join(Settings.user).filter(User.full_phone_number == full_phone_number).order_by(desc(Settings.effective_at)).first()
-
-        # Checks if there are any settings
-        # If not, we return a 403
-        if not settings:
-            return {}
-
-        # Returns the json format of the settings object
-        return settings.to_dict()
+        # Gets the settings in effect for the month from the user's settings history
+        return settings_history.settings_at(user_id, parse_month(date))
     except Exception as e:
         # logs the error
         current_app.logger.fatal(str(e))
         # raises the error so that the caller can return 500
         raise
 
-def __create_settings(full_phone_number, request_data):
+def __create_settings(user_id, request_data):
     '''
     Creates a settings entry for the user
 
@@ -82,30 +83,36 @@ def __create_settings(full_phone_number, request_data):
     '''
 
     try:
+        # Checks that the identity of the JWT belongs to a user
+        if user_id is None:
+            return error_response(403)
+
         # Checks if there exists an entry with the same effective date
-        settings_for_effective_date = Settings.query.filter(Settings.effective_at == datetime.strptime(request_data['effectiveAt'], '%Y-%m')).first()
+        settings_for_effective_date = Settings.query.filter(Settings.user_id == user_id, Settings.effective_at == datetime.strptime(request_data['effectiveAt'], '%Y-%m')).first()
 
         # Checks if settings exist
         # If so, we delete the settings from the session
         if settings_for_effective_date:
             db.session.delete(settings_for_effective_date)
 
-        # Once we delete, we then get the user to attach to the settings
-        user = User.query.filter(User.full_phone_number == full_phone_number).first()
-
-        # After we get the user, we make the entry
+        # Once we delete, we make the entry for the user
         # and read in from the request data
-        settings = Settings()
-        settings.from_dict(request_data, user)
+        settings = Settings(user_id=user_id)
+        settings.from_dict(request_data)
 
         # After getting the entry, we add it to the session
         db.session.add(settings)
-        current_app.logger.info('added settings for {0} to the database session'.format(settings.user))
+        current_app.logger.info('added settings for user %s to the database session', user_id)
 
         # Commits the user to the database and logs that is has been commited
         db.session.commit()
         current_app.logger.info('commited settings to the database session')
 
+        # Invalidates the user's settings history and every cached month of
+        # the user, since the settings apply to every month after they take effect
+        settings_history.invalidate(user_id)
+        response_cache.invalidate(user_id)
+
         # Returns the response with status code 201 to indicate the user has been created
         return error_response(201)
     except Exception as e:
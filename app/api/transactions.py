@@ -1,97 +1,134 @@
-from flask import jsonify, request, url_for, g, abort, current_app
-from app import db
+from flask import request, url_for, g, abort, current_app, stream_with_context
+from app.serialization import jsonify, dumps as json_dumps
+from app import db, response_cache
 from app.api import bp
 from app.models import User, Transaction, RecurringTransaction
 from app.api.auth import verify_request
-from app.api.errors import error_response
+from app.routing import read_replica
+from app.api.errors import error_response, bad_request
+from app.api import bulk
+from app import rollups
+from app.money import to_amount
+from app.months import parse_month, format_month, month_of, next_month, months_between
 from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt_identity, jwt_required, get_jwt_claims, jwt_refresh_token_required
-from sqlalchemy import and_
+from sqlalchemy import and_, or_
 
+import base64
 import json
 from datetime import datetime
 
 
 @bp.route('/transactions', methods=['GET', 'POST'])
 @verify_request
+@read_replica
 def transactions():
     # Checks the method being passed through to the API
     if request.method == 'GET':
-        # Gets the date flag from the URL
-        # If no date is specified, we pass through todays date
+        # Gets either the date flag or the from/to range from the URL
         date_string = request.args.get('date', None)
+        from_string = request.args.get('from', None)
+        to_string = request.args.get('to', None)
 
-        # Checks if the date string is None
+        # Checks if neither was passed
         # If so, return a 400 error
-        if not date_string:
+        if not date_string and not (from_string and to_string):
             current_app.logger.error('Date not provided for the /transactions endpoint')
             return error_response(400)
 
-        # Loads the date into a datetime object
-        date = datetime.strptime(date_string, '%Y-%m')
+        # Loads the months into datetime objects
+        # A single date is a range of one month
+        try:
+            start = parse_month(date_string or from_string)
+            end = parse_month(date_string or to_string)
+        except ValueError:
+            return bad_request('dates must be formatted as YYYY-MM')
+        if end < start or months_between(start, end) >= current_app.config['TRANSACTIONS_MAX_RANGE_MONTHS']:
+            return bad_request('the range must span between 1 and {0} months'.format(current_app.config['TRANSACTIONS_MAX_RANGE_MONTHS']))
+
+        # Returns a single page when paginating with a cursor
+        if 'limit' in request.args or 'cursor' in request.args:
+            try:
+                limit = min(int(request.args.get('limit', current_app.config['TRANSACTIONS_PAGE_SIZE'])), current_app.config['TRANSACTIONS_MAX_PAGE_SIZE'])
+                cursor = __decode_cursor(request.args['cursor']) if 'cursor' in request.args else None
+            except (TypeError, ValueError):
+                return bad_request('limit or cursor is not valid')
+            return __get_transactions_page(g.user_id, start, end, cursor, max(limit, 1))
+
+        # Streams the whole range in chunks when asked to
+        if request.args.get('stream') == '1':
+            return __stream_transactions(g.user_id, start, end)
+
+        # Ranges are not cached, since a write would have to find every range covering it
+        # Neither is the current month, which is where users add transactions and reload
+        if start != end or start >= month_of(datetime.today()):
+            return __get_transactions(g.user_id, start, end)
 
         # Executes/Returns the data need whether it is recurring or non-recurring
-        return __get_transactions(get_jwt_identity(), date)
+        # Past months rarely change, so the response is cached until a write invalidates the month
+        return response_cache.response(g.user_id, 'transactions', format_month(start), lambda: __get_transactions(g.user_id, start, end))
     # The else statement means that it is a POST request
     # In this case, we create a transaction
     else:
-        return __create_transactions(get_jwt_identity(), json.loads(request.data))
+        return __create_transactions(g.user_id, json.loads(request.data))
 
 @bp.route('/transactions/<id>', methods=['PUT', 'DELETE'])
 @verify_request
 def update_transaction(id):
     if request.method == 'PUT':
-        return __update_transaction(id, get_jwt_identity(), json.loads(request.data))
+        return __update_transaction(id, g.user_id, json.loads(request.data))
     else:
-        return __delete_transaction(id, get_jwt_identity())
+        return __delete_transaction(id, g.user_id)
 
 
-def __create_transactions(full_phone_number, request_data):
+def __create_transactions(user_id, request_data):
     '''
     Creates a transaction when passing through transaction information, including a date
 
     When the transaction is created, it is stored with a specific date. However, when it is
     retrieved, it is retrieved with all other transactions with the same month and year
+
+    The whole payload is validated before anything is inserted, and the rows are then
+    inserted in bulk, so offline batches of thousands of transactions go in a handful
+    of statements. The ids of the created transactions are returned in order
     '''
 
     try:
         # Loads the request body
         # and checks whether all information is present
         if ('transactions' not in request_data):
-            current_app.logger.error('request body not formatted correctly, body is missing required parameters: {0}'.format(request_data))
+            current_app.logger.error('request body not formatted correctly, body is missing required parameters: %s', request_data)
             return error_response(400)
 
-        # Gets the identity of the JWT
-        # and gets the user from the DB
-        author = User.query.filter(User.full_phone_number == full_phone_number).first()
+        # Checks that the identity of the JWT belongs to a user
+        if user_id is None:
+            return error_response(403)
 
-        # Gets the list of transactions
-        # And creates transactions for that User
+        # Checks that the batch is not too big
         transactions_list = request_data['transactions']
-        for item in transactions_list:
-            # Makes sure that the data is formatted correctly
-            if ('name' not in item or
-                'category' not in item or
-                'price' not in item or
-                'createdAt' not in item):
-                current_app.logger.error('transaction not formatted correctly, missing required parameters: {0}'.format(item))
-                return error_response(400)
-
-            # Creates the new Transaction
-            # and attaches the author to it
-            transaction = Transaction()
-            transaction.from_dict(item, author=author)
-
-            # Logs that the user is being added to the database and then adds to the database
-            # We will commit later once everything has been processed correctly
-            db.session.add(transaction)
-            current_app.logger.info('added transaction {0} {1} to the database session'.format(transaction.category, transaction.name))
+        if len(transactions_list) > current_app.config['BULK_INSERT_MAX_ROWS']:
+            return bad_request('at most {0} transactions can be created at once'.format(current_app.config['BULK_INSERT_MAX_ROWS']))
+
+        # Validates the list of transactions
+        try:
+            rows = bulk.parse_items(transactions_list, ('name', 'category', 'price', 'createdAt'), {'createdAt': ('created_at', '%Y-%m-%d')})
+        except bulk.BulkValidationError as e:
+            current_app.logger.error('transaction not formatted correctly: %s', e)
+            return bad_request(str(e))
+
+        # Creates the transactions for that User
+        # We will commit once everything has been processed correctly
+        ids = insert_transactions(user_id, rows)
+        current_app.logger.info('added %s transactions to the database session', len(ids))
 
         # Commits the user to the database and logs that is has been commited
         db.session.commit()
         current_app.logger.info('commited transactions to the database session')
 
-        # Returns the response with status code 201 to indicate the user has been created
-        return error_response(201)
+        # Invalidates the cached responses for the months that changed
+        response_cache.invalidate(user_id, months=[month_of(row['created_at']) for row in rows])
+
+        # Returns the ids with status code 201 to indicate the transactions have been created
+        return jsonify({'ids': ids}), 201
     except Exception as e:
         # Logs the exception that has been raised and rolls back all the changes made
         current_app.logger.fatal(str(e))
@@ -99,62 +136,165 @@ def __create_transactions(full_phone_number, request_data):
         # Returns a 500 response (Internal Server Error)
         return error_response(500)
 
-def __get_transactions(full_phone_number, date):
+def insert_transactions(user_id, rows):
+    '''
+    Inserts already validated transaction rows for a user in bulk, and updates the
+    monthly rollups in the same database transaction
+
+    Returns the ids of the new transactions. Nothing is committed here
+    '''
+
+    ids = bulk.insert_rows(Transaction, user_id, rows, chunk_size=current_app.config['BULK_INSERT_CHUNK_SIZE'])
+    rollups.apply_changes(user_id, [(month_of(row['created_at']), row['category'], row['price_cents'], 0) for row in rows])
+    return ids
+
+def __get_transactions(user_id, start, end):
     '''
-    This takes in two parameters. The full_phone_number allows us to look up all
-    transactions for a specific user, and the date allows us to get transactions
-    by month
+    This takes in three parameters. The user_id allows us to look up all
+    transactions for a specific user, and the start and end months allow us to
+    get transactions by month, both included
 
-    We first get the transactions by month. Then we get all recurring transaction
-    who are already in effect. This allows us to more accurately show what the
-    user spent that month
+    We first get the transactions for the months. Then we get all recurring
+    transaction who are already in effect by the last month. This allows us to
+    more accurately show what the user spent
 
-    After that we package it up nicely, and caluclate the total amount spent
+    After that we package it up nicely, and caluclate the total amount spent.
+    For a range of more than one month, the amount spent for each month is added
+    under 'months'
     '''
 
     try:
         # Gets both the monthly transactions
         # and the recurring payments
-        transactions_by_month = Transaction.query.filter(Transaction.created_at >= date, Transaction.created_at < date.replace(month=date.month+1)).join(Transaction.author).filter(User.full_phone_number == full_phone_number)
-        recurring_transactions_by_user = RecurringTransaction.query.filter(RecurringTransaction.effective_at < date.replace(month=date.month+1)).join(RecurringTransaction.recurring_author).filter(User.full_phone_number == full_phone_number)
-
-        # Initializes local variables for the return json
-        transactions = []
-        recurring_transactions = []
-        amount_spent = 0
+        transactions_by_month = __query_transactions(user_id, start, end)
+        recurring_transactions_by_user = __query_recurring_transactions(user_id, end)
 
         # Loops through all transactions and puts them in a list
-        # Also adds up the sum of transactions
-        for transaction in transactions_by_month:
-            amount_spent += transaction.price
-            transactions.append(transaction.to_dict())
+        # The queries read plain rows, so no entities are built just to be serialized
+        transactions = [Transaction.row_to_dict(transaction) for transaction in transactions_by_month]
+        recurring_transactions = [RecurringTransaction.row_to_dict(recurring_transaction) for recurring_transaction in recurring_transactions_by_user]
 
-        # Loops through all transactions and puts them in a list
-        # Continues to add up the values
-        for recurring_transaction in recurring_transactions_by_user:
-            amount_spent += recurring_transaction.price
-            recurring_transactions.append(recurring_transaction.to_dict())
+        # Gets the amount spent from the monthly rollups
+        response = __get_amount_spent(user_id, start, end)
+        response['recurringTransactions'] = recurring_transactions
+        response['transactions'] = transactions
 
         # returns the jsonified version
-        return jsonify({
-            'amountSpent': round(amount_spent, 2),
-            'recurringTransactions': recurring_transactions,
-            'transactions': transactions
-        }), 200
+        return jsonify(response), 200
     except Exception as e:
         # Logs the response and
         # Returns a 500 response (Internal Server Error)
         current_app.logger.fatal(str(e))
         return error_response(500)
 
-def __update_transaction(id, full_phone_number, request_data):
+def __get_transactions_page(user_id, start, end, cursor, limit):
+    '''
+    Gets a page of the transactions for the months, ordered by (created_at, id)
+
+    This uses keyset pagination: the cursor holds the (created_at, id) of the last
+    transaction of the previous page, and the next page starts right after it.
+    Every page is an index range scan, so it costs the same no matter how deep
+    into the months it is. The amount spent and the recurring transactions are only
+    sent with the first page
+    '''
+
+    try:
+        # Gets one more transaction than the limit to know if there is a next page
+        transactions_by_month = __query_transactions(user_id, start, end)
+        if cursor:
+            created_at, id = cursor
+            transactions_by_month = transactions_by_month.filter(or_(Transaction.created_at > created_at, and_(Transaction.created_at == created_at, Transaction.id > id)))
+        page = transactions_by_month.limit(limit + 1).all()
+
+        response = {
+            'transactions': [Transaction.row_to_dict(transaction) for transaction in page[:limit]],
+            'nextCursor': __encode_cursor(page[limit - 1]) if len(page) > limit else None
+        }
+
+        # Adds the totals to the first page
+        if not cursor:
+            response.update(__get_amount_spent(user_id, start, end))
+            response['recurringTransactions'] = [RecurringTransaction.row_to_dict(recurring_transaction) for recurring_transaction in __query_recurring_transactions(user_id, end)]
+
+        return jsonify(response), 200
+    except Exception as e:
+        # Logs the response and
+        # Returns a 500 response (Internal Server Error)
+        current_app.logger.fatal(str(e))
+        return error_response(500)
+
+def __stream_transactions(user_id, start, end):
+    '''
+    Streams the same response as __get_transactions, but yields the transactions
+    in chunks as they are read from a server side cursor instead of building the
+    whole list first. Memory stays constant and the first bytes go out before the
+    months have been read
+    '''
+
+    def generate():
+        # Sends the totals and the recurring transactions first
+        response = __get_amount_spent(user_id, start, end)
+        response['recurringTransactions'] = [RecurringTransaction.row_to_dict(recurring_transaction) for recurring_transaction in __query_recurring_transactions(user_id, end)]
+        yield json_dumps(response)[:-1] + b',"transactions":['
+
+        # Then sends the transactions a chunk at a time
+        chunk_size = current_app.config['TRANSACTIONS_PAGE_SIZE']
+        chunk = []
+        separator = b''
+        for transaction in __query_transactions(user_id, start, end).yield_per(chunk_size):
+            chunk.append(json_dumps(Transaction.row_to_dict(transaction)))
+            if len(chunk) == chunk_size:
+                yield separator + b','.join(chunk)
+                separator = b','
+                chunk = []
+        if chunk:
+            yield separator + b','.join(chunk)
+
+        yield b']}'
+
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/json')
+
+def __query_transactions(user_id, start, end):
+    # Gets the transactions from the start of the first month to the end of the last in (created_at, id) order
+    # as rows of the listing columns, which cost a fraction of what entities do to load
+    return db.session.query(*Transaction.listing_columns()).filter(Transaction.user_id == user_id, Transaction.created_at >= start, Transaction.created_at < next_month(end)).order_by(Transaction.created_at, Transaction.id)
+
+def __query_recurring_transactions(user_id, month):
+    # Gets the recurring transactions in effect for the month as rows of the listing columns
+    return db.session.query(*RecurringTransaction.listing_columns()).filter(RecurringTransaction.user_id == user_id, RecurringTransaction.effective_at < next_month(month))
+
+def __get_amount_spent(user_id, start, end):
+    '''
+    Gets the amount spent from the monthly rollups with a single query. For a
+    range of more than one month, the amount spent for each month is added too
+
+    The rollups are summed in cents, so the totals are exact and only turned
+    into amounts for the response
+    '''
+
+    spent_by_month = rollups.spent_by_month(user_id, start, end)
+    response = {'amountSpent': to_amount(sum(spent for month, spent in spent_by_month))}
+    if start != end:
+        response['months'] = [{'month': format_month(month), 'amountSpent': to_amount(spent)} for month, spent in spent_by_month]
+    return response
+
+def __encode_cursor(transaction):
+    # Encodes the (created_at, id) of a transaction into an opaque cursor
+    return base64.urlsafe_b64encode('{0}|{1}'.format(transaction.created_at.isoformat(), transaction.id).encode()).decode()
+
+def __decode_cursor(cursor):
+    # Decodes a cursor back into (created_at, id), raising ValueError if it is malformed
+    created_at, id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(created_at), int(id)
+
+def __update_transaction(id, user_id, request_data):
     '''
     Updates a previously existing transaction by passing through the entire request object
 
     In this case, all fields must be passed through, even if you are only editting one
     field
 
-    The id of the transaction and phone number are passed through to identify the transactions
+    The id of the transaction and user id are passed through to identify the transactions
     If nothing can be found, we return a 403 indicating the user was forbidden from taking
     this action
     '''
@@ -166,28 +306,35 @@ def __update_transaction(id, full_phone_number, request_data):
             'category' not in request_data or
             'price' not in request_data or
             'createdAt' not in request_data):
-            current_app.logger.error('request data not formatted correctly, missing required parameters: {0}'.format(request_data))
+            current_app.logger.error('request data not formatted correctly, missing required parameters: %s', request_data)
             return error_response(400)
 
         # Loads the user from the identity in the JWT
         # and queries the database
-        transaction = Transaction.query.filter(Transaction.id == id).join(Transaction.author).filter(User.full_phone_number == full_phone_number).first()
+        transaction = Transaction.query.filter(Transaction.id == id, Transaction.user_id == user_id).first()
 
         # checks if the row exists
         if not transaction:
             return error_response(403)
 
         # updates all fields in the transaction
+        # and moves its price in the monthly rollups
+        rollup_changes = [rollups.transaction_change(transaction, sign=-1)]
         transaction.from_dict(request_data)
+        rollup_changes.append(rollups.transaction_change(transaction))
 
         # Adds the transaction to the session
         db.session.add(transaction)
-        current_app.logger.info('added transaction {0} {1} to the database session'.format(transaction.category, transaction.name))
+        rollups.apply_changes(transaction.user_id, rollup_changes)
+        current_app.logger.info('added transaction %s %s to the database session', transaction.category, transaction.name)
 
         # Commits the user to the database and logs that is has been commited
         db.session.commit()
         current_app.logger.info('commited transactions to the database session')
 
+        # Invalidates the cached responses for the old and the new month
+        response_cache.invalidate(user_id, months=[month for month, category, spent, recurring in rollup_changes])
+
         return error_response(204)
     except Exception as e:
         # Logs the exception that has been raised and rolls back all the changes made
@@ -196,10 +343,9 @@ def __update_transaction(id, full_phone_number, request_data):
         # Returns a 500 response (Internal Server Error)
         return error_response(500)
 
-def __delete_transaction(id, full_phone_number):
+def __delete_transaction(id, user_id):
     '''
-    Deletes a transaction when given the id of that transaction and the user's full
-    phone number
+    Deletes a transaction when given the id of that transaction and the user's id
 
     If no transaction can be found then we return a 403.
     '''
@@ -207,20 +353,25 @@ def __delete_transaction(id, full_phone_number):
     try:
         # Loads the user from the identity in the JWT
         # and queries the database
-        transaction = Transaction.query.filter(Transaction.id == id).join(Transaction.author).filter(User.full_phone_number == full_phone_number).first()
+        transaction = Transaction.query.filter(Transaction.id == id, Transaction.user_id == user_id).first()
 
         # checks if the row exists
         if not transaction:
             return error_response(403)
 
         # deletes the transaction from the session
+        # and removes it from the monthly rollups
         db.session.delete(transaction)
-        current_app.logger.info('deleted transaction {0} {1} to the database session'.format(transaction.id, transaction.name))
+        rollups.apply_changes(transaction.user_id, [rollups.transaction_change(transaction, sign=-1)])
+        current_app.logger.info('deleted transaction %s %s to the database session', transaction.id, transaction.name)
 
         # Commits the user to the database and logs that is has been commited
         db.session.commit()
         current_app.logger.info('commited transactions to the database session')
 
+        # Invalidates the cached responses for the month
+        response_cache.invalidate(user_id, months=[month_of(transaction.created_at)])
+
         return error_response(204)
     except Exception as e:
         # Logs the exception that has been raised and rolls back all the changes made
@@ -1,17 +1,19 @@
-from flask import jsonify, request, url_for, g, abort, current_app
-from app import db
+from flask import request, url_for, g, abort, current_app
+from app.serialization import jsonify
+from app import db, verification
 from app.api import bp
 from app.models import User
-from app.api.auth import verify_request
+from app.api.auth import verify_request, forget_identity, create_tokens, current_identity
+from app.routing import read_replica
 from app.api.errors import error_response
+from app.verification import VerificationUnavailable, VerificationTimeout, VerificationRejected, VerificationFailed
 from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt_identity, jwt_required, get_jwt_claims, jwt_refresh_token_required
 from sqlalchemy import and_
 
 import json
+import sys
 import time
 
-from twilio.rest import Client
-
 
 @bp.route('/users/exists', methods=['POST'])
 def check_user_exists():
@@ -20,7 +22,7 @@ def check_user_exists():
         # Checks whether the 'phoneNumber' parameter has been included and is not empty
         request_data = json.loads(request.data)
         if 'phoneNumber' not in request_data or 'countryCode' not in request_data:
-            current_app.logger.error('request body not formatted correctly, body is missing required parameters: {0}'.format(request_data))
+            current_app.logger.error('request body not formatted correctly, body is missing required parameters: %s', request_data)
             return error_response(400)
 
         # Builds the initial response object and
@@ -29,7 +31,7 @@ def check_user_exists():
             'exists': False
         }
         full_phone_number = '+' + request_data['countryCode'] + request_data['phoneNumber']
-        current_app.logger.info('Checking if user with phone number {0} exists'.format(full_phone_number))
+        current_app.logger.info('Checking if user with phone number %s exists', full_phone_number)
 
         # Makes a call against the database to find a user based on the phone number filter and
         # Sets the response object field 'exists' to True if a user is found
@@ -39,7 +41,7 @@ def check_user_exists():
 
         # Logs whether a user has been found and
         # Returns the response
-        current_app.logger.info('Found {0} user(s) with phone number {1}'.format(user_by_phone.count(), full_phone_number))
+        current_app.logger.info('Found %s user(s) with phone number %s', int(exist_response['exists']), full_phone_number)
         return jsonify(exist_response), 200
     except Exception as e:
         # Logs the response and
@@ -50,22 +52,20 @@ def check_user_exists():
 
 @bp.route('/users', methods=['GET', 'POST', 'PUT'])
 @verify_request
+@read_replica
 def create_user():
     # Checks the method being passed through to the API
     if request.method == 'GET':
         try:
-            # Gets the full_phone_number from the request
-            full_phone_number = get_jwt_identity()
-
-            # Makes the query to get the user
-            user = User.query.filter(User.full_phone_number == full_phone_number).first()
+            # Makes the query to get the user by the id resolved from the JWT
+            user = User.query.get(g.user_id)
 
             # Returns the user details
             return jsonify(user.to_dict()), 200
         except Exception as e:
             # Logs the response and
             # Returns a 500 response (Internal Server Error)
-            current_app.logger.fatal('Error on line {0} {1}'.format(sys.exc_info()[-1].tb_lineno, str(e)))
+            current_app.logger.fatal('Error on line %s %s', sys.exc_info()[-1].tb_lineno, str(e))
             return error_response(500)
     elif request.method == 'POST':
         try:
@@ -77,13 +77,13 @@ def create_user():
                 'password' not in request_data or
                 'phoneNumber' not in request_data or
                 'countryCode' not in request_data):
-                current_app.logger.error('request body not formatted correctly, body is missing required parameters: {0}'.format(request_data))
+                current_app.logger.error('request body not formatted correctly, body is missing required parameters: %s', request_data)
                 return error_response(400)
 
             # Checks if the JWT identity is the same as the one being created
             identity = get_jwt_identity()
             if identity != '+' + request_data['countryCode'] + request_data['phoneNumber']:
-                current_app.logger.error('identity {0} doesnt match phone number +{1}{2}'.format(identity, request_data['countryCode'], request_data['phoneNumber']))
+                current_app.logger.error('identity %s doesnt match phone number +%s%s', identity, request_data['countryCode'], request_data['phoneNumber'])
                 return error_response(400)
 
             # Creates a User object and creates the user from the request body json
@@ -93,11 +93,14 @@ def create_user():
             # Logs that the user is being added to the database and then adds to the database
             # We will commit later once everything has been processed correctly
             db.session.add(user)
-            current_app.logger.info('added user {0} {1} to the database session'.format(user.first_name, user.last_name))
+            current_app.logger.info('added user %s %s to the database session', user.first_name, user.last_name)
 
             # Commits the user to the database and logs that is has been commited
             db.session.commit()
-            current_app.logger.info('commited user {0} {1} to the database session'.format(user.first_name, user.last_name))
+            current_app.logger.info('commited user %s %s to the database session', user.first_name, user.last_name)
+
+            # Lets the phone number log in if it was remembered as unknown
+            forget_identity(user.full_phone_number)
 
             # Returns the response with status code 201 to indicate the user has been created
             return error_response(201)
@@ -116,41 +119,36 @@ def create_user():
                 'lastName' not in request_data or
                 'countryCode' not in request_data or
                 'phoneNumber' not in request_data):
-                current_app.logger.error('request data not formatted correctly, missing required parameters: {0}'.format(request_data))
+                current_app.logger.error('request data not formatted correctly, missing required parameters: %s', request_data)
                 return error_response(400)
 
-            # Gets the full_phone_number from the request
-            full_phone_number = get_jwt_identity()
-
             # Loads the user from the identity in the JWT
             # and queries the database
-            user = User.query.filter(User.full_phone_number == full_phone_number).first()
+            user = User.query.get(g.user_id) if g.user_id is not None else None
 
             # checks if the row exists
             if not user:
                 return error_response(403)
 
             # updates all fields in the transaction
+            # keeping the old phone number to invalidate the identity cache
+            previous_phone_number = user.full_phone_number
             user.from_dict(request_data)
 
             # Adds the transaction to the session
             db.session.add(user)
-            current_app.logger.info('added user {0} {1} to the database session'.format(user.first_name, user.last_name))
-
-            # Generates the access token
-            access_token = create_access_token(identity='+'+user.country_calling_code+user.phone_number)
-            refresh_token = create_refresh_token(identity='+'+user.country_calling_code+user.phone_number)
+            current_app.logger.info('added user %s %s to the database session', user.first_name, user.last_name)
 
             # Commits the user to the database and logs that is has been commited
             db.session.commit()
             current_app.logger.info('commited transactions to the database session')
 
-            # Returns the access token
-            return jsonify({
-                'token': access_token,
-                'expires_at': int(time.time()) + current_app.config['JWT_ACCESS_TOKEN_EXPIRES'] - 1,
-                'refresh_token': refresh_token
-            }), 200
+            # Drops the cached identities now that the phone number may have changed
+            forget_identity(previous_phone_number, user.full_phone_number)
+
+            # Generates and returns the access token
+            # This rotates the claims so they carry the updated profile
+            return jsonify(create_tokens(user)), 200
         except Exception as e:
             # Logs the exception that has been raised and rolls back all the changes made
             current_app.logger.fatal(str(e))
@@ -167,19 +165,40 @@ def send_verification():
         # Validates that the correct fields are included
         request_data = json.loads(request.data)
         if 'countryCode' not in request_data or 'phoneNumber' not in request_data:
-            current_app.logger.error('request body not formatted correctly, body is missing required parameters: {0}'.format(request_data))
+            current_app.logger.error('request body not formatted correctly, body is missing required parameters: %s', request_data)
             return error_response(400)
 
-        # Creates and sends the verification code to the user at the specified channel and address
-        verification = __create_verification('sms', request_data['countryCode'], request_data['phoneNumber'])
+        # Sends the verification code to the user at the specified channel and address
+        # The provider is called on the bounded pool, waiting at most VERIFICATION_TIMEOUT seconds
+        sent_verification = verification.send(request_data['countryCode'], request_data['phoneNumber'], channel='sms')
 
         # Checks the status of the verification being sent. We look for a status of 'pending'.
-        # If the status is anything else, we throw an exception
-        if verification.status == 'pending':
-            current_app.logger.info('sent verification with status {0} to {1}'.format(verification.status, verification.to))
+        # If the status is anything else, the provider did not send the code
+        if sent_verification.status == 'pending':
+            current_app.logger.info('sent verification with status %s to %s', sent_verification.status, sent_verification.to)
             return error_response(204)
         else:
-            raise Exception('could not create verification, status is {0}'.format(verification.status))
+            current_app.logger.error('could not create verification, status is %s', sent_verification.status)
+            return error_response(502)
+    except VerificationUnavailable as e:
+        # Sheds the request when too many verifications are waiting on the provider
+        current_app.logger.error(str(e))
+        return error_response(503)
+    except VerificationRejected as e:
+        # Logs that the provider refused the phone number and
+        # Returns a 400 response (Bad Request)
+        current_app.logger.error(str(e))
+        return error_response(400)
+    except VerificationFailed as e:
+        # Logs that the provider failed and
+        # Returns a 502 response (Bad Gateway)
+        current_app.logger.error(str(e))
+        return error_response(502)
+    except VerificationTimeout as e:
+        # Logs that the provider is too slow and
+        # Returns a 504 response (Gateway Timeout)
+        current_app.logger.error(str(e))
+        return error_response(504)
     except Exception as e:
         # Logs the exception when it happens and
         # Returns a 500 response (Internal Server Error)
@@ -194,31 +213,44 @@ def check_verification():
         # Validates that the correct fields are included
         request_data = json.loads(request.data)
         if 'phoneNumber' not in request_data or 'code' not in request_data or 'countryCode' not in request_data:
-            current_app.logger.error('request body not formatted correctly, body is missing required parameters: {0}'.format(request_data))
+            current_app.logger.error('request body not formatted correctly, body is missing required parameters: %s', request_data)
             return error_response(400)
 
         # Checks the verification code for the user at the specified address and code
-        verification_check = __check_verification_status(request_data['countryCode'], request_data['phoneNumber'], request_data['code'])
+        verification_check = verification.check(request_data['countryCode'], request_data['phoneNumber'], request_data['code'])
 
         # Checks the verification status received. We look for a status of 'approved'.
         # Once approved, we update the users profile in the database
         # If the status is anything else, we throw an exception
         if verification_check.status == 'approved':
-            current_app.logger.info('verified user with phone number {0} and status {1}'.format(verification_check.to, verification_check.status))
+            current_app.logger.info('verified user with phone number %s and status %s', verification_check.to, verification_check.status)
 
             # Creates the access token and the refresh token with identity equal to the key in the database
-            access_token = create_access_token(identity=verification_check.to)
-            refresh_token = create_refresh_token(identity=verification_check.to)
-
-            # Returns the response with status code 201 to indicate the user has been created
-            return jsonify({
-                'token': access_token,
-                'expires_at': int(time.time()) + current_app.config['JWT_ACCESS_TOKEN_EXPIRES'] - 1,
-                'refresh_token': refresh_token
-            }), 200
+            # If the user already exists, their claims are embedded in the tokens
+            user = User.query.filter(User.full_phone_number == verification_check.to).first()
+            return jsonify(create_tokens(user or verification_check.to)), 200
         else:
-            current_app.logger.error('phone number {0} was not verified, received status: {1}'.format(verification_check.to, verification_check.status))
+            current_app.logger.error('phone number %s was not verified, received status: %s', verification_check.to, verification_check.status)
             return error_response(400)
+    except VerificationUnavailable as e:
+        # Sheds the request when too many verifications are waiting on the provider
+        current_app.logger.error(str(e))
+        return error_response(503)
+    except VerificationRejected as e:
+        # Logs that the provider refused the check, like for an expired code, and
+        # Returns a 400 response (Bad Request)
+        current_app.logger.error(str(e))
+        return error_response(400)
+    except VerificationFailed as e:
+        # Logs that the provider failed and
+        # Returns a 502 response (Bad Gateway)
+        current_app.logger.error(str(e))
+        return error_response(502)
+    except VerificationTimeout as e:
+        # Logs that the provider is too slow and
+        # Returns a 504 response (Gateway Timeout)
+        current_app.logger.error(str(e))
+        return error_response(504)
     except Exception as e:
         # Logs the exception when it happens and
         # Returns a 500 response (Internal Server Error)
@@ -236,27 +268,27 @@ def reset_password():
         if ('newPassword' not in request_data or
             'phoneNumber' not in request_data or
             'countryCode' not in request_data):
-            current_app.logger.error('request body not formatted correctly, body is missing required parameters: {0}'.format(request_data))
+            current_app.logger.error('request body not formatted correctly, body is missing required parameters: %s', request_data)
             return error_response(400)
 
         # Checks if the JWT identity is the same as the one being created
         identity = get_jwt_identity()
         if identity != '+' + request_data['countryCode'] + request_data['phoneNumber']:
-            current_app.logger.error('identity {0} doesnt match phone number {1}'.format(identity, request_data['phoneNumber']))
+            current_app.logger.error('identity %s doesnt match phone number %s', identity, request_data['phoneNumber'])
             return error_response(400)
 
         # Resets the password
-        user = User.query.filter(User.full_phone_number == identity).first()
+        user = User.query.get(g.user_id)
         user.reset_password(newPassword=request_data['newPassword'])
 
         # Logs that the user is being added to the database and then adds to the database
         # We will commit later once everything has been processed correctly
         db.session.add(user)
-        current_app.logger.info('added for phone number {0}'.format(identity))
+        current_app.logger.info('added for phone number %s', identity)
 
         # Commits the user to the database and logs that is has been commited
         db.session.commit()
-        current_app.logger.info('commited for phone number {0}'.format(identity))
+        current_app.logger.info('commited for phone number %s', identity)
 
         # Returns status code 200
         return error_response(200)
@@ -272,54 +304,11 @@ def reset_password():
 @jwt_refresh_token_required
 def refresh():
     try:
-        # Gets the identity of the token
-        identity = get_jwt_identity()
-
-        # Creates the access token and the refresh token with identity equal to the key in the database
-        access_token = create_access_token(identity=identity)
-        refresh_token = create_refresh_token(identity=identity)
-
-        # Returns the response with status code 201 to indicate the user has been created
-        return jsonify({
-            'token': access_token,
-            'expires_at': int(time.time()) + current_app.config['JWT_ACCESS_TOKEN_EXPIRES'] - 1,
-            'refresh_token': refresh_token
-        }), 200
+        # Creates the access token and the refresh token
+        # carrying the claims of the refresh token over
+        return jsonify(create_tokens(current_identity())), 200
     except Exception as e:
         # Logs the exception when it happens and
         # Returns a 500 response (Internal Server Error)
         current_app.logger.fatal(str(e))
         return error_response(500)
-
-
-def __create_verification(channel, country_calling_code, phone_number):
-    # Gets the twilio client
-    client = __get_client()
-
-    # Constructs the phone number
-    full_phone_number = "+" + str(country_calling_code) + str(phone_number)
-
-    # Sends the verification code to the address specified in the function. To find out what this returns,
-    # Go to https://www.twilio.com/docs/verify/api/verification#verification-response-properties to get more information on the object
-    verification = client.verify.services(current_app.config['TWILIO_SERVICE_ID']).verifications.create(to=full_phone_number, channel=channel)
-
-    # Returns the verification object
-    return verification
-
-def __check_verification_status(country_calling_code, phone_number, code):
-    # Gets the twilio client
-    client = __get_client()
-
-    # Constructs the phone number
-    full_phone_number = "+" + str(country_calling_code) + str(phone_number)
-
-    # Checks the verification code for the address specified in the function. To find out what this returns,
-    # Go to https://www.twilio.com/docs/verify/api/verification-check#check-a-verification to get more information on the object
-    verification_check = client.verify.services(current_app.config['TWILIO_SERVICE_ID']).verification_checks.create(to=full_phone_number, code=code)
-
-    # Returns the verification check object
-    return verification_check
-
-def __get_client():
-    # Creates and returns a client based on the twilio config details
-    return Client(current_app.config['TWILIO_ACCOUNT_SID'], current_app.config['TWILIO_AUTH_TOKEN'])
@@ -0,0 +1,45 @@
+from app import db, rollups
+from app.seed import seed as generate
+
+import click
+
+
+def register(app):
+    @app.cli.group()
+    def rollup():
+        """Monthly category rollup commands."""
+        pass
+
+    @rollup.command()
+    @click.option('--user-id', type=int, default=None, help='Only check the rollups for this user.')
+    def check(user_id):
+        """Compare the stored rollups with the transaction tables."""
+        mismatches = rollups.check(user_id)
+        for (row_user_id, month, category), (stored, expected) in sorted(mismatches.items(), key=lambda item: (item[0][0], item[0][1], item[0][2] or '')):
+            click.echo('user {0} {1} {2}: stored {3} expected {4}'.format(row_user_id, month.strftime('%Y-%m'), category, stored, expected))
+        if mismatches:
+            raise click.ClickException('{0} rollup(s) are out of date, run "flask rollup rebuild" to fix them'.format(len(mismatches)))
+        click.echo('rollups are consistent')
+
+    @rollup.command()
+    @click.option('--user-id', type=int, default=None, help='Only rebuild the rollups for this user.')
+    def rebuild(user_id):
+        """Rebuild the rollups from the transaction tables."""
+        count = rollups.rebuild(user_id)
+        db.session.commit()
+        click.echo('rebuilt {0} rollup(s)'.format(count))
+
+    @app.cli.command()
+    @click.option('--users', type=int, default=1000, show_default=True, help='Users to create.')
+    @click.option('--transactions', type=int, default=100000, show_default=True, help='Transactions to spread over the users.')
+    @click.option('--recurring', type=int, default=3, show_default=True, help='Recurring transactions per user.')
+    @click.option('--settings', type=int, default=2, show_default=True, help='Settings entries per user.')
+    @click.option('--months', type=int, default=24, show_default=True, help='Months of history, ending with the current one.')
+    @click.option('--password', default='password', show_default=True, help='Password of every seeded user.')
+    @click.option('--chunk-size', type=int, default=10000, show_default=True, help='Rows per insert.')
+    @click.option('--random-seed', type=int, default=42, show_default=True, help='Seed of the generator, for repeatable data.')
+    def seed(users, transactions, recurring, settings, months, password, chunk_size, random_seed):
+        """Generate fake users, transactions and settings for load tests."""
+        counts = generate(users=users, transactions=transactions, recurring=recurring, settings=settings, months=months, password=password, chunk_size=chunk_size, random_seed=random_seed)
+        db.session.commit()
+        click.echo(', '.join('{0} {1}'.format(count, name.replace('_', ' ')) for name, count in counts.items()))
@@ -0,0 +1,146 @@
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from concurrent.futures import ThreadPoolExecutor
+
+import base64
+import bcrypt
+import hashlib
+import os
+import threading
+
+
+# The work factor used when PASSWORD_HASH_ROUNDS is not set, the PBKDF2
+# iterations match Werkzeug 1.0's default so existing hashes stay as they are
+DEFAULT_ROUNDS = {
+    'pbkdf2': 150000,
+    'bcrypt': 12
+}
+
+
+# bcrypt only reads the first 72 bytes of a password, and bcrypt 5 raises a
+# ValueError on longer ones
+BCRYPT_MAX_BYTES = 72
+
+def bcrypt_secret(password):
+    '''
+    Encodes a password for bcrypt. Passwords over BCRYPT_MAX_BYTES are hashed
+    with SHA-256 first and base64 encoded, which fits in 44 bytes without any
+    NUL byte. Shorter ones are used as they are, so the bcrypt hashes already
+    stored stay valid
+    '''
+
+    encoded = password.encode('utf-8')
+    if len(encoded) > BCRYPT_MAX_BYTES:
+        return base64.b64encode(hashlib.sha256(encoded).digest())
+    return encoded
+
+
+class PasswordHasherBusy(Exception):
+    # Raised when too many hashes are waiting for a thread, so the request can be shed with a 503
+    pass
+
+
+class PasswordPolicy(object):
+    '''
+    Hashes and verifies passwords with a method and work factor
+
+    PBKDF2 hashes are stored in Werkzeug's 'pbkdf2:sha256:<iterations>$salt$hash'
+    format and bcrypt hashes in the usual '$2b$<rounds>$...' one, so the method
+    and work factor of a stored hash can be read back from it
+    '''
+
+    def __init__(self, method, rounds=None):
+        if method not in DEFAULT_ROUNDS:
+            raise ValueError('unknown password hash method {0}'.format(method))
+        self.method = method
+        self.rounds = int(rounds or DEFAULT_ROUNDS[method])
+
+    def hash(self, password):
+        if self.method == 'bcrypt':
+            return bcrypt.hashpw(bcrypt_secret(password), bcrypt.gensalt(self.rounds)).decode('ascii')
+        return generate_password_hash(password, method='pbkdf2:sha256:{0}'.format(self.rounds))
+
+    def verify(self, stored, password):
+        if not stored:
+            return False
+        if stored.startswith('$2'):
+            return bcrypt.checkpw(bcrypt_secret(password), stored.encode('ascii'))
+        return check_password_hash(stored, password)
+
+    def parameters(self, stored):
+        # Reads the (method, rounds) a hash was made with, or None if it can not be read
+        try:
+            if stored.startswith('$2'):
+                return 'bcrypt', int(stored.split('$')[2])
+            if stored.startswith('pbkdf2:'):
+                return 'pbkdf2', int(stored.split('$', 1)[0].split(':')[2])
+        except (IndexError, ValueError):
+            pass
+        return None
+
+    def needs_rehash(self, stored):
+        return self.parameters(stored) != (self.method, self.rounds)
+
+    def check(self, stored, password):
+        '''
+        Verifies the password and, when it is right but the hash was made with
+        other parameters than the configured ones, hashes it again. Returns
+        (valid, new hash or None)
+        '''
+
+        if not self.verify(stored, password):
+            return False, None
+        if self.needs_rehash(stored):
+            return True, self.hash(password)
+        return True, None
+
+
+class PasswordHasher(object):
+    '''
+    Runs the password hashing on a bounded pool of threads
+
+    PBKDF2 and bcrypt both release the GIL while hashing, so the pool uses the
+    cores while the request threads only wait. At most PASSWORD_HASH_WORKERS
+    hashes run at once and PASSWORD_HASH_QUEUE_SIZE more can wait for a
+    thread. Past that, logins are refused straight away instead of letting a
+    burst of them starve every other endpoint of CPU
+    '''
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2')
+        app.config.setdefault('PASSWORD_HASH_ROUNDS', None)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+        app.config.setdefault('PASSWORD_HASH_QUEUE_SIZE', 64)
+
+        workers = app.config['PASSWORD_HASH_WORKERS']
+        app.extensions['password_hasher'] = {
+            'policy': PasswordPolicy(app.config['PASSWORD_HASH_METHOD'], app.config['PASSWORD_HASH_ROUNDS']),
+            'executor': ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hasher'),
+            'slots': threading.BoundedSemaphore(workers + app.config['PASSWORD_HASH_QUEUE_SIZE'])
+        }
+
+    @property
+    def policy(self):
+        return current_app.extensions['password_hasher']['policy']
+
+    def __run(self, method, *args):
+        # Runs the policy's method on the pool and waits for it
+        state = current_app.extensions['password_hasher']
+        if not state['slots'].acquire(blocking=False):
+            raise PasswordHasherBusy('password hashing queue is full')
+        try:
+            return state['executor'].submit(getattr(state['policy'], method), *args).result()
+        finally:
+            state['slots'].release()
+
+    def hash(self, password):
+        return self.__run('hash', password)
+
+    def check(self, stored, password):
+        # Returns (valid, new hash or None), see PasswordPolicy.check
+        return self.__run('check', stored, password)
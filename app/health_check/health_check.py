@@ -1,9 +1,106 @@
-from flask import jsonify, request
+from flask import request, current_app
+from app.serialization import jsonify
+from app import db
 from app.health_check import bp
 
+from collections import deque
+from datetime import datetime
+
+import threading
+import time
+
+
+@bp.record_once
+def configure_readiness(state):
+    # Keeps the last readiness result and the latencies of the last checks per app
+    state.app.extensions['health_check'] = {
+        'lock': threading.Lock(),
+        'latencies': deque(maxlen=state.app.config['HEALTH_CHECK_HISTORY']),
+        'result': None,
+        'checked_at': 0
+    }
+
 
 @bp.route('/', methods=['GET'])
 def health_check():
     return jsonify({
         'message': 'success'
     })
+
+@bp.route('/health/live', methods=['GET'])
+def liveness():
+    # Only says that the process can serve requests, it does not touch any dependency
+    return jsonify({'status': 'alive'}), 200
+
+@bp.route('/health/ready', methods=['GET'])
+def readiness():
+    '''
+    Says whether the instance can take traffic, which needs the database to
+    answer and the connection pool to have a connection to spare
+
+    The result is cached for HEALTH_CHECK_CACHE_TTL seconds, and probes that
+    arrive while a check runs wait for it instead of running their own, so
+    however often the load balancers probe, the database is pinged at most
+    once per time to live
+    '''
+
+    state = current_app.extensions['health_check']
+    with state['lock']:
+        cached = time.monotonic() - state['checked_at'] < current_app.config['HEALTH_CHECK_CACHE_TTL']
+        if not cached or state['result'] is None:
+            state['result'] = __check(state['latencies'])
+            state['checked_at'] = time.monotonic()
+        response, status_code = state['result']
+
+    return jsonify(dict(response, cached=cached)), status_code
+
+def __check(latencies):
+    # Reads the pool first, since pinging an exhausted pool would wait for its timeout
+    pool = __get_pool_status()
+    database = {'ok': False}
+
+    if pool.get('exhausted'):
+        database['error'] = 'connection pool exhausted'
+    else:
+        # Pings the database and keeps the latency
+        start = time.perf_counter()
+        try:
+            with db.engine.connect() as connection:
+                connection.execute('SELECT 1')
+            database['ok'] = True
+        except Exception as e:
+            # The probe is public, so the driver's message, which can name the host, user
+            # and database, only goes to the logs
+            current_app.logger.error('readiness check failed: %s', e)
+            database['error'] = 'unavailable'
+        database['latencyMs'] = round((time.perf_counter() - start) * 1000, 3)
+        latencies.append(database['latencyMs'])
+
+    ready = database['ok']
+    response = {
+        'status': 'ready' if ready else 'unavailable',
+        'checkedAt': datetime.utcnow().isoformat() + 'Z',
+        'database': database,
+        'pool': pool,
+        'latenciesMs': list(latencies)
+    }
+    return response, 200 if ready else 503
+
+def __get_pool_status():
+    # Only queue pools keep counts, SQLite's pools do not
+    pool = db.engine.pool
+    if not hasattr(pool, 'checkedout'):
+        return {'type': type(pool).__name__}
+
+    size = pool.size()
+    max_overflow = pool._max_overflow
+    checked_out = pool.checkedout()
+    return {
+        'type': type(pool).__name__,
+        'size': size,
+        'maxOverflow': max_overflow,
+        'checkedOut': checked_out,
+        'checkedIn': pool.checkedin(),
+        'overflow': pool.overflow(),
+        'exhausted': max_overflow >= 0 and checked_out >= size + max_overflow
+    }
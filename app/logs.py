@@ -0,0 +1,157 @@
+from flask import g, request, current_app, has_request_context
+from flask.logging import default_handler
+
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, SMTPHandler
+
+import atexit
+import copy
+import datetime
+import json
+import logging
+import os
+import queue
+import random
+import time
+import uuid
+
+
+# Keys whose values are never written to the logs, matched case insensitively
+REDACTED_KEYS = ('password', 'newpassword', 'code', 'token', 'refresh_token', 'authorization')
+
+
+def redact(value):
+    # Replaces the values of the sensitive keys of dictionaries, recursing into lists and dictionaries
+    if isinstance(value, dict):
+        return {key: '[redacted]' if str(key).lower() in REDACTED_KEYS else redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+
+class RequestQueueHandler(QueueHandler):
+    '''
+    Puts the records on the queue for the listener thread to format and write
+
+    Only the request id is resolved on the request thread, since the listener
+    runs outside the request context. The message itself is left unformatted,
+    so the arguments are merged into it on the listener thread
+    '''
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.request_id = g.get('request_id') if has_request_context() else None
+        return record
+
+class JSONFormatter(logging.Formatter):
+    # Formats a record as a single line of JSON, with dictionary arguments redacted
+    def format(self, record):
+        if isinstance(record.args, dict):
+            record.args = redact(record.args)
+        elif record.args:
+            record.args = tuple(redact(arg) for arg in record.args)
+
+        entry = {
+            'time': datetime.datetime.utcfromtimestamp(record.created).isoformat() + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'location': '{0}:{1}'.format(record.pathname, record.lineno)
+        }
+        # Adds the fields of the request summary
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def init_logging(app):
+    '''
+    Sets up the request ids and the request summary lines, and in production
+    sends the app's logs through a queue to a listener thread that formats
+    them as JSON and writes them out, so requests never wait on log I/O
+    '''
+
+    app.config.setdefault('LOG_TO_STDOUT', False)
+    app.config.setdefault('LOG_FILE', 'logs/centsable.log')
+    app.config.setdefault('LOG_MAX_BYTES', 10 * 1024 * 1024)
+    app.config.setdefault('LOG_BACKUP_COUNT', 10)
+    app.config.setdefault('LOG_BODY_SAMPLE_RATE', 0.0)
+
+    app.before_request(__start_request)
+    app.after_request(__log_request)
+
+    # Only sets up the handlers in production, when debugging and testing are off
+    if app.debug or app.testing:
+        return
+
+    formatter = JSONFormatter()
+    handlers = []
+
+    # Checks if we set up a mail server
+    # If so, we create a handler that sends emails whenever there is an error
+    if app.config.get('MAIL_SERVER'):
+        auth = None
+        if app.config.get('MAIL_USERNAME') or app.config.get('MAIL_PASSWORD'):
+            auth = (app.config.get('MAIL_USERNAME'), app.config.get('MAIL_PASSWORD'))
+        secure = () if app.config.get('MAIL_USE_TLS') else None
+        mail_handler = SMTPHandler(
+            mailhost=(app.config['MAIL_SERVER'], app.config.get('MAIL_PORT') or 25),
+            fromaddr='no-reply@' + app.config['MAIL_SERVER'],
+            toaddrs=app.config.get('ADMINS') or [], subject='Centsable Failure',
+            credentials=auth, secure=secure)
+        mail_handler.setLevel(logging.ERROR)
+        handlers.append(mail_handler)
+
+    # Logs to the console, or to a rotating file
+    if app.config['LOG_TO_STDOUT']:
+        handler = logging.StreamHandler()
+    else:
+        directory = os.path.dirname(app.config['LOG_FILE'])
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        handler = RotatingFileHandler(app.config['LOG_FILE'], maxBytes=app.config['LOG_MAX_BYTES'], backupCount=app.config['LOG_BACKUP_COUNT'])
+    handler.setFormatter(formatter)
+    handler.setLevel(logging.INFO)
+    handlers.append(handler)
+
+    # Sends the records through a queue to the listener thread
+    log_queue = queue.Queue(-1)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    # Flask's default handler would write to stderr on the request thread
+    app.logger.removeHandler(default_handler)
+    app.logger.addHandler(RequestQueueHandler(log_queue))
+    app.logger.setLevel(logging.INFO)
+    app.logger.info('Centsable startup')
+
+def __start_request():
+    # Reuses the request id of the proxy in front of us if it sent one
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    g.request_started_at = time.perf_counter()
+
+def __log_request(response):
+    '''
+    Logs one summary line per request and returns the request id. The bodies
+    are only logged for a LOG_BODY_SAMPLE_RATE share of the requests, redacted
+    '''
+
+    response.headers['X-Request-ID'] = g.get('request_id', '')
+    if not current_app.logger.isEnabledFor(logging.INFO):
+        return response
+
+    fields = {
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'duration_ms': round((time.perf_counter() - g.get('request_started_at', time.perf_counter())) * 1000, 3),
+        'remote_addr': request.remote_addr
+    }
+    if current_app.config['LOG_BODY_SAMPLE_RATE'] and random.random() < current_app.config['LOG_BODY_SAMPLE_RATE']:
+        body = request.get_json(silent=True)
+        fields['body'] = redact(body) if body is not None else '<{0} bytes>'.format(request.content_length or 0)
+
+    current_app.logger.info('%s %s %s', request.method, request.path, response.status_code, extra={'fields': fields})
+    return response
@@ -0,0 +1,10 @@
+from flask import Blueprint
+from app.metrics.registry import MetricsRegistry
+
+bp = Blueprint('metrics', __name__)
+
+# The metrics of this process. With several workers, each one has its own and
+# Prometheus scrapes them one at a time
+registry = MetricsRegistry()
+
+from app.metrics import metrics, instrumentation
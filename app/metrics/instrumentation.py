@@ -0,0 +1,59 @@
+from flask import g, request, current_app, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.metrics import registry
+
+import re
+import time
+
+
+# Listens on the Engine class, so every engine (including the binds) is
+# covered. Queries are only recorded while a request that started recording
+# them is being handled
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def __before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and g.get('queries') is not None:
+        conn.info.setdefault('query_started_at', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def __after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = conn.info.get('query_started_at')
+    if started_at and has_request_context() and g.get('queries') is not None:
+        g.queries.append((statement, time.perf_counter() - started_at.pop()))
+
+
+def instrument(blueprint):
+    '''
+    Records the latency, database queries and response size of every request
+    to the blueprint
+
+    With METRICS_QUERY_HEADER on (it is in debug mode), responses also carry
+    the number of queries they ran in X-Query-Count and the queries themselves
+    in X-Queries, so an N+1 shows up on the first request
+    '''
+
+    blueprint.before_request(__start_recording)
+    blueprint.after_request(__record_request)
+
+def __start_recording():
+    g.queries = []
+    g.metrics_started_at = time.perf_counter()
+
+def __record_request(response):
+    queries = g.get('queries') or []
+    query_time = sum(duration for statement, duration in queries)
+
+    # Labels by route rather than path, so ids do not end up in the labels
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    response_size = None if response.is_streamed else response.calculate_content_length()
+    duration = time.perf_counter() - g.get('metrics_started_at', time.perf_counter())
+    registry.observe_request(endpoint, request.method, response.status_code, duration, len(queries), query_time, response_size)
+
+    if current_app.config.get('METRICS_QUERY_HEADER') or current_app.debug:
+        response.headers['X-Query-Count'] = str(len(queries))
+        response.headers['X-Query-Time'] = '{0:.3f}ms'.format(query_time * 1000)
+        response.headers['X-Queries'] = ' ; '.join(re.sub(r'\s+', ' ', statement).strip() for statement, duration in queries)
+
+    return response
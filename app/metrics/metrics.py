@@ -0,0 +1,23 @@
+from flask import current_app, request
+from app.api.errors import error_response
+from app.metrics import bp, registry
+
+import hmac
+
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    '''
+    Serves the metrics of this process in the Prometheus text format
+
+    The app is public, so the metrics are only served to scrapers sending
+    METRICS_TOKEN as a bearer token, and not at all when it is not set
+    '''
+
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        return error_response(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'), ('Bearer ' + token).encode('utf-8')):
+        return error_response(401)
+
+    return current_app.response_class(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,103 @@
+import threading
+
+
+# The upper bounds of the histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+
+class Counter(object):
+    def __init__(self, name, description, label_names):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.series = {}
+
+    def inc(self, labels, value=1):
+        self.series[labels] = self.series.get(labels, 0) + value
+
+    def render(self):
+        lines = ['# HELP {0} {1}'.format(self.name, self.description), '# TYPE {0} counter'.format(self.name)]
+        for labels, value in sorted(self.series.items()):
+            lines.append('{0}{{{1}}} {2}'.format(self.name, _format_labels(self.label_names, labels), _format_value(value)))
+        return lines
+
+class Histogram(object):
+    '''
+    A Prometheus histogram, keeping a count per bucket along with the sum and
+    count of the observations for every set of labels
+    '''
+
+    def __init__(self, name, description, label_names, buckets):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, labels, value):
+        # The bucket counts are kept cumulative, like Prometheus expects them
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * len(self.buckets) + [0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = ['# HELP {0} {1}'.format(self.name, self.description), '# TYPE {0} histogram'.format(self.name)]
+        for labels, series in sorted(self.series.items()):
+            for bound, count in zip(self.buckets + ('+Inf',), series[:len(self.buckets)] + [series[-1]]):
+                bucket_labels = _format_labels(self.label_names + ('le',), labels + (bound if bound == '+Inf' else _format_value(bound),))
+                lines.append('{0}_bucket{{{1}}} {2}'.format(self.name, bucket_labels, count))
+            formatted = _format_labels(self.label_names, labels)
+            lines.append('{0}_sum{{{1}}} {2}'.format(self.name, formatted, _format_value(series[-2])))
+            lines.append('{0}_count{{{1}}} {2}'.format(self.name, formatted, series[-1]))
+        return lines
+
+
+class MetricsRegistry(object):
+    '''
+    Holds the request metrics of the process and renders them in the
+    Prometheus text format
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        labels = ('endpoint', 'method')
+        with self._lock:
+            self.requests = Counter('centsable_requests_total', 'Requests handled by endpoint, method and status', labels + ('status',))
+            self.duration = Histogram('centsable_request_duration_seconds', 'Time spent handling a request', labels, DURATION_BUCKETS)
+            self.queries = Histogram('centsable_request_db_queries', 'Database queries run by a request', labels, QUERY_COUNT_BUCKETS)
+            self.query_time = Histogram('centsable_request_db_duration_seconds', 'Time a request spent waiting on database queries', labels, DURATION_BUCKETS)
+            self.response_size = Histogram('centsable_response_size_bytes', 'Size of the response bodies, streamed responses excluded', labels, SIZE_BUCKETS)
+
+    def observe_request(self, endpoint, method, status, duration, queries, query_time, response_size=None):
+        labels = (endpoint, method)
+        with self._lock:
+            self.requests.inc(labels + (str(status),))
+            self.duration.observe(labels, duration)
+            self.queries.observe(labels, queries)
+            self.query_time.observe(labels, query_time)
+            if response_size is not None:
+                self.response_size.observe(labels, response_size)
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for metric in (self.requests, self.duration, self.queries, self.query_time, self.response_size):
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(names, values):
+    return ','.join('{0}="{1}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in zip(names, values))
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -3,8 +3,8 @@ from datetime import datetime, timedelta
 import os
 import datetime
 
-from app import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from app import db, password_hasher
+from app.money import to_cents, to_amount
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -12,7 +12,7 @@ class User(db.Model):
     last_name = db.Column(db.String(32))
     country_calling_code = db.Column(db.String(8))
     phone_number = db.Column(db.String(32), index=True, unique=True)
-    full_phone_number = db.Column(db.String(32))
+    full_phone_number = db.Column(db.String(32), index=True, unique=True)
     password_hash = db.Column(db.String(128))
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     verified_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
@@ -24,10 +24,19 @@ class User(db.Model):
         return '<User: {0}>'.format(self.phone_number)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        '''
+        Checks the password, and when it is right but the stored hash was made
+        with other parameters than PASSWORD_HASH_METHOD and PASSWORD_HASH_ROUNDS,
+        replaces the hash with one made with them. The caller commits
+        '''
+
+        valid, new_hash = password_hasher.check(self.password_hash, password)
+        if new_hash is not None:
+            self.password_hash = new_hash
+        return valid
 
     def to_dict(self):
         data = {
@@ -54,20 +63,45 @@ class User(db.Model):
         self.set_password(password=newPassword)
 
 class Transaction(db.Model):
+    __table_args__ = (db.Index('ix_transaction_user_id_created_at', 'user_id', 'created_at'),)
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     name = db.Column(db.String(128))
     category = db.Column(db.String(32))
-    price = db.Column(db.Float())
+    price_cents = db.Column(db.BigInteger)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
 
+    # The price is stored in cents and read and written as an amount
+    @property
+    def price(self):
+        return to_amount(self.price_cents)
+
+    @price.setter
+    def price(self, amount):
+        self.price_cents = to_cents(amount)
+
     def to_dict(self):
+        return Transaction.row_to_dict(self)
+
+    @classmethod
+    def listing_columns(cls):
+        # The columns the listings select, to read rows rather than entities
+        return (cls.id, cls.name, cls.category, cls.price_cents, cls.created_at)
+
+    @staticmethod
+    def row_to_dict(row):
+        '''
+        Builds the response of a transaction from either the entity or a row
+        of its listing_columns
+        '''
+
         data = {
-            'id': self.id,
-            'name': self.name,
-            'category': self.category,
-            'price': self.price,
-            'createdAt': self.created_at,
+            'id': row.id,
+            'name': row.name,
+            'category': row.category,
+            'price': to_amount(row.price_cents),
+            'createdAt': row.created_at,
             'canEdit': True
         }
         return data
@@ -82,22 +116,47 @@ class Transaction(db.Model):
             self.author = author
 
 class RecurringTransaction(db.Model):
+    __table_args__ = (db.Index('ix_recurring_transaction_user_id_effective_at', 'user_id', 'effective_at'),)
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     name = db.Column(db.String(128))
     category = db.Column(db.String(32))
-    price = db.Column(db.Float())
+    price_cents = db.Column(db.BigInteger)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     effective_at = db.Column(db.DateTime, default=datetime.datetime(year=datetime.datetime.utcnow().year, month=datetime.datetime.utcnow().month, day=1))
 
+    # The price is stored in cents and read and written as an amount
+    @property
+    def price(self):
+        return to_amount(self.price_cents)
+
+    @price.setter
+    def price(self, amount):
+        self.price_cents = to_cents(amount)
+
     def to_dict(self):
+        return RecurringTransaction.row_to_dict(self)
+
+    @classmethod
+    def listing_columns(cls):
+        # The columns the listings select, to read rows rather than entities
+        return (cls.id, cls.name, cls.category, cls.price_cents, cls.created_at, cls.effective_at)
+
+    @staticmethod
+    def row_to_dict(row):
+        '''
+        Builds the response of a recurring transaction from either the entity
+        or a row of its listing_columns
+        '''
+
         data = {
-            'id': self.id,
-            'name': self.name,
-            'category': self.category,
-            'price': self.price,
-            'createdAt': self.created_at,
-            'effectiveDate': self.effective_at,
+            'id': row.id,
+            'name': row.name,
+            'category': row.category,
+            'price': to_amount(row.price_cents),
+            'createdAt': row.created_at,
+            'effectiveDate': row.effective_at,
             'canEdit': False
         }
         return data
@@ -113,14 +172,25 @@ class RecurringTransaction(db.Model):
             self.recurring_author = author
 
 class Settings(db.Model):
+    __table_args__ = (db.Index('ix_settings_user_id_effective_at', 'user_id', 'effective_at'),)
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     needs_percentage = db.Column(db.Float())
     wants_percentage = db.Column(db.Float())
     savings_percentage = db.Column(db.Float())
-    income = db.Column(db.Float())
+    income_cents = db.Column(db.BigInteger)
     effective_at = db.Column(db.DateTime, default=datetime.datetime(year=datetime.datetime.utcnow().year, month=datetime.datetime.utcnow().month, day=1))
 
+    # The income is stored in cents and read and written as an amount
+    @property
+    def income(self):
+        return to_amount(self.income_cents)
+
+    @income.setter
+    def income(self, amount):
+        self.income_cents = to_cents(amount)
+
     def to_dict(self):
         data = {
             'needsPercentage': self.needs_percentage,
@@ -139,3 +209,16 @@ class Settings(db.Model):
 
         if user:
             self.user = user
+
+class MonthlyCategoryTotal(db.Model):
+    __table_args__ = (db.Index('ix_monthly_category_total_key', 'user_id', 'month', 'category', unique=True),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    month = db.Column(db.DateTime)
+    category = db.Column(db.String(32))
+    spent_cents = db.Column(db.BigInteger, default=0)
+    recurring_cents = db.Column(db.BigInteger, default=0)
+
+    def __repr__(self):
+        return '<MonthlyCategoryTotal: {0} {1} {2}>'.format(self.user_id, self.month.strftime('%Y-%m'), self.category)
@@ -0,0 +1,38 @@
+import decimal
+
+
+# Money arithmetic shared by the models and the API
+#
+# Amounts are stored as integer cents, so sums are exact whether the database
+# or Python does them. Requests and responses keep using amounts in dollars,
+# which are only converted to and from cents at the edges
+
+CENTS = 100
+
+
+def to_cents(amount):
+    '''
+    Converts an amount to whole cents, rounding half away from zero. Raises
+    ValueError or TypeError if the amount is not a number
+
+    This is the rule for every amount the API takes. The amounts stored before
+    money moved to cents were converted by the migration with SQL's ROUND,
+    which can round a half cent float the other way
+    '''
+
+    if amount is None:
+        return None
+    if isinstance(amount, bool):
+        raise TypeError('amount must be a number')
+    try:
+        # Goes through the decimal representation, so 0.29 is 29 cents and not 28.999...
+        cents = decimal.Decimal(str(amount)) * CENTS
+        return int(cents.quantize(decimal.Decimal(1), rounding=decimal.ROUND_HALF_UP))
+    except decimal.InvalidOperation:
+        raise ValueError('{0} is not a valid amount'.format(amount))
+
+def to_amount(cents):
+    # Converts cents back to an amount, as a float of dollars
+    if cents is None:
+        return None
+    return int(cents) / CENTS
@@ -0,0 +1,40 @@
+import datetime
+
+
+# Month arithmetic shared by the API
+#
+# A month is represented by a datetime at midnight on its first day, which is
+# what the effective_at columns and the rollups store, and is written as YYYY-MM
+# in requests and responses
+
+MONTH_FORMAT = '%Y-%m'
+
+
+def parse_month(value):
+    # Parses a YYYY-MM string, raising ValueError if it is malformed
+    return datetime.datetime.strptime(value, MONTH_FORMAT)
+
+def format_month(month):
+    return month.strftime(MONTH_FORMAT)
+
+def month_of(date):
+    # Truncates a datetime to the first day of its month
+    return datetime.datetime(year=date.year, month=date.month, day=1)
+
+def add_months(month, count):
+    # Moves a month forwards (or backwards with a negative count), crossing years
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.datetime(year=index // 12, month=index % 12 + 1, day=1)
+
+def next_month(month):
+    # Gets the first day of the following month, which is the exclusive end of the month
+    return add_months(month, 1)
+
+def months_between(start, end):
+    # Counts the months from start to end, so the same month gives 0
+    return (end.year - start.year) * 12 + end.month - start.month
+
+def iter_months(start, end):
+    # Yields every month from start to end, both included
+    for count in range(months_between(start, end) + 1):
+        yield add_months(start, count)
@@ -0,0 +1,139 @@
+from flask import current_app
+from werkzeug.utils import import_string
+
+from app.cache import TTLCache
+
+from collections import deque
+
+import threading
+import time
+
+
+class RateLimitBackend(object):
+    '''
+    The interface a rate limit backend implements
+
+    hit counts an attempt against a key within a sliding window, and returns
+    (allowed, seconds until the next attempt is allowed). Attempts that are
+    refused are not counted. mark remembers a key for some seconds, which
+    marked then tells, and reset forgets both. The local backend only limits
+    within a single process, so with several workers a shared backend should
+    be plugged in by setting RATE_LIMIT_BACKEND to the import path of a
+    subclass (with Redis, a sorted set of timestamps per key trimmed with
+    ZREMRANGEBYSCORE does the same thing, and a key with an expiry a mark)
+    '''
+
+    def __init__(self, app):
+        self.app = app
+
+    def hit(self, key, limit, window):
+        raise NotImplementedError
+
+    def mark(self, key, ttl):
+        raise NotImplementedError
+
+    def marked(self, key):
+        raise NotImplementedError
+
+    def reset(self, key):
+        raise NotImplementedError
+
+class NullRateLimitBackend(RateLimitBackend):
+    # Limits nothing, every attempt is allowed and nothing is remembered
+    def hit(self, key, limit, window):
+        return True, 0
+
+    def mark(self, key, ttl):
+        pass
+
+    def marked(self, key):
+        return False
+
+    def reset(self, key):
+        pass
+
+class LocalRateLimitBackend(RateLimitBackend):
+    # Keeps the timestamps of the attempts within the window of every key in an in-process LRU
+    def __init__(self, app):
+        super(LocalRateLimitBackend, self).__init__(app)
+        self._windows = TTLCache(maxsize=app.config['RATE_LIMIT_CACHE_SIZE'])
+        self._marks = TTLCache(maxsize=app.config['RATE_LIMIT_CACHE_SIZE'])
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, window):
+        now = time.monotonic()
+        with self._lock:
+            # Drops the attempts that slid out of the window
+            attempts = self._windows.get(key) or deque()
+            while attempts and attempts[0] <= now - window:
+                attempts.popleft()
+
+            if len(attempts) >= limit:
+                return False, attempts[0] + window - now
+
+            attempts.append(now)
+            self._windows.set(key, attempts, window)
+            return True, 0
+
+    def mark(self, key, ttl):
+        self._marks.set(key, True, ttl)
+
+    def marked(self, key):
+        return key in self._marks
+
+    def reset(self, key):
+        self._windows.delete(key)
+        self._marks.delete(key)
+
+
+BACKENDS = {
+    'null': NullRateLimitBackend,
+    'local': LocalRateLimitBackend
+}
+
+
+class RateLimiter(object):
+    '''
+    Limits how often something can be attempted per key over a sliding window
+    '''
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATE_LIMIT_BACKEND', 'local')
+        app.config.setdefault('RATE_LIMIT_CACHE_SIZE', 100000)
+
+        # Loads the backend by name or by import path
+        backend = app.config['RATE_LIMIT_BACKEND']
+        backend_class = BACKENDS[backend] if backend in BACKENDS else import_string(backend)
+        app.extensions['rate_limit'] = backend_class(app)
+
+    @property
+    def backend(self):
+        return current_app.extensions['rate_limit']
+
+    def hit(self, limits, window):
+        '''
+        Counts an attempt against every (key, limit) pair, and returns how many
+        seconds to wait before retrying if any of them is over its limit, or 0
+        '''
+
+        retry_after = 0
+        for key, limit in limits:
+            allowed, wait = self.backend.hit(key, limit, window)
+            if not allowed:
+                retry_after = max(retry_after, wait)
+        return retry_after
+
+    def mark(self, key, ttl):
+        # Remembers the key for ttl seconds, in every worker sharing the backend
+        self.backend.mark(key, ttl)
+
+    def marked(self, key):
+        return self.backend.marked(key)
+
+    def reset(self, *keys):
+        for key in keys:
+            self.backend.reset(key)
@@ -0,0 +1,187 @@
+from flask import current_app, request
+from werkzeug.utils import import_string
+
+from app.cache import TTLCache
+from app.routing import reads_from_replica
+
+import hashlib
+import time
+
+
+class CacheBackend(object):
+    '''
+    The interface a response cache backend implements
+
+    The local backend only caches within a single process, so a write only
+    invalidates the worker that handled it and every other worker keeps
+    serving the old body. It is only safe with a single worker, which is why
+    the default is the null backend. With several workers a shared backend
+    (Redis, memcached, ...) is plugged in by setting RESPONSE_CACHE_BACKEND to
+    the import path of a subclass
+    '''
+
+    def __init__(self, app):
+        self.app = app
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def delete(self, *keys):
+        raise NotImplementedError
+
+class NullCacheBackend(CacheBackend):
+    # Caches nothing, every lookup is a miss
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+class LocalCacheBackend(CacheBackend):
+    # Caches in an in-process LRU
+    def __init__(self, app):
+        super(LocalCacheBackend, self).__init__(app)
+        self._cache = TTLCache(maxsize=app.config['RESPONSE_CACHE_SIZE'], ttl=app.config['RESPONSE_CACHE_TTL'])
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value, ttl):
+        self._cache.set(key, value, ttl)
+
+    def delete(self, *keys):
+        self._cache.delete(*keys)
+
+
+BACKENDS = {
+    'null': NullCacheBackend,
+    'local': LocalCacheBackend
+}
+
+
+class ResponseCache(object):
+    '''
+    Caches JSON responses by (user id, endpoint, month) along with their ETag
+
+    Writes to a single month invalidate just that month. Settings and recurring
+    transactions take effect from a month onwards with no end, so those bump a
+    per-user generation that is part of every key, which drops all of the
+    user's cached months in one write
+
+    Every write also records when it happened, and a response read from the
+    replica within REPLICA_LAG_SECONDS of the user's last write is not cached,
+    since the replica may not have the write yet
+    '''
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RESPONSE_CACHE_BACKEND', 'null')
+        app.config.setdefault('RESPONSE_CACHE_SIZE', 10000)
+        app.config.setdefault('RESPONSE_CACHE_TTL', 3600)
+
+        # Loads the backend by name or by import path
+        backend = app.config['RESPONSE_CACHE_BACKEND']
+        backend_class = BACKENDS[backend] if backend in BACKENDS else import_string(backend)
+        app.extensions['response_cache'] = backend_class(app)
+
+    @property
+    def backend(self):
+        return current_app.extensions['response_cache']
+
+    def __generation(self, user_id, renew=False):
+        '''
+        Gets the user's generation, starting a new one if there is none. The
+        generation is time based, so if it is ever evicted the new one cannot
+        match any of the entries cached before
+        '''
+
+        key = 'generation:{0}'.format(user_id)
+        generation = None if renew else self.backend.get(key)
+        if generation is None:
+            generation = '{0:x}'.format(time.time_ns())
+            self.backend.set(key, generation, None)
+        return generation
+
+    def generation(self, user_id):
+        '''
+        Gets the user's generation, which changes whenever every cached response
+        of the user is invalidated. Other per-user caches key on it to be
+        invalidated along with the responses by a write in any worker sharing
+        the backend. Returns None with the null backend, which keeps nothing
+        '''
+
+        if isinstance(self.backend, NullCacheBackend):
+            return None
+        return self.__generation(user_id)
+
+    def __key(self, user_id, endpoint, month, generation):
+        return 'response:{0}:{1}:{2}:{3}'.format(user_id, generation, endpoint, month)
+
+    def response(self, user_id, endpoint, month, view):
+        '''
+        Returns the cached response for the user, endpoint and month, calling the
+        view to build and cache it on a miss. The view returns a (response,
+        status code) tuple like the API handlers do, and only 200s are cached
+
+        The response carries an ETag, and requests whose If-None-Match matches
+        get a 304 back. On a hit, this does not touch the database at all
+        '''
+
+        if user_id is None:
+            return view()
+
+        key = self.__key(user_id, endpoint, month, self.__generation(user_id))
+        entry = self.backend.get(key)
+
+        if entry is None:
+            # Builds the response and caches it along with its ETag
+            # The view's error paths return a bare response rather than a tuple
+            result = view()
+            response, status_code = result if isinstance(result, tuple) else (result, result.status_code)
+            if status_code != 200 or not self.__storable(user_id):
+                return response, status_code
+            body = response.get_data()
+            entry = (hashlib.sha1(body).hexdigest(), body)
+            self.backend.set(key, entry, current_app.config['RESPONSE_CACHE_TTL'])
+
+        # Builds the response, which turns into a 304 if the ETag matches
+        etag, body = entry
+        response = current_app.response_class(body, mimetype='application/json')
+        response.set_etag(etag)
+        return response.make_conditional(request)
+
+    def __storable(self, user_id):
+        # Whether the response was read from a replica that has had the time to catch up with the user's last write
+        if not reads_from_replica():
+            return True
+        written_at = self.backend.get('written:{0}'.format(user_id))
+        return written_at is None or time.time() - written_at >= current_app.config['REPLICA_LAG_SECONDS']
+
+    def invalidate(self, user_id, months=None):
+        '''
+        Invalidates the cached responses for the given months of a user. Without
+        months, every cached response of the user is invalidated
+        '''
+
+        # Records the write, which the replica reads are not cached for a while after
+        if current_app.config.get('SQLALCHEMY_REPLICA_BIND'):
+            self.backend.set('written:{0}'.format(user_id), time.time(), current_app.config['REPLICA_LAG_SECONDS'])
+
+        if months is None:
+            self.__generation(user_id, renew=True)
+            return
+
+        generation = self.__generation(user_id)
+        self.backend.delete(*[
+            self.__key(user_id, endpoint, month.strftime('%Y-%m'), generation)
+            for endpoint in ('overview', 'transactions') for month in set(months)
+        ])
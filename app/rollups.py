@@ -0,0 +1,220 @@
+from app import db
+from app.models import Transaction, RecurringTransaction, MonthlyCategoryTotal
+from app.months import month_of, iter_months
+from sqlalchemy import case, func
+from sqlalchemy.exc import IntegrityError
+
+
+# Maintains the MonthlyCategoryTotal rollups
+#
+# Every row holds, for a user, a month and a category, in cents:
+#     - spent: the sum of the transactions created in that month
+#     - recurring: the sum of the recurring transactions taking effect in that month
+#
+# A recurring transaction counts towards every month from the month it takes effect,
+# so the recurring spending for a month is the running sum of the recurring column
+# up to and including that month. Keeping it as a delta means a write only ever
+# touches a single row per category, no matter how far into the future it reaches
+
+
+def transaction_change(transaction, sign=1):
+    '''
+    Builds the rollup change for a transaction. A sign of -1 removes the
+    transaction from the rollups, which is used for updates and deletes
+    '''
+
+    return (month_of(transaction.created_at), transaction.category, sign * transaction.price_cents, 0)
+
+def recurring_change(recurring_transaction, sign=1):
+    '''
+    Builds the rollup change for a recurring transaction, which is recorded in
+    the month it takes effect
+    '''
+
+    return (month_of(recurring_transaction.effective_at), recurring_transaction.category, 0, sign * recurring_transaction.price_cents)
+
+def apply_changes(user_id, changes):
+    '''
+    Applies a list of (month, category, spent, recurring) rollup changes in
+    cents for a user to the current session
+
+    The changes are merged per (month, category) first, so a batch of transactions
+    only touches each rollup row once. The increments are done in SQL so that
+    concurrent writers do not overwrite each other. Nothing is committed here,
+    the caller commits the rollups together with the transactions
+    '''
+
+    # Merges the changes by month and category
+    totals = {}
+    for month, category, spent, recurring in changes:
+        current_spent, current_recurring = totals.get((month, category), (0, 0))
+        totals[(month, category)] = (current_spent + spent, current_recurring + recurring)
+
+    for (month, category), (spent, recurring) in totals.items():
+        # Increments the existing rollup row
+        # If there is none, we create it
+        if not __increment(user_id, month, category, spent, recurring):
+            __insert(user_id, month, category, spent, recurring)
+
+    # Flushes so that a later call in the same transaction sees the new rows
+    db.session.flush()
+
+def __increment(user_id, month, category, spent, recurring):
+    # Increments a rollup row in SQL, returning whether there was one
+    return MonthlyCategoryTotal.query.filter(MonthlyCategoryTotal.user_id == user_id, MonthlyCategoryTotal.month == month, MonthlyCategoryTotal.category == category).update({
+        MonthlyCategoryTotal.spent_cents: MonthlyCategoryTotal.spent_cents + spent,
+        MonthlyCategoryTotal.recurring_cents: MonthlyCategoryTotal.recurring_cents + recurring
+    }, synchronize_session=False)
+
+def __insert(user_id, month, category, spent, recurring):
+    '''
+    Inserts a rollup row. Two first writes for the same key (a bulk create and
+    an import, say) can both find no row to increment, so the insert runs in a
+    savepoint, and when the unique key shows the other writer created the row
+    first, only the savepoint is rolled back and the row is incremented instead
+    '''
+
+    savepoint = db.session.begin_nested()
+    try:
+        db.session.execute(MonthlyCategoryTotal.__table__.insert(), {
+            'user_id': user_id, 'month': month, 'category': category, 'spent_cents': spent, 'recurring_cents': recurring
+        })
+        savepoint.commit()
+    except IntegrityError:
+        savepoint.rollback()
+        __increment(user_id, month, category, spent, recurring)
+
+def spent_by_category(user_id, month):
+    '''
+    Gets the total spent in cents per category for a month from the rollups,
+    which is the spending for that month plus every recurring transaction
+    already in effect
+
+    This reads at most one row per category and month of history, regardless of
+    how many transactions the user has
+    '''
+
+    spent = func.sum(case([(MonthlyCategoryTotal.month == month, MonthlyCategoryTotal.spent_cents)], else_=0) + MonthlyCategoryTotal.recurring_cents)
+    rows = db.session.query(MonthlyCategoryTotal.category, spent).filter(MonthlyCategoryTotal.user_id == user_id, MonthlyCategoryTotal.month <= month).group_by(MonthlyCategoryTotal.category)
+
+    # MySQL sums integers into decimals, which are turned back into integers
+    return [(category, int(spent)) for category, spent in rows]
+
+def spent_by_month(user_id, start, end):
+    '''
+    Gets the total spent for every month from start to end with a single query,
+    returning a list of (month, spent in cents) in order
+
+    The query sums the rows per month up to the end of the range, and the
+    recurring spending is then carried forward as a running sum, so months
+    without any rows still pick up the recurring transactions in effect
+    '''
+
+    totals = dict(((month, (int(spent), int(recurring))) for month, spent, recurring in db.session.query(
+        MonthlyCategoryTotal.month, func.sum(MonthlyCategoryTotal.spent_cents), func.sum(MonthlyCategoryTotal.recurring_cents)
+    ).filter(MonthlyCategoryTotal.user_id == user_id, MonthlyCategoryTotal.month <= end).group_by(MonthlyCategoryTotal.month)))
+
+    # Carries the recurring spending from before the range into it
+    recurring = sum(month_recurring for month, (month_spent, month_recurring) in totals.items() if month < start)
+
+    spent_by_month = []
+    for month in iter_months(start, end):
+        month_spent, month_recurring = totals.get(month, (0, 0))
+        recurring += month_recurring
+        spent_by_month.append((month, month_spent + recurring))
+
+    return spent_by_month
+
+def totals_by_month_and_category(user_id, end):
+    '''
+    Gets the (month, category, spent, recurring) rollups of a user in cents for
+    every month up to end, summed by month and category in a single query
+    '''
+
+    rows = db.session.query(
+        MonthlyCategoryTotal.month, MonthlyCategoryTotal.category, func.sum(MonthlyCategoryTotal.spent_cents), func.sum(MonthlyCategoryTotal.recurring_cents)
+    ).filter(MonthlyCategoryTotal.user_id == user_id, MonthlyCategoryTotal.month <= end).group_by(MonthlyCategoryTotal.month, MonthlyCategoryTotal.category)
+    return [(month, category, int(spent), int(recurring)) for month, category, spent, recurring in rows]
+
+def compute(user_id=None):
+    '''
+    Recomputes the rollups from the transaction tables, streaming the rows so
+    that memory only grows with the number of rollup rows
+
+    Returns a dictionary keyed by (user_id, month, category) with the
+    (spent, recurring) totals in cents
+    '''
+
+    totals = {}
+
+    # Sums the transactions by the month they were created
+    transactions = db.session.query(Transaction.user_id, Transaction.created_at, Transaction.category, Transaction.price_cents)
+    transactions = transactions.filter(Transaction.created_at != None)
+    if user_id is not None:
+        transactions = transactions.filter(Transaction.user_id == user_id)
+    for row_user_id, created_at, category, price in transactions.yield_per(1000):
+        key = (row_user_id, month_of(created_at), category)
+        spent, recurring = totals.get(key, (0, 0))
+        totals[key] = (spent + (price or 0), recurring)
+
+    # Sums the recurring transactions by the month they take effect
+    recurring_transactions = db.session.query(RecurringTransaction.user_id, RecurringTransaction.effective_at, RecurringTransaction.category, RecurringTransaction.price_cents)
+    recurring_transactions = recurring_transactions.filter(RecurringTransaction.effective_at != None)
+    if user_id is not None:
+        recurring_transactions = recurring_transactions.filter(RecurringTransaction.user_id == user_id)
+    for row_user_id, effective_at, category, price in recurring_transactions.yield_per(1000):
+        key = (row_user_id, month_of(effective_at), category)
+        spent, recurring = totals.get(key, (0, 0))
+        totals[key] = (spent, recurring + (price or 0))
+
+    return totals
+
+def check(user_id=None):
+    '''
+    Compares the stored rollups with freshly computed ones and returns the keys
+    that do not match along with the (stored, expected) totals. Both are in
+    cents, so they have to match exactly
+    '''
+
+    expected = compute(user_id)
+
+    # Gets the stored rollups
+    stored = {}
+    rollups = MonthlyCategoryTotal.query
+    if user_id is not None:
+        rollups = rollups.filter(MonthlyCategoryTotal.user_id == user_id)
+    for rollup in rollups:
+        stored[(rollup.user_id, rollup.month, rollup.category)] = (rollup.spent_cents, rollup.recurring_cents)
+
+    # Compares every key in either set, treating missing rows as zero
+    mismatches = {}
+    for key in set(expected) | set(stored):
+        stored_totals = stored.get(key, (0, 0))
+        expected_totals = expected.get(key, (0, 0))
+        if stored_totals != expected_totals:
+            mismatches[key] = (stored_totals, expected_totals)
+
+    return mismatches
+
+def rebuild(user_id=None):
+    '''
+    Deletes and recreates the rollups from the transaction tables. Nothing is
+    committed here, the caller decides when to commit
+    '''
+
+    totals = compute(user_id)
+
+    # Deletes the existing rollups
+    rollups = MonthlyCategoryTotal.query
+    if user_id is not None:
+        rollups = rollups.filter(MonthlyCategoryTotal.user_id == user_id)
+    rollups.delete(synchronize_session=False)
+
+    # Inserts the recomputed rollups in one go
+    if totals:
+        db.session.execute(MonthlyCategoryTotal.__table__.insert(), [
+            {'user_id': key[0], 'month': key[1], 'category': key[2], 'spent_cents': spent, 'recurring_cents': recurring}
+            for key, (spent, recurring) in totals.items()
+        ])
+
+    return len(totals)
@@ -0,0 +1,90 @@
+from flask import current_app, request, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import orm
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.selectable import Select, CompoundSelect
+
+from functools import wraps
+
+import time
+
+
+# Set on the WSGI environ, so they last as long as the request including
+# any response that is streamed after the view returns
+READ_REPLICA = 'centsable.read_replica'
+WROTE = 'centsable.wrote'
+
+# The cookie that carries the time of the client's last write, so its reads
+# stay on the primary until the replica has caught up, whichever worker or
+# instance they land on
+WRITE_COOKIE = 'centsable_wrote'
+
+
+def read_replica(f):
+    '''
+    Sends the SELECTs of a GET (or HEAD) request to the replica bind
+
+    Anything else stays on the primary, and so does every query after the
+    request wrote, so it reads its own writes. A client's reads also stay on
+    the primary for REPLICA_LAG_SECONDS after it wrote, going by the cookie
+    set on the response to the write, so it does not read a replica that has
+    not caught up yet
+    '''
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            request.environ[READ_REPLICA] = True
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+def wrote_recently():
+    # Whether the client wrote within REPLICA_LAG_SECONDS, going by its cookie
+    try:
+        return time.time() - float(request.cookies.get(WRITE_COOKIE, 0)) < current_app.config['REPLICA_LAG_SECONDS']
+    except ValueError:
+        return False
+
+def reads_from_replica():
+    # Whether the SELECTs of the current request go to the replica bind
+    return bool(current_app.config.get('SQLALCHEMY_REPLICA_BIND') and request.environ.get(READ_REPLICA)
+                and not request.environ.get(WROTE) and not wrote_recently())
+
+def remember_write(response):
+    # Sets the cookie that keeps the client's next reads on the primary after it wrote
+    if request.environ.get(WROTE):
+        response.set_cookie(WRITE_COOKIE, '{0:.3f}'.format(time.time()), max_age=current_app.config['REPLICA_LAG_SECONDS'],
+                            secure=request.is_secure, httponly=True)
+    return response
+
+
+class RoutingSession(SignallingSession):
+    # Picks the replica bind for the SELECTs of the requests marked with read_replica
+    def get_bind(self, mapper=None, clause=None):
+        replica = self.app.config.get('SQLALCHEMY_REPLICA_BIND')
+        if replica and has_request_context():
+            if self._flushing or isinstance(clause, UpdateBase):
+                # Keeps the rest of the request and the client's next reads on the primary
+                request.environ[WROTE] = True
+            elif isinstance(clause, (Select, CompoundSelect)) and reads_from_replica():
+                return get_state(self.app).db.get_engine(self.app, bind=replica)
+
+        return SignallingSession.get_bind(self, mapper, clause)
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    '''
+    Flask-SQLAlchemy with a session that can send reads to a replica
+
+    The replica is the bind named by SQLALCHEMY_REPLICA_BIND in
+    SQLALCHEMY_BINDS. Without one, every query goes to the primary
+    '''
+
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_REPLICA_BIND', None)
+        app.config.setdefault('REPLICA_LAG_SECONDS', 5)
+        super(RoutingSQLAlchemy, self).init_app(app)
+        app.after_request(remember_write)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
@@ -0,0 +1,117 @@
+from app import db, password_hasher
+from app.models import User, Transaction, RecurringTransaction, Settings, MonthlyCategoryTotal
+from app.months import month_of, add_months
+from sqlalchemy import func
+
+import datetime
+import math
+import random
+
+
+# Generates realistic fake data for load tests and benchmarks
+#
+# Seeded users get the phone number '+1' + (5550000000 + their id), so the
+# benchmarks can log in as any of them with the seeding password
+
+FIRST_NAMES = ['Olivia', 'Liam', 'Emma', 'Noah', 'Ava', 'Elijah', 'Sophia', 'Lucas', 'Mia', 'Mateo', 'Isabella', 'David', 'Amelia', 'Ethan', 'Harper', 'Daniel']
+LAST_NAMES = ['Smith', 'Johnson', 'Garcia', 'Brown', 'Acevedo', 'Miller', 'Davis', 'Rodriguez', 'Martinez', 'Lopez', 'Wilson', 'Anderson', 'Lee', 'Nguyen']
+
+# (name, weight, median price) per category, prices follow a log-normal around the median
+MERCHANTS = {
+    'Needs': [('Groceries', 30, 60), ('Gas', 15, 40), ('Pharmacy', 5, 20), ('Electric Bill', 2, 90), ('Phone Bill', 2, 70), ('Bus Pass', 3, 25)],
+    'Wants': [('Coffee', 25, 5), ('Restaurant', 20, 35), ('Movies', 5, 15), ('Clothes', 6, 50), ('Takeout', 15, 25), ('Concert', 1, 90)],
+    'Savings': [('Savings Transfer', 3, 200), ('Brokerage', 1, 300)]
+}
+CATEGORY_WEIGHTS = {'Needs': 50, 'Wants': 45, 'Savings': 5}
+RECURRING = [('Rent', 'Needs', 1200), ('Internet', 'Needs', 60), ('Gym', 'Wants', 40), ('Streaming', 'Wants', 15), ('Retirement', 'Savings', 300)]
+
+
+def phone_number(user_id):
+    return str(5550000000 + user_id)
+
+def seed(users=1000, transactions=100000, recurring=3, settings=2, months=24, password='password', chunk_size=10000, random_seed=42, end=None):
+    '''
+    Appends users along with their transactions, recurring transactions,
+    settings history and rollups, and returns the number of rows of each
+
+    The transactions are spread over the last months up to end (the current
+    month by default), and over the users unevenly, like real activity is.
+    Everything is inserted with Core executemany in chunks of chunk_size and
+    the password is hashed once and shared by every user, so seeding 10^7
+    transactions is bound by the database rather than by Python. Nothing is
+    committed here, the caller decides when to commit
+    '''
+
+    generator = random.Random(random_seed)
+    end = month_of(end or datetime.datetime.utcnow())
+    start = add_months(end, -(months - 1))
+    days = (add_months(end, 1) - start).days
+    first_id = (db.session.query(func.max(User.id)).scalar() or 0) + 1
+    user_ids = list(range(first_id, first_id + users))
+    totals = {}
+
+    # Inserts the users with the one password hash
+    password_hash = password_hasher.hash(password)
+    __insert(User, [
+        {'id': user_id, 'first_name': generator.choice(FIRST_NAMES), 'last_name': generator.choice(LAST_NAMES), 'country_calling_code': '1',
+         'phone_number': phone_number(user_id), 'full_phone_number': '+1' + phone_number(user_id), 'password_hash': password_hash, 'created_at': start, 'verified_at': start}
+        for user_id in user_ids
+    ], chunk_size)
+
+    # Inserts the settings history, with the income rising a little every time
+    # The first entry is in effect from the start, like when a user signs up
+    # Amounts are generated in cents, which is how they are stored
+    rows = []
+    for user_id in user_ids:
+        income = int(round(generator.uniform(2000, 9000), -1)) * 100
+        for month in ([0] + sorted(generator.sample(range(1, months), min(settings, months) - 1)) if settings else []):
+            needs = generator.choice([0.5, 0.5, 0.6, 0.4])
+            rows.append({'user_id': user_id, 'needs_percentage': needs, 'wants_percentage': round(0.8 - needs, 2), 'savings_percentage': 0.2, 'income_cents': income, 'effective_at': add_months(start, month)})
+            income = int(round(income * generator.uniform(1.0, 1.1), -3))
+    rows.sort(key=lambda row: row['user_id'])
+    __insert(Settings, rows, chunk_size)
+
+    # Inserts the recurring transactions, each in effect from some month on
+    rows = []
+    for user_id in user_ids:
+        for name, category, price in generator.sample(RECURRING, min(recurring, len(RECURRING))):
+            effective_at = add_months(start, generator.randrange(months))
+            price = round(price * 100 * generator.uniform(0.7, 1.3))
+            rows.append({'user_id': user_id, 'name': name, 'category': category, 'price_cents': price, 'created_at': effective_at, 'effective_at': effective_at})
+            __add(totals, (user_id, effective_at, category), 1, price)
+    __insert(RecurringTransaction, rows, chunk_size)
+
+    # Inserts the transactions chunk by chunk, picking the users with a
+    # Pareto weighting so a few of them are much busier than the rest
+    weights = [generator.paretovariate(1.5) for _ in user_ids]
+    categories = list(CATEGORY_WEIGHTS)
+    category_weights = [CATEGORY_WEIGHTS[category] for category in categories]
+    for offset in range(0, transactions, chunk_size):
+        count = min(chunk_size, transactions - offset)
+        rows = []
+        for user_id, category in zip(generator.choices(user_ids, weights, k=count), generator.choices(categories, category_weights, k=count)):
+            merchants = MERCHANTS[category]
+            name, weight, median = generator.choices(merchants, [merchant[1] for merchant in merchants])[0]
+            price = round(median * 100 * math.exp(generator.gauss(0, 0.5)))
+            created_at = start + datetime.timedelta(days=generator.randrange(days), seconds=generator.randrange(86400))
+            rows.append({'user_id': user_id, 'name': name, 'category': category, 'price_cents': price, 'created_at': created_at})
+            __add(totals, (user_id, month_of(created_at), category), 0, price)
+        db.session.execute(Transaction.__table__.insert(), rows)
+
+    # Inserts the rollups of the new users
+    __insert(MonthlyCategoryTotal, [
+        {'user_id': user_id, 'month': month, 'category': category, 'spent_cents': spent, 'recurring_cents': recurring}
+        for (user_id, month, category), (spent, recurring) in sorted(totals.items())
+    ], chunk_size)
+
+    return {'users': users, 'settings': users * min(settings, months), 'recurring_transactions': users * min(recurring, len(RECURRING)), 'transactions': transactions, 'rollups': len(totals)}
+
+def __add(totals, key, index, amount):
+    total = totals.get(key)
+    if total is None:
+        total = totals[key] = [0, 0]
+    total[index] += amount
+
+def __insert(model, rows, chunk_size):
+    for offset in range(0, len(rows), chunk_size):
+        db.session.execute(model.__table__.insert(), rows[offset:offset + chunk_size])
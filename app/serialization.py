@@ -0,0 +1,154 @@
+from flask import current_app
+from flask.json import JSONEncoder as FlaskJSONEncoder
+from werkzeug.utils import import_string
+
+import datetime
+import decimal
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Every response body is built here, so dates look the same everywhere: UTC
+# datetimes (naive ones are UTC in this app) as ISO-8601 with a 'Z', like
+# '2020-06-01T00:00:00Z', and dates as '2020-06-01'
+
+def isoformat(value):
+    # Formats a datetime or a date as ISO-8601, UTC datetimes ending in 'Z'
+    if isinstance(value, datetime.datetime) and (value.tzinfo is None or value.utcoffset() == datetime.timedelta(0)):
+        return value.replace(tzinfo=None).isoformat() + 'Z'
+    return value.isoformat()
+
+def default(value):
+    # Serializes what the JSON module does not know about
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return isoformat(value)
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    raise TypeError('Object of type {0} is not JSON serializable'.format(type(value).__name__))
+
+
+class Serializer(object):
+    '''
+    The interface a serializer implements, dumps turns an object into UTF-8
+    JSON bytes
+
+    The output is compact unless JSONIFY_PRETTYPRINT_REGULAR is set or the
+    app is in debug mode, and keys are sorted when JSON_SORT_KEYS is set, the
+    same as jsonify does
+    '''
+
+    def __init__(self, app):
+        self.pretty = bool(app.config['JSONIFY_PRETTYPRINT_REGULAR'] or app.debug)
+        self.sort_keys = bool(app.config['JSON_SORT_KEYS'])
+
+    def dumps(self, value):
+        raise NotImplementedError
+
+    def dumps_line(self, value):
+        '''
+        Serializes the value as one line of newline delimited JSON, ending in a
+        newline. JSON escapes the newlines inside strings, so the only ones in
+        pretty output are indentation, which can be dropped
+        '''
+
+        body = self.dumps(value)
+        if self.pretty:
+            body = body.replace(b'\n', b'')
+        return body + b'\n'
+
+class OrjsonSerializer(Serializer):
+    # Serializes with orjson, which formats the datetimes itself in C
+    def __init__(self, app):
+        super(OrjsonSerializer, self).__init__(app)
+        if orjson is None:
+            raise ImportError('JSON_SERIALIZER is orjson but orjson is not installed')
+        self.options = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+        if self.pretty:
+            self.options |= orjson.OPT_INDENT_2
+        if self.sort_keys:
+            self.options |= orjson.OPT_SORT_KEYS
+
+    def dumps(self, value):
+        return orjson.dumps(value, default=default, option=self.options)
+
+class StandardSerializer(Serializer):
+    '''
+    Serializes with the standard library, for when orjson is not installed
+
+    One encoder is built up front and reused, with the circular reference
+    check off since responses are trees, which keeps it on the C encoder with
+    as little work per call as it gets
+    '''
+
+    def __init__(self, app):
+        super(StandardSerializer, self).__init__(app)
+        self.encoder = json.JSONEncoder(
+            ensure_ascii=False,
+            check_circular=False,
+            sort_keys=self.sort_keys,
+            indent=2 if self.pretty else None,
+            separators=(',', ': ') if self.pretty else (',', ':'),
+            default=default
+        )
+
+    def dumps(self, value):
+        return self.encoder.encode(value).encode('utf-8')
+
+
+BACKENDS = {
+    'orjson': OrjsonSerializer,
+    'json': StandardSerializer
+}
+
+
+class JSONEncoder(FlaskJSONEncoder):
+    # Formats the dates the same way for whatever still goes through flask.json
+    def default(self, value):
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            return isoformat(value)
+        return super(JSONEncoder, self).default(value)
+
+
+class ResponseSerializer(object):
+    '''
+    Installs the serializer that builds the JSON responses
+
+    JSON_SERIALIZER picks it by name ('orjson' or 'json') or by import path,
+    and defaults to orjson when it is installed
+    '''
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JSON_SERIALIZER', None)
+
+        # Loads the serializer by name or by import path
+        backend = app.config['JSON_SERIALIZER'] or ('orjson' if orjson is not None else 'json')
+        backend_class = BACKENDS[backend] if backend in BACKENDS else import_string(backend)
+        app.extensions['serializer'] = backend_class(app)
+        app.json_encoder = JSONEncoder
+
+
+def dumps(value):
+    # Serializes the value with the app's serializer, into bytes
+    return current_app.extensions['serializer'].dumps(value)
+
+def dumps_line(value):
+    # Serializes the value as a line of newline delimited JSON, into bytes
+    return current_app.extensions['serializer'].dumps_line(value)
+
+def jsonify(*args, **kwargs):
+    '''
+    Builds a JSON response like flask.jsonify, through the app's serializer
+    '''
+
+    if args and kwargs:
+        raise TypeError('jsonify() takes either arguments or keyword arguments, not both')
+    value = args[0] if len(args) == 1 else (args or kwargs)
+    return current_app.response_class(dumps(value), mimetype=current_app.config['JSONIFY_MIMETYPE'])
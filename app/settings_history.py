@@ -0,0 +1,67 @@
+from app import response_cache
+from app.cache import TTLCache
+from app.models import Settings
+from app.months import add_months
+
+import bisect
+
+
+# Resolves the settings in effect for a user and month
+#
+# A user's settings are a history of entries, each one in effect from its
+# effective_at month until the next one. The whole history is loaded once into
+# a sorted list of effective dates, so the entry in effect for any month is
+# found with a binary search, and cached per user until __create_settings
+# invalidates it
+#
+# The cache is per process, so the history is cached under the user's response
+# cache generation too. A settings write in any worker starts a new generation
+# in the shared backend, and every other worker then misses on its next read.
+# With the null response cache backend there is no shared generation, and the
+# history falls back to being cached per process alone. A settings write then
+# only invalidates the worker that handled it, and the other workers can use
+# the old settings for up to SETTINGS_CACHE_TTL seconds
+
+history_cache = TTLCache()
+
+
+class SettingsHistory(object):
+    def __init__(self, settings):
+        # The settings have to be sorted by effective_at
+        self.effective_ats = [entry.effective_at for entry in settings]
+        self.settings = [entry.to_dict() for entry in settings]
+
+    def at(self, month):
+        '''
+        Gets the settings in effect for the month, or an empty dictionary if the
+        month is before the first entry
+        '''
+
+        index = bisect.bisect_right(self.effective_ats, month) - 1
+        if index < 0:
+            return {}
+        return dict(self.settings[index])
+
+    def between(self, start, months):
+        # Gets the settings in effect for each of the months from start
+        return [self.at(add_months(start, count)) for count in range(months)]
+
+    def __len__(self):
+        return len(self.settings)
+
+
+def get_history(user_id):
+    # Gets the user's settings history, loading it with a single query on a miss
+    key = (user_id, response_cache.generation(user_id))
+    history = history_cache.get(key)
+    if history is None:
+        history = SettingsHistory(Settings.query.filter(Settings.user_id == user_id).order_by(Settings.effective_at).all())
+        history_cache.set(key, history)
+    return history
+
+def settings_at(user_id, month):
+    return get_history(user_id).at(month)
+
+def invalidate(user_id):
+    # Drops the user's history in this worker, the other workers miss on the new generation
+    history_cache.delete((user_id, response_cache.generation(user_id)))
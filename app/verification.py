@@ -0,0 +1,234 @@
+from flask import current_app
+from werkzeug.utils import import_string
+from twilio.base.exceptions import TwilioRestException
+from twilio.http.http_client import TwilioHttpClient
+from twilio.rest import Client
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import random
+import threading
+import time
+import weakref
+
+
+# What the providers hand back, status is 'pending', 'approved' or 'canceled'
+# like Twilio Verify
+Verification = namedtuple('Verification', ['to', 'status'])
+
+
+class VerificationUnavailable(Exception):
+    # Raised when the dispatch queue is full, so the request can be shed with a 503
+    pass
+
+class VerificationTimeout(Exception):
+    # Raised when the provider does not answer within VERIFICATION_TIMEOUT seconds
+    pass
+
+class VerificationRejected(Exception):
+    # Raised when the provider refuses the request, like an invalid or unverified phone number
+    pass
+
+class VerificationFailed(Exception):
+    # Raised when the provider fails or can not be reached
+    pass
+
+
+class VerificationProvider(object):
+    '''
+    The interface a verification provider implements
+
+    A provider is created once per app and shared by the dispatch threads, so
+    it has to be thread safe. It gets the app's config when it is created and
+    does not use the app context afterwards, since it runs off the request
+
+    Providers raise VerificationRejected when the request itself is refused
+    and VerificationFailed when the provider is at fault, so the API can tell
+    the client which one happened
+    '''
+
+    def __init__(self, app):
+        self.app = app
+
+    def send(self, full_phone_number, channel):
+        raise NotImplementedError
+
+    def check(self, full_phone_number, code):
+        raise NotImplementedError
+
+class TwilioProvider(VerificationProvider):
+    '''
+    Sends the codes through Twilio Verify, reusing one client and HTTP session
+    for every call. The client is created on first use, since Twilio refuses to
+    build one without credentials and the app has to start without them
+    '''
+
+    def __init__(self, app):
+        super(TwilioProvider, self).__init__(app)
+        self.service_id = app.config['TWILIO_SERVICE_ID']
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                http_client = TwilioHttpClient(pool_connections=True, timeout=self.app.config['VERIFICATION_TIMEOUT'])
+                self._client = Client(self.app.config['TWILIO_ACCOUNT_SID'], self.app.config['TWILIO_AUTH_TOKEN'], http_client=http_client)
+            return self._client
+
+    def send(self, full_phone_number, channel):
+        # To find out what this returns, go to https://www.twilio.com/docs/verify/api/verification#verification-response-properties
+        verification = self.__call(self.client.verify.services(self.service_id).verifications.create, to=full_phone_number, channel=channel)
+        return Verification(verification.to, verification.status)
+
+    def check(self, full_phone_number, code):
+        # To find out what this returns, go to https://www.twilio.com/docs/verify/api/verification-check#check-a-verification
+        verification_check = self.__call(self.client.verify.services(self.service_id).verification_checks.create, to=full_phone_number, code=code)
+        return Verification(verification_check.to, verification_check.status)
+
+    def __call(self, create, **kwargs):
+        # Tells the requests Twilio refuses (4xx other than 429) apart from its failures
+        try:
+            return create(**kwargs)
+        except TwilioRestException as e:
+            if 400 <= e.status < 500 and e.status != 429:
+                raise VerificationRejected('verification rejected: {0}'.format(e.msg))
+            raise VerificationFailed('verification provider failed: {0}'.format(e.msg))
+        except Exception as e:
+            raise VerificationFailed('verification provider failed: {0}'.format(e))
+
+class FakeProvider(VerificationProvider):
+    '''
+    Keeps the pending codes in memory and never touches the network, for tests
+    and load tests
+
+    Every code is VERIFICATION_FAKE_CODE, and VERIFICATION_FAKE_LATENCY adds a
+    delay in seconds to every call to stand in for a slow provider
+    '''
+
+    def __init__(self, app):
+        super(FakeProvider, self).__init__(app)
+        self.code = app.config['VERIFICATION_FAKE_CODE']
+        self.latency = app.config['VERIFICATION_FAKE_LATENCY']
+        self.pending = set()
+        self._lock = threading.Lock()
+
+    def send(self, full_phone_number, channel):
+        self.__wait()
+        with self._lock:
+            self.pending.add(full_phone_number)
+        return Verification(full_phone_number, 'pending')
+
+    def check(self, full_phone_number, code):
+        self.__wait()
+        with self._lock:
+            if full_phone_number in self.pending and code == self.code:
+                self.pending.discard(full_phone_number)
+                return Verification(full_phone_number, 'approved')
+        return Verification(full_phone_number, 'pending')
+
+    def __wait(self):
+        if self.latency:
+            # Jitters the latency a little, like a real provider
+            time.sleep(self.latency * random.uniform(0.5, 1.5))
+
+
+PROVIDERS = {
+    'twilio': TwilioProvider,
+    'fake': FakeProvider
+}
+
+
+class Dispatcher(object):
+    '''
+    Runs the provider calls on a bounded pool of threads
+
+    At most VERIFICATION_WORKERS calls run at once and VERIFICATION_QUEUE_SIZE
+    more can wait for a thread. Past that, calls are refused straight away
+    instead of piling up behind a slow provider
+
+    The pool bounds how long a request waits on the provider, it does not
+    free the request thread: call still blocks it for up to VERIFICATION_TIMEOUT
+    seconds, so a slow provider ties up one request thread per pending call
+
+    The threads are shut down when the dispatcher is garbage collected along
+    with its app, or when the interpreter exits
+    '''
+
+    def __init__(self, app, provider):
+        self.provider = provider
+        self.timeout = app.config['VERIFICATION_TIMEOUT']
+        self.executor = ThreadPoolExecutor(max_workers=app.config['VERIFICATION_WORKERS'], thread_name_prefix='verification')
+        self.slots = threading.BoundedSemaphore(app.config['VERIFICATION_WORKERS'] + app.config['VERIFICATION_QUEUE_SIZE'])
+        weakref.finalize(self, self.executor.shutdown, False)
+
+    def submit(self, method, *args):
+        # Takes a slot in the queue, refusing the call if there is none left
+        if not self.slots.acquire(blocking=False):
+            raise VerificationUnavailable('verification queue is full')
+        try:
+            future = self.executor.submit(getattr(self.provider, method), *args)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda future: self.slots.release())
+        return future
+
+    def call(self, method, *args):
+        # Runs the call and blocks the request thread on it, giving up after the timeout
+        future = self.submit(method, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise VerificationTimeout('verification provider did not answer within {0} seconds'.format(self.timeout))
+
+
+class VerificationService(object):
+    '''
+    Sends and checks verification codes through the configured provider
+
+    VERIFICATION_PROVIDER is either the name of one of the PROVIDERS or the
+    import path of a VerificationProvider subclass
+    '''
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('VERIFICATION_PROVIDER', 'twilio')
+        app.config.setdefault('VERIFICATION_WORKERS', 8)
+        app.config.setdefault('VERIFICATION_QUEUE_SIZE', 64)
+        app.config.setdefault('VERIFICATION_TIMEOUT', 5)
+        app.config.setdefault('VERIFICATION_FAKE_CODE', '123456')
+        app.config.setdefault('VERIFICATION_FAKE_LATENCY', 0)
+
+        # Loads the provider by name or by import path
+        provider = app.config['VERIFICATION_PROVIDER']
+        provider_class = PROVIDERS[provider] if provider in PROVIDERS else import_string(provider)
+        app.extensions['verification'] = Dispatcher(app, provider_class(app))
+
+    @property
+    def dispatcher(self):
+        return current_app.extensions['verification']
+
+    @property
+    def provider(self):
+        return self.dispatcher.provider
+
+    def send(self, country_calling_code, phone_number, channel='sms'):
+        '''
+        Sends a verification code, waiting at most VERIFICATION_TIMEOUT seconds
+        for the provider, so the client hears about a number the provider
+        refused or an outage instead of waiting for a code that never comes
+        '''
+
+        full_phone_number = '+' + str(country_calling_code) + str(phone_number)
+        return self.dispatcher.call('send', full_phone_number, channel)
+
+    def check(self, country_calling_code, phone_number, code):
+        # Checks the code with the provider, waiting at most VERIFICATION_TIMEOUT seconds
+        full_phone_number = '+' + str(country_calling_code) + str(phone_number)
+        return self.dispatcher.call('check', full_phone_number, code)
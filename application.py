@@ -1,13 +1,9 @@
-from app import create_app, db
-from app.models import User, Transaction
-from flask import request
+from app import create_app, db, cli
+from app.models import User, Transaction, RecurringTransaction, Settings, MonthlyCategoryTotal
 
 application = create_app()
+cli.register(application)
 
 @application.shell_context_processor
 def make_shell_context():
-    return {'db': db, 'User': User, 'Transaction': Transaction}
-
-@application.before_request
-def log_request():
-    application.logger.info('{0} {1} \n{2}{3}'.format(request.method, request.path, request.headers, request.data))
+    return {'db': db, 'User': User, 'Transaction': Transaction, 'RecurringTransaction': RecurringTransaction, 'Settings': Settings, 'MonthlyCategoryTotal': MonthlyCategoryTotal}
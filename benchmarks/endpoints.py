@@ -0,0 +1,154 @@
+'''
+Measures the latency and throughput of the main endpoints end to end
+
+The database is seeded with app.seed (like "flask seed" does), then every
+endpoint is sent --requests requests through the test client from --threads
+threads, as random seeded users and months. For each endpoint this reports
+requests/sec and the p50, p95 and p99 latencies, which gives the baseline to
+compare a change against. Use the same --random-seed and scale to compare
+runs
+
+The response cache and the login rate limit are off by default, so every
+request does its full work. By default this runs against a throwaway SQLite
+file, pass --database-url to point it at a MySQL instance (add --no-seed to
+reuse data seeded there before)
+
+    (venv) $ python benchmarks/endpoints.py --users 1000 --transactions 1000000
+    (venv) $ python benchmarks/endpoints.py --endpoints overview transactions --threads 4
+'''
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import create_app, db
+from app.models import User
+from app.months import add_months, format_month, month_of
+from app.seed import seed, phone_number
+from config import Config
+from flask_jwt_extended import create_access_token
+
+
+def endpoints(months):
+    '''
+    Builds the request of every endpoint for a user, as (method, path, json,
+    needs a token) tuples
+    '''
+
+    def month():
+        return format_month(random.choice(months))
+
+    return {
+        'overview': lambda user_id: ('GET', '/api/v1/overview?date=' + month(), None, True),
+        'trend': lambda user_id: ('GET', '/api/v1/overview/trend?months=12', None, True),
+        'transactions': lambda user_id: ('GET', '/api/v1/transactions?date=' + month(), None, True),
+        'recurring-transactions': lambda user_id: ('GET', '/api/v1/recurring-transactions', None, True),
+        'settings': lambda user_id: ('GET', '/api/v1/settings?date=' + month(), None, True),
+        'login': lambda user_id: ('POST', '/api/v1/login', {'countryCode': '1', 'phoneNumber': phone_number(user_id), 'password': 'password'}, False)
+    }
+
+def run(app, build, user_ids, tokens, requests, threads):
+    '''
+    Sends the requests from the threads, and returns the sorted latencies of
+    the successful ones, the number of failed ones and the elapsed time
+    '''
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker(count):
+        client = app.test_client()
+        local_latencies, local_errors = [], 0
+        for _ in range(count):
+            user_id = random.choice(user_ids)
+            method, path, body, authenticated = build(user_id)
+            headers = {'Authorization': 'Bearer ' + tokens[user_id]} if authenticated else {}
+            start = time.perf_counter()
+            response = client.open(path, method=method, json=body, headers=headers)
+            elapsed = time.perf_counter() - start
+            if response.status_code == 200:
+                local_latencies.append(elapsed)
+            else:
+                local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+
+    # Splits the requests evenly over the threads
+    counts = [requests // threads + (1 if index < requests % threads else 0) for index in range(threads)]
+    workers = [threading.Thread(target=worker, args=(count,)) for count in counts]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return sorted(latencies), errors[0], time.perf_counter() - start
+
+def percentile(values, share):
+    # Returns the percentile in milliseconds
+    return values[min(len(values) - 1, int(len(values) * share))] * 1000 if values else 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default=None, help='database to use, defaults to a temporary SQLite file')
+    parser.add_argument('--no-seed', action='store_true', help='use the users already seeded in the database')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--endpoints', nargs='+', default=['overview', 'transactions', 'recurring-transactions', 'settings', 'login'])
+    parser.add_argument('--requests', type=int, default=1000, help='requests per endpoint')
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--response-cache', action='store_true', help='keep the response cache on')
+    parser.add_argument('--random-seed', type=int, default=42)
+    args = parser.parse_args()
+
+    database_url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+
+    class BenchmarkConfig(Config):
+        TESTING = 1
+        SQLALCHEMY_DATABASE_URI = database_url
+        RESPONSE_CACHE_BACKEND = 'local' if args.response_cache else 'null'
+        RATE_LIMIT_BACKEND = 'null'
+
+    app = create_app(BenchmarkConfig)
+    random.seed(args.random_seed)
+    end = month_of(datetime.datetime.utcnow())
+    months = [add_months(end, -count) for count in range(args.months)]
+
+    with app.app_context():
+        if not args.no_seed:
+            if not args.database_url:
+                db.create_all()
+            print('seeding {0} transactions for {1} users'.format(args.transactions, args.users))
+            start = time.perf_counter()
+            seed(users=args.users, transactions=args.transactions, months=args.months, random_seed=args.random_seed, end=end)
+            db.session.commit()
+            print('seeded in {0:.1f} s'.format(time.perf_counter() - start))
+
+        user_ids = [user_id for user_id, in db.session.query(User.id)]
+        tokens = {user_id: create_access_token(identity='+1' + phone_number(user_id)) for user_id in user_ids}
+        db.session.remove()
+
+    requests = endpoints(months)
+    print('\n{0} requests per endpoint from {1} thread(s)\n'.format(args.requests, args.threads))
+    print('{0:<24} {1:>10} {2:>10} {3:>10} {4:>10} {5:>8}'.format('endpoint', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'))
+    for name in args.endpoints:
+        latencies, errors, elapsed = run(app, requests[name], user_ids, tokens, args.requests, args.threads)
+        print('{0:<24} {1:>10.1f} {2:>10.2f} {3:>10.2f} {4:>10.2f} {5:>8}'.format(
+            name, len(latencies) / elapsed, percentile(latencies, 0.5), percentile(latencies, 0.95), percentile(latencies, 0.99), errors))
+
+    if not args.database_url:
+        with app.app_context():
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+'''
+Measures how many logins per second a core can verify for a password hashing
+method and work factor, to pick PASSWORD_HASH_METHOD and PASSWORD_HASH_ROUNDS
+
+Each setting is timed on a single thread, which gives the logins/sec per core,
+and then on the bounded pool the app uses with PASSWORD_HASH_WORKERS threads
+
+    (venv) $ python benchmarks/password_hashing.py --method pbkdf2 --rounds 150000 260000
+    (venv) $ python benchmarks/password_hashing.py --method bcrypt --rounds 10 12
+'''
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import create_app, password_hasher
+from app.hashing import PasswordPolicy, DEFAULT_ROUNDS
+from config import Config
+from concurrent.futures import ThreadPoolExecutor
+
+
+def time_single(policy, stored, logins):
+    # Verifies the password logins times on this thread
+    start = time.perf_counter()
+    for _ in range(logins):
+        policy.verify(stored, 'password')
+    return logins / (time.perf_counter() - start)
+
+def time_pool(app, stored, logins, threads):
+    # Sends the logins through the app's hasher from as many request threads
+    def login(_):
+        with app.app_context():
+            return password_hasher.check(stored, 'password')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(login, range(logins)))
+    return logins / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--method', choices=sorted(DEFAULT_ROUNDS), default='pbkdf2')
+    parser.add_argument('--rounds', type=int, nargs='+', default=None, help='work factors to compare, defaults to the method default')
+    parser.add_argument('--logins', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    print('{0} cores, {1} hashing workers'.format(os.cpu_count(), args.workers))
+    for rounds in args.rounds or [DEFAULT_ROUNDS[args.method]]:
+        class BenchmarkConfig(Config):
+            TESTING = 1
+            PASSWORD_HASH_METHOD = args.method
+            PASSWORD_HASH_ROUNDS = rounds
+            PASSWORD_HASH_WORKERS = args.workers
+            PASSWORD_HASH_QUEUE_SIZE = args.logins
+
+        app = create_app(BenchmarkConfig)
+        policy = PasswordPolicy(args.method, rounds)
+        stored = policy.hash('password')
+
+        per_core = time_single(policy, stored, args.logins)
+        pooled = time_pool(app, stored, args.logins, args.workers * 2)
+        print('{0} rounds={1}: {2:.1f} logins/sec per core, {3:.1f} logins/sec on the pool ({4:.1f} ms per login)'.format(
+            args.method, rounds, per_core, pooled, 1000 / per_core))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+'''
+Shows how throughput changes with the size of the connection pool
+
+For every pool size, a fresh app is created with that many connections and no
+overflow, and --threads threads send overview and transaction requests
+through the test client for --duration seconds. The response cache is turned
+off so every request reaches the database. By default this runs against a
+throwaway SQLite file with a queue pool, pass --database-url to point it at
+a MySQL instance instead, which is where the numbers mean something. Every
+table of that database is dropped before seeding, so it has to be a scratch
+database and --reset has to be passed to confirm it
+
+    (venv) $ python benchmarks/pool_load.py --pool-sizes 1 2 4 8 --threads 16
+'''
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import create_app, db, rollups
+from app.models import User, Transaction, Settings
+from config import Config, engine_options
+from flask_jwt_extended import create_access_token
+from sqlalchemy.pool import QueuePool
+
+
+def seed(users, transactions):
+    # Seeds a few months of transactions for every user
+    random.seed(42)
+    db.session.execute(User.__table__.insert(), [
+        {'id': i, 'first_name': 'User', 'last_name': str(i), 'country_calling_code': '1', 'phone_number': str(5550000000 + i), 'full_phone_number': '+1' + str(5550000000 + i)}
+        for i in range(1, users + 1)
+    ])
+    db.session.execute(Transaction.__table__.insert(), [
+        {'user_id': random.randint(1, users), 'name': 'Transaction', 'category': random.choice(['Needs', 'Wants', 'Savings']), 'price_cents': random.randint(100, 20000), 'created_at': datetime.datetime(2020, random.randint(1, 6), random.randint(1, 28))}
+        for _ in range(transactions)
+    ])
+    db.session.execute(Settings.__table__.insert(), [
+        {'user_id': user_id, 'needs_percentage': 0.5, 'wants_percentage': 0.3, 'savings_percentage': 0.2, 'income_cents': 400000, 'effective_at': datetime.datetime(2020, 1, 1)}
+        for user_id in range(1, users + 1)
+    ])
+    db.session.commit()
+    rollups.rebuild()
+    db.session.commit()
+
+def run(app, users, threads, duration):
+    '''
+    Sends requests from the threads until the duration is up, and returns the
+    latencies of the successful requests and the number of failed ones
+    '''
+
+    with app.app_context():
+        tokens = [create_access_token(identity='+1' + str(5550000000 + i)) for i in range(1, users + 1)]
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        client = app.test_client()
+        local_latencies, local_errors = [], 0
+        while time.perf_counter() < deadline:
+            headers = {'Authorization': 'Bearer ' + random.choice(tokens)}
+            path = random.choice(['/api/v1/overview?date=2020-0{0}', '/api/v1/transactions?date=2020-0{0}']).format(random.randint(1, 6))
+            start = time.perf_counter()
+            response = client.get(path, headers=headers)
+            if response.status_code == 200:
+                local_latencies.append(time.perf_counter() - start)
+            else:
+                local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return sorted(latencies), errors[0]
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))] * 1000 if values else 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default=None, help='database to seed, defaults to a temporary SQLite file')
+    parser.add_argument('--reset', action='store_true', help='drop every table of --database-url before seeding it')
+    parser.add_argument('--pool-sizes', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--pool-timeout', type=int, default=30)
+    args = parser.parse_args()
+    if args.database_url and not args.reset:
+        parser.error('--database-url drops every table of the database, pass --reset to confirm')
+
+    database_url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+
+    print('{0} threads for {1} s per pool size'.format(args.threads, args.duration))
+    for index, pool_size in enumerate(args.pool_sizes):
+        options = dict(engine_options(database_url), poolclass=QueuePool, pool_size=pool_size, max_overflow=0, pool_timeout=args.pool_timeout)
+        if database_url.startswith('sqlite'):
+            # Lets the pooled SQLite connections move between the threads
+            options['connect_args'] = {'check_same_thread': False}
+
+        class BenchmarkConfig(Config):
+            TESTING = 1
+            SQLALCHEMY_DATABASE_URI = database_url
+            SQLALCHEMY_ENGINE_OPTIONS = options
+            RESPONSE_CACHE_BACKEND = 'null'
+
+        app = create_app(BenchmarkConfig)
+        with app.app_context():
+            # Seeds once, the later apps reuse the data
+            if index == 0:
+                db.drop_all()
+                db.create_all()
+                seed(args.users, args.transactions)
+
+            latencies, errors = run(app, args.users, args.threads, args.duration)
+            print('pool size {0:>3}: {1:8.1f} requests/sec, p50 {2:.1f} ms, p95 {3:.1f} ms, {4} errors'.format(
+                pool_size, len(latencies) / args.duration, percentile(latencies, 0.5), percentile(latencies, 0.95), errors))
+            db.engine.dispose()
+
+    if not args.database_url:
+        with app.app_context():
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+'''
+Shows the query plans and timings of the per-user month range scans, with and
+without the user/month indexes
+
+The database is seeded with fake users, transactions, recurring transactions and
+settings, then every query is explained and timed twice: once with the indexes
+dropped and once with them in place. By default this runs against a throwaway
+SQLite file, pass --database-url to point it at a MySQL instance instead. Every
+table of that database is dropped before seeding, so it has to be a scratch
+database and --reset has to be passed to confirm it
+
+    (venv) $ python benchmarks/query_plans.py --transactions 1000000
+    (venv) $ python benchmarks/query_plans.py --database-url mysql+pymysql://... --reset
+'''
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import create_app, db
+from app.models import User, Transaction, RecurringTransaction, Settings
+from app.months import next_month
+from config import Config
+from sqlalchemy import desc, inspect, select
+
+
+CATEGORIES = ['Needs', 'Wants', 'Savings']
+
+
+def seed(users, transactions, months):
+    '''
+    Seeds the database using Core executemany inserts in chunks, which keeps
+    seeding a million rows to a few seconds
+    '''
+
+    start = datetime.datetime(2020, 1, 1)
+    random.seed(42)
+
+    db.session.execute(User.__table__.insert(), [
+        {'id': i, 'first_name': 'User', 'last_name': str(i), 'country_calling_code': '1', 'phone_number': str(5550000000 + i), 'full_phone_number': '+1' + str(5550000000 + i)}
+        for i in range(1, users + 1)
+    ])
+
+    chunk = 50000
+    for offset in range(0, transactions, chunk):
+        db.session.execute(Transaction.__table__.insert(), [
+            {'user_id': random.randint(1, users), 'name': 'Transaction', 'category': random.choice(CATEGORIES), 'price_cents': random.randint(100, 20000), 'created_at': start + datetime.timedelta(days=random.randint(0, months * 30), seconds=random.randint(0, 86399))}
+            for _ in range(min(chunk, transactions - offset))
+        ])
+
+    db.session.execute(RecurringTransaction.__table__.insert(), [
+        {'user_id': user_id, 'name': 'Recurring', 'category': random.choice(CATEGORIES), 'price_cents': random.randint(1000, 50000), 'created_at': start, 'effective_at': start + datetime.timedelta(days=30 * random.randint(0, months - 1))}
+        for user_id in range(1, users + 1) for _ in range(3)
+    ])
+
+    db.session.execute(Settings.__table__.insert(), [
+        {'user_id': user_id, 'needs_percentage': 0.5, 'wants_percentage': 0.3, 'savings_percentage': 0.2, 'income_cents': 400000, 'effective_at': datetime.datetime(2020, month, 1)}
+        for user_id in range(1, users + 1) for month in (1, 6)
+    ])
+
+    db.session.commit()
+
+def queries(full_phone_number, user_id, month):
+    # Builds the queries the API runs for a user and a month
+    end = next_month(month)
+    return [
+        ('user by full phone number', User.query.filter(User.full_phone_number == full_phone_number)),
+        ('transactions for the month', Transaction.query.filter(Transaction.user_id == user_id, Transaction.created_at >= month, Transaction.created_at < end)),
+        ('recurring transactions in effect', RecurringTransaction.query.filter(RecurringTransaction.user_id == user_id, RecurringTransaction.effective_at < end)),
+        ('settings in effect', Settings.query.filter(Settings.user_id == user_id, Settings.effective_at <= month).order_by(desc(Settings.effective_at)).limit(1)),
+    ]
+
+def explain(query):
+    # Runs the dialect's EXPLAIN against the compiled statement
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    prefix = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    params = [compiled.params[name] for name in compiled.positiontup] if compiled.positional else compiled.params
+    return [' | '.join(str(column) for column in row) for row in db.engine.execute(prefix + str(compiled), params)]
+
+def time_query(query, repeat):
+    # Returns the best of the timings in milliseconds
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        query.all()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def indexes():
+    return [index for table in (User.__table__, Transaction.__table__, RecurringTransaction.__table__, Settings.__table__) for index in table.indexes if index.name != 'ix_user_phone_number']
+
+def report(label, repeat):
+    print('\n=== {0}'.format(label))
+    user_id = 1
+    full_phone_number = '+1' + str(5550000000 + user_id)
+    for name, query in queries(full_phone_number, user_id, datetime.datetime(2020, 6, 1)):
+        print('\n{0}: {1:.3f} ms'.format(name, time_query(query, repeat)))
+        for line in explain(query):
+            print('    ' + line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default=None, help='database to seed, defaults to a temporary SQLite file')
+    parser.add_argument('--reset', action='store_true', help='drop every table of --database-url before seeding it')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--transactions', type=int, default=1000000)
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    if args.database_url and not args.reset:
+        parser.error('--database-url drops every table of the database, pass --reset to confirm')
+
+    database_url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+
+    class BenchmarkConfig(Config):
+        TESTING = 1
+        SQLALCHEMY_DATABASE_URI = database_url
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        print('seeding {0} transactions for {1} users'.format(args.transactions, args.users))
+        start = time.perf_counter()
+        seed(args.users, args.transactions, args.months)
+        print('seeded in {0:.1f} s'.format(time.perf_counter() - start))
+
+        # Runs without the indexes first, recreating them even if the run is interrupted
+        try:
+            for index in indexes():
+                index.drop(db.engine)
+            report('without indexes', args.repeat)
+        finally:
+            existing = set(index['name'] for table in ('user', 'transaction', 'recurring_transaction', 'settings') for index in inspect(db.engine).get_indexes(table))
+            for index in indexes():
+                if index.name not in existing:
+                    index.create(db.engine)
+
+        # Then runs again with them in place
+        report('with indexes', args.repeat)
+
+        if not args.database_url:
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+'''
+Times the serialization of a transactions response with every serializer
+
+Builds the response of a month with --transactions transactions, the way
+__get_transactions does, and serializes it --repeat times with flask.json
+(what jsonify used to do), the standard library serializer and orjson when it
+is installed. Reports the best time of each and the size of the output
+
+    (venv) $ python benchmarks/serialization.py --transactions 10000
+'''
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import create_app
+from app.serialization import BACKENDS, orjson
+from config import Config
+from flask import json as flask_json
+
+
+def payload(transactions):
+    # Builds a transactions response with random but realistic values
+    random.seed(42)
+    start = datetime.datetime(2020, 6, 1)
+    return {
+        'amountSpent': 1234.56,
+        'recurringTransactions': [
+            {'id': i, 'name': 'Recurring {0}'.format(i), 'category': 'Needs', 'price': 99.99, 'createdAt': start, 'effectiveDate': start, 'canEdit': False}
+            for i in range(5)
+        ],
+        'transactions': [
+            {'id': i, 'name': random.choice(['Coffee', 'Groceries', 'Gas', 'Restaurant']), 'category': random.choice(['Needs', 'Wants', 'Savings']),
+             'price': round(random.uniform(1, 200), 2), 'createdAt': start + datetime.timedelta(seconds=random.randrange(30 * 86400)), 'canEdit': True}
+            for i in range(transactions)
+        ]
+    }
+
+def best(function, repeat):
+    # Returns the best time of the runs in milliseconds
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--transactions', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    class BenchmarkConfig(Config):
+        TESTING = 1
+        SQLALCHEMY_DATABASE_URI = 'sqlite://'
+        JSON_SORT_KEYS = False
+
+    app = create_app(BenchmarkConfig)
+    value = payload(args.transactions)
+
+    with app.app_context():
+        # Flask's own encoder, which formats the datetimes as HTTP dates
+        serializers = [('flask.json', lambda value: flask_json.dumps(value, cls=flask_json.JSONEncoder, separators=(',', ':')).encode('utf-8'))]
+        for name, backend in BACKENDS.items():
+            if name != 'orjson' or orjson is not None:
+                serializers.append((name, backend(app).dumps))
+
+        print('{0} transactions, best of {1}\n'.format(args.transactions, args.repeat))
+        print('{0:<12} {1:>10} {2:>10}'.format('serializer', 'ms', 'KB'))
+        for name, dumps in serializers:
+            print('{0:<12} {1:>10.2f} {2:>10.1f}'.format(name, best(lambda: dumps(value), args.repeat), len(dumps(value)) / 1024))
+
+
+if __name__ == '__main__':
+    main()
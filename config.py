@@ -5,12 +5,88 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 load_dotenv(os.path.join(basedir, '.env'))
 
 
+def engine_options(database_uri):
+    '''
+    Builds the connection pool options from the environment
+
+    Connections are recycled before MySQL's wait_timeout (and the idle timeout
+    of any proxy in between) can drop them, and checked with a ping when they
+    are taken out of the pool. The pool holds DATABASE_POOL_SIZE connections
+    and opens up to DATABASE_MAX_OVERFLOW more under bursts, after which
+    requests wait DATABASE_POOL_TIMEOUT seconds for one. SQLite gets none of
+    this, since Flask-SQLAlchemy picks its pool itself
+    '''
+
+    if database_uri.startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': int(os.environ.get('DATABASE_POOL_SIZE') or 10),
+        'max_overflow': int(os.environ.get('DATABASE_MAX_OVERFLOW') or 10),
+        'pool_recycle': int(os.environ.get('DATABASE_POOL_RECYCLE') or 280),
+        'pool_pre_ping': (os.environ.get('DATABASE_POOL_PRE_PING') or '1').lower() not in ('0', 'false', 'no'),
+        'pool_timeout': int(os.environ.get('DATABASE_POOL_TIMEOUT') or 10)
+    }
+
+
 class Config(object):
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'super-secret'
     JWT_ACCESS_TOKEN_EXPIRES = 1800
     TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID')
     TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
     TWILIO_SERVICE_ID = os.environ.get('TWILIO_SERVICE_ID')
+    IDENTITY_CACHE_SIZE = int(os.environ.get('IDENTITY_CACHE_SIZE') or 4096)
+    IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL') or 300)
+    JWT_CLAIMS_IN_REFRESH_TOKEN = True
+    JSON_SERIALIZER = os.environ.get('JSON_SERIALIZER')
+    RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND') or 'null'
+    RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE') or 10000)
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL') or 3600)
+    BULK_INSERT_MAX_ROWS = int(os.environ.get('BULK_INSERT_MAX_ROWS') or 10000)
+    BULK_INSERT_CHUNK_SIZE = int(os.environ.get('BULK_INSERT_CHUNK_SIZE') or 1000)
+    IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE') or 500)
+    TRANSACTIONS_PAGE_SIZE = int(os.environ.get('TRANSACTIONS_PAGE_SIZE') or 500)
+    TRANSACTIONS_MAX_PAGE_SIZE = int(os.environ.get('TRANSACTIONS_MAX_PAGE_SIZE') or 1000)
+    TRANSACTIONS_MAX_RANGE_MONTHS = int(os.environ.get('TRANSACTIONS_MAX_RANGE_MONTHS') or 120)
+    TREND_MAX_MONTHS = int(os.environ.get('TREND_MAX_MONTHS') or 60)
+    SETTINGS_CACHE_SIZE = int(os.environ.get('SETTINGS_CACHE_SIZE') or 4096)
+    SETTINGS_CACHE_TTL = int(os.environ.get('SETTINGS_CACHE_TTL') or 300)
+    VERIFICATION_PROVIDER = os.environ.get('VERIFICATION_PROVIDER') or 'twilio'
+    VERIFICATION_WORKERS = int(os.environ.get('VERIFICATION_WORKERS') or 8)
+    VERIFICATION_QUEUE_SIZE = int(os.environ.get('VERIFICATION_QUEUE_SIZE') or 64)
+    VERIFICATION_TIMEOUT = float(os.environ.get('VERIFICATION_TIMEOUT') or 5)
+    VERIFICATION_FAKE_CODE = os.environ.get('VERIFICATION_FAKE_CODE') or '123456'
+    VERIFICATION_FAKE_LATENCY = float(os.environ.get('VERIFICATION_FAKE_LATENCY') or 0)
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'pbkdf2'
+    PASSWORD_HASH_ROUNDS = int(os.environ['PASSWORD_HASH_ROUNDS']) if os.environ.get('PASSWORD_HASH_ROUNDS') else None
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or os.cpu_count() or 1)
+    PASSWORD_HASH_QUEUE_SIZE = int(os.environ.get('PASSWORD_HASH_QUEUE_SIZE') or 64)
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR', 1))
+    RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND') or 'local'
+    RATE_LIMIT_CACHE_SIZE = int(os.environ.get('RATE_LIMIT_CACHE_SIZE') or 100000)
+    LOGIN_RATE_LIMIT_WINDOW = int(os.environ.get('LOGIN_RATE_LIMIT_WINDOW') or 300)
+    LOGIN_RATE_LIMIT_PHONE = int(os.environ.get('LOGIN_RATE_LIMIT_PHONE') or 10)
+    LOGIN_RATE_LIMIT_IP = int(os.environ.get('LOGIN_RATE_LIMIT_IP') or 100)
+    UNKNOWN_PHONE_CACHE_TTL = int(os.environ.get('UNKNOWN_PHONE_CACHE_TTL') or 60)
+    MAIL_SERVER = os.environ.get('MAIL_SERVER')
+    MAIL_PORT = int(os.environ.get('MAIL_PORT') or 25)
+    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS') is not None
+    MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
+    MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    ADMINS = [admin for admin in (os.environ.get('ADMINS') or '').split(',') if admin]
+    LOG_TO_STDOUT = os.environ.get('LOG_TO_STDOUT') is not None
+    LOG_FILE = os.environ.get('LOG_FILE') or 'logs/centsable.log'
+    LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES') or 10 * 1024 * 1024)
+    LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT') or 10)
+    LOG_BODY_SAMPLE_RATE = float(os.environ.get('LOG_BODY_SAMPLE_RATE') or 0.0)
+    METRICS_QUERY_HEADER = os.environ.get('METRICS_QUERY_HEADER') is not None
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    HEALTH_CHECK_CACHE_TTL = float(os.environ.get('HEALTH_CHECK_CACHE_TTL') or 2)
+    HEALTH_CHECK_HISTORY = int(os.environ.get('HEALTH_CHECK_HISTORY') or 10)
+    REPLICA_DATABASE_URL = os.environ.get('REPLICA_DATABASE_URL')
+    SQLALCHEMY_BINDS = {'replica': REPLICA_DATABASE_URL} if REPLICA_DATABASE_URL else None
+    SQLALCHEMY_REPLICA_BIND = 'replica' if REPLICA_DATABASE_URL else None
+    REPLICA_LAG_SECONDS = int(os.environ.get('REPLICA_LAG_SECONDS') or 5)
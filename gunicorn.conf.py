@@ -0,0 +1,53 @@
+'''
+Gunicorn settings, read from the environment
+
+    (venv) $ gunicorn -c gunicorn.conf.py application:application
+
+Workers and threads
+    The app spends most of a request waiting on MySQL and Twilio, and the
+    password hashing runs on its own pool, so the default is one process per
+    core (GUNICORN_WORKERS) each running GUNICORN_THREADS threads with the
+    gthread worker. Setting GUNICORN_THREADS to 1 switches to the sync worker,
+    where the usual 2 * cores + 1 processes is the default instead
+
+Connection pool
+    Every worker process has its own SQLAlchemy pool and a request holds at
+    most one connection, so a worker never needs more connections than it has
+    threads. DATABASE_POOL_SIZE defaults to GUNICORN_THREADS for that reason.
+    The most connections the instance can open is
+
+        workers * (DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW)
+
+    which, summed over every instance, has to stay under MySQL's
+    max_connections. See benchmarks/pool_load.py to measure the throughput of
+    a pool size
+'''
+
+import multiprocessing
+import os
+
+
+cores = multiprocessing.cpu_count()
+
+threads = int(os.environ.get('GUNICORN_THREADS') or 4)
+worker_class = 'gthread' if threads > 1 else 'sync'
+workers = int(os.environ.get('GUNICORN_WORKERS') or (cores if threads > 1 else cores * 2 + 1))
+
+# Sizes the pool of every worker to its threads, unless it was set explicitly
+os.environ.setdefault('DATABASE_POOL_SIZE', str(threads))
+
+bind = os.environ.get('GUNICORN_BIND') or '0.0.0.0:' + (os.environ.get('PORT') or '8000')
+timeout = int(os.environ.get('GUNICORN_TIMEOUT') or 30)
+graceful_timeout = timeout
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE') or 5)
+
+# Restarts the workers every so often, jittered so they do not all restart at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS') or 5000)
+max_requests_jitter = max_requests // 10
+
+# The app is loaded in every worker, so each one creates its own engine after
+# forking instead of sharing the master's connections
+preload_app = False
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')
+errorlog = '-'
@@ -0,0 +1,102 @@
+"""money in cents
+
+Revision ID: 7e1b5d9c4a20
+Revises: 3a9c7e52d1b4
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e1b5d9c4a20'
+down_revision = '3a9c7e52d1b4'
+branch_labels = None
+depends_on = None
+
+
+# The float money columns and the integer cents columns replacing them
+COLUMNS = [
+    ('transaction', 'price', 'price_cents'),
+    ('recurring_transaction', 'price', 'price_cents'),
+    ('settings', 'income', 'income_cents'),
+    ('monthly_category_total', 'spent', 'spent_cents'),
+    ('monthly_category_total', 'recurring', 'recurring_cents')
+]
+
+
+def upgrade():
+    # Adds the cents columns and converts the amounts in SQL, rounding to the
+    # nearest cent, before dropping the float columns. Batch mode lets SQLite
+    # drop columns too
+    #
+    # The SQL ROUND of the float times 100 is authoritative for the amounts
+    # stored before this migration, and app.money.to_cents for every amount
+    # after it. They only disagree on floats that were never whole cents, like
+    # 0.285, which the float stores as 0.28499999... and ROUND takes down to
+    # 28 while to_cents, going through the decimal text, takes up to 29
+    for table, amount_column, cents_column in COLUMNS:
+        op.add_column(table, sa.Column(cents_column, sa.BigInteger(), nullable=True))
+
+    for table, amount_column, cents_column in COLUMNS:
+        columns = sa.table(table, sa.column(amount_column, sa.Float), sa.column(cents_column, sa.BigInteger))
+        op.execute(columns.update().values({cents_column: sa.cast(sa.func.round(columns.c[amount_column] * 100), sa.BigInteger)}))
+
+    for table, amount_column, cents_column in COLUMNS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column(amount_column)
+
+    # Recomputes the rollups from the converted prices, since rounding the
+    # float totals could leave them a cent off the sum of the rounded prices
+    __rebuild_rollups()
+
+
+def downgrade():
+    for table, amount_column, cents_column in COLUMNS:
+        op.add_column(table, sa.Column(amount_column, sa.Float(), nullable=True))
+
+    for table, amount_column, cents_column in COLUMNS:
+        columns = sa.table(table, sa.column(amount_column, sa.Float), sa.column(cents_column, sa.BigInteger))
+        op.execute(columns.update().values({amount_column: columns.c[cents_column] / 100.0}))
+
+    for table, amount_column, cents_column in COLUMNS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column(cents_column)
+
+
+def __rebuild_rollups():
+    # Sums the prices per (user, month, category) in a single INSERT ... SELECT,
+    # so the rows never leave the database
+    transaction = sa.table('transaction', sa.column('user_id', sa.Integer), sa.column('category', sa.String), sa.column('price_cents', sa.BigInteger), sa.column('created_at', sa.DateTime))
+    recurring_transaction = sa.table('recurring_transaction', sa.column('user_id', sa.Integer), sa.column('category', sa.String), sa.column('price_cents', sa.BigInteger), sa.column('effective_at', sa.DateTime))
+    monthly_category_total = sa.table('monthly_category_total', sa.column('user_id', sa.Integer), sa.column('month', sa.DateTime), sa.column('category', sa.String), sa.column('spent_cents', sa.BigInteger), sa.column('recurring_cents', sa.BigInteger))
+
+    changes = sa.union_all(
+        sa.select([
+            transaction.c.user_id, __month(transaction.c.created_at).label('month'), transaction.c.category,
+            sa.func.coalesce(transaction.c.price_cents, 0).label('spent_cents'), sa.literal(0).label('recurring_cents')
+        ]).where(transaction.c.created_at != None),
+        sa.select([
+            recurring_transaction.c.user_id, __month(recurring_transaction.c.effective_at).label('month'), recurring_transaction.c.category,
+            sa.literal(0).label('spent_cents'), sa.func.coalesce(recurring_transaction.c.price_cents, 0).label('recurring_cents')
+        ]).where(recurring_transaction.c.effective_at != None)
+    ).alias('changes')
+    totals = sa.select([
+        changes.c.user_id, changes.c.month, changes.c.category, sa.func.sum(changes.c.spent_cents), sa.func.sum(changes.c.recurring_cents)
+    ]).group_by(changes.c.user_id, changes.c.month, changes.c.category)
+
+    op.execute(monthly_category_total.delete())
+    op.execute(monthly_category_total.insert().from_select(['user_id', 'month', 'category', 'spent_cents', 'recurring_cents'], totals))
+
+def __month(column):
+    # Truncates a datetime to the first of its month, which every dialect spells differently
+    dialect = op.get_bind().dialect.name
+    if dialect == 'mysql':
+        return sa.cast(sa.func.date_format(column, '%Y-%m-01'), sa.DateTime)
+    if dialect == 'postgresql':
+        return sa.func.date_trunc('month', column)
+    if dialect == 'sqlite':
+        # In the format SQLAlchemy stores datetimes in on SQLite
+        return sa.func.strftime('%Y-%m-01 00:00:00.000000', column)
+    raise NotImplementedError('no month truncation for {0}'.format(dialect))
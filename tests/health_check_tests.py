@@ -0,0 +1,74 @@
+import unittest
+import json
+import os
+import tempfile
+
+from app import create_app, db
+from config import Config
+from sqlalchemy.pool import QueuePool
+
+class TEST_CONFIG(Config):
+    TESTING = 1
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'health_check.db')
+    SQLALCHEMY_ENGINE_OPTIONS = {'poolclass': QueuePool, 'pool_size': 1, 'max_overflow': 0}
+    HEALTH_CHECK_CACHE_TTL = 60
+
+class UNAVAILABLE_TEST_CONFIG(TEST_CONFIG):
+    SQLALCHEMY_DATABASE_URI = 'sqlite:////nonexistent/secret-host/health_check.db'
+
+
+class HealthCheckTestCases(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TEST_CONFIG)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.app_context.pop()
+
+    def test_liveness(self):
+        response = self.client.get('/health/live')
+        self.assertEqual(response.status_code, 200)
+
+    def test_readiness_pings_and_caches(self):
+        response = self.client.get('/health/ready')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['status'], 'ready')
+        self.assertFalse(data['cached'])
+        self.assertEqual(data['pool']['size'], 1)
+        self.assertEqual(len(data['latenciesMs']), 1)
+
+        data = json.loads(self.client.get('/health/ready').data)
+        self.assertTrue(data['cached'])
+        self.assertEqual(len(data['latenciesMs']), 1)
+
+    def test_readiness_fails_when_the_pool_is_exhausted(self):
+        self.app.config['HEALTH_CHECK_CACHE_TTL'] = 0
+        connection = db.engine.connect()
+        try:
+            response = self.client.get('/health/ready')
+            self.assertEqual(response.status_code, 503)
+            data = json.loads(response.data)
+            self.assertEqual(data['pool']['checkedOut'], 1)
+            self.assertEqual(data['database']['error'], 'connection pool exhausted')
+        finally:
+            connection.close()
+
+        self.assertEqual(self.client.get('/health/ready').status_code, 200)
+
+    def test_readiness_does_not_expose_the_database_error(self):
+        app = create_app(UNAVAILABLE_TEST_CONFIG)
+        with app.app_context():
+            response = app.test_client().get('/health/ready')
+        self.assertEqual(response.status_code, 503)
+        data = json.loads(response.data)
+        self.assertEqual(data['database']['error'], 'unavailable')
+        self.assertNotIn('secret-host', response.get_data(as_text=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+from app.api.auth import identity_cache
+from app.settings_history import history_cache
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from contextlib import contextmanager
+import re
+
+
+@contextmanager
+def count_queries():
+    '''
+    Records the SQL statements every engine runs inside the block
+
+    Yields the list the statements are appended to, so a test can check how
+    many queries a request ran and print them when there are too many
+    '''
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(re.sub(r'\s+', ' ', statement).strip())
+
+    event.listen(Engine, 'after_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, 'after_cursor_execute', record)
+
+def clear_caches():
+    # Empties the in-process caches, so a request does all of its queries
+    for cache in (identity_cache, history_cache):
+        cache.clear()
+
+
+class QueryBudgetMixin(object):
+    def assertQueryBudget(self, statements, budget, name):
+        if len(statements) > budget:
+            self.fail('{0} ran {1} queries, over its budget of {2}:\n{3}'.format(name, len(statements), budget, '\n'.join(statements)))
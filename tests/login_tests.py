@@ -0,0 +1,137 @@
+import unittest
+import json
+
+from app import create_app, db
+from app.models import User
+from app.hashing import PasswordPolicy
+from config import Config
+from app import rate_limiter
+from app.api.auth import unknown_phone_number_key
+from flask_jwt_extended import decode_token, create_access_token
+
+class TEST_CONFIG(Config):
+    TESTING = 1
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    LOGIN_RATE_LIMIT_PHONE = 5
+    LOGIN_RATE_LIMIT_IP = 8
+
+
+class LoginTestCases(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TEST_CONFIG)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        user = User(first_name='David', last_name='Acevedo', country_calling_code='1', phone_number='5555555555', full_phone_number='+15555555555')
+        user.set_password('password')
+        db.session.add(user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self, password='password', phone_number='5555555555', forwarded_for=None):
+        headers = {'X-Forwarded-For': forwarded_for} if forwarded_for else {}
+        return self.client.post('/api/v1/login', json={'countryCode': '1', 'phoneNumber': phone_number, 'password': password}, headers=headers)
+
+    def test_login_embeds_user_claims(self):
+        response = self.login()
+        self.assertEqual(response.status_code, 200)
+
+        data = json.loads(response.data)
+        for token in (data['token'], data['refresh_token']):
+            decoded = decode_token(token)
+            self.assertEqual(decoded['identity'], '+15555555555')
+            self.assertEqual(decoded['user_claims'], {'user_id': 1, 'first_name': 'David'})
+
+    def test_login_rehashes_to_the_configured_parameters(self):
+        user = User.query.get(1)
+        user.password_hash = PasswordPolicy('pbkdf2', 1000).hash('password')
+        db.session.commit()
+
+        # An outdated work factor is upgraded
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(PasswordPolicy('pbkdf2').parameters(User.query.get(1).password_hash), ('pbkdf2', 150000))
+
+        # And a change of method moves the hash over to it
+        self.app.extensions['password_hasher']['policy'] = PasswordPolicy('bcrypt', 4)
+        self.assertEqual(self.login().status_code, 200)
+        self.assertTrue(User.query.get(1).password_hash.startswith('$2b$04$'))
+
+        self.assertEqual(self.login('wrong').status_code, 401)
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_long_passwords_with_bcrypt(self):
+        self.app.extensions['password_hasher']['policy'] = PasswordPolicy('bcrypt', 4)
+        password = 'p' * 80
+        headers = {'Authorization': 'Bearer ' + create_access_token(identity='+15555550000')}
+
+        response = self.client.post('/api/v1/users', headers=headers, data=json.dumps(
+            {'firstName': 'Jane', 'lastName': 'Doe', 'password': password, 'countryCode': '1', 'phoneNumber': '5555550000'}
+        ))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.login(password, phone_number='5555550000').status_code, 200)
+
+        # Passwords that only differ past the 72nd byte are still told apart
+        self.assertEqual(self.login(password[:-1] + 'q', phone_number='5555550000').status_code, 401)
+
+        response = self.client.post('/api/v1/users/reset-password', headers=headers, data=json.dumps(
+            {'newPassword': 'n' * 80, 'countryCode': '1', 'phoneNumber': '5555550000'}
+        ))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.login('n' * 80, phone_number='5555550000').status_code, 200)
+
+    def test_login_rejects_wrong_password(self):
+        self.assertEqual(self.login(password='wrong').status_code, 401)
+
+    def test_refresh_and_profile_update_rotate_claims(self):
+        tokens = json.loads(self.login().data)
+
+        response = self.client.get('/api/v1/refresh', headers={'Authorization': 'Bearer ' + tokens['refresh_token']})
+        self.assertEqual(decode_token(json.loads(response.data)['token'])['user_claims'], {'user_id': 1, 'first_name': 'David'})
+
+        response = self.client.put('/api/v1/users', headers={'Authorization': 'Bearer ' + tokens['token']}, data=json.dumps(
+            {'firstName': 'Dave', 'lastName': 'Acevedo', 'countryCode': '1', 'phoneNumber': '5555555555'}
+        ))
+        self.assertEqual(decode_token(json.loads(response.data)['token'])['user_claims'], {'user_id': 1, 'first_name': 'Dave'})
+
+    def test_login_is_rate_limited_per_phone_number_and_ip(self):
+        for _ in range(5):
+            self.assertEqual(self.login(password='wrong').status_code, 401)
+
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response.headers['Retry-After']), 0)
+
+        # Other phone numbers from the same IP get through until the IP limit
+        self.assertEqual(self.login(phone_number='5555550001').status_code, 401)
+        self.assertEqual(self.login(phone_number='5555550002').status_code, 401)
+        self.assertEqual(self.login(phone_number='5555550003').status_code, 429)
+
+    def test_ip_limit_is_per_client_behind_the_load_balancer(self):
+        for number in range(8):
+            self.assertEqual(self.login(phone_number='555555100{0}'.format(number), forwarded_for='203.0.113.1').status_code, 401)
+        self.assertEqual(self.login(forwarded_for='203.0.113.1').status_code, 429)
+
+        # Another client behind the same load balancer still gets through
+        self.assertEqual(self.login(forwarded_for='203.0.113.2').status_code, 200)
+
+    def test_unknown_phone_numbers_are_remembered_until_created(self):
+        self.assertEqual(self.login(phone_number='5555550000').status_code, 401)
+        self.assertTrue(rate_limiter.marked(unknown_phone_number_key('+15555550000')))
+
+        headers = {'Authorization': 'Bearer ' + create_access_token(identity='+15555550000')}
+        response = self.client.post('/api/v1/users', headers=headers, data=json.dumps(
+            {'firstName': 'Jane', 'lastName': 'Doe', 'password': 'password', 'countryCode': '1', 'phoneNumber': '5555550000'}
+        ))
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(rate_limiter.marked(unknown_phone_number_key('+15555550000')))
+        self.assertEqual(self.login(phone_number='5555550000').status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
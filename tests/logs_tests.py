@@ -0,0 +1,46 @@
+import unittest
+import json
+import logging
+
+from app import create_app, db
+from app.logs import JSONFormatter
+from config import Config
+
+class TEST_CONFIG(Config):
+    TESTING = 1
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+class LoggingTestCases(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TEST_CONFIG)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_request_ids_are_returned(self):
+        response = self.client.get('/api/v1/overview')
+        self.assertEqual(len(response.headers['X-Request-ID']), 32)
+
+        response = self.client.get('/api/v1/overview', headers={'X-Request-ID': 'from-the-proxy'})
+        self.assertEqual(response.headers['X-Request-ID'], 'from-the-proxy')
+
+    def test_formatter_writes_redacted_json(self):
+        record = logging.LogRecord('app', logging.ERROR, __file__, 1, 'missing parameters: %s', ({'phoneNumber': '5555555555', 'password': 'hunter2'},), None)
+        record.request_id = 'abc'
+
+        entry = json.loads(JSONFormatter().format(record))
+        self.assertEqual(entry['request_id'], 'abc')
+        self.assertEqual(entry['level'], 'ERROR')
+        self.assertNotIn('hunter2', entry['message'])
+        self.assertIn('5555555555', entry['message'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import datetime
+
+from app import create_app, db
+from app.metrics import registry
+from app.models import User, Settings
+from config import Config
+from flask_jwt_extended import create_access_token
+
+class TEST_CONFIG(Config):
+    TESTING = 1
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    METRICS_QUERY_HEADER = True
+    METRICS_TOKEN = 'scraper-token'
+
+
+class MetricsTestCases(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TEST_CONFIG)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        registry.reset()
+
+        user = User(first_name='David', last_name='Acevedo', country_calling_code='1', phone_number='5555555555', full_phone_number='+15555555555')
+        db.session.add(user)
+        db.session.add(Settings(user=user, needs_percentage=0.5, wants_percentage=0.3, savings_percentage=0.2, income=1000, effective_at=datetime.datetime(2020, 1, 1)))
+        db.session.commit()
+
+        self.headers = {'Authorization': 'Bearer ' + create_access_token(identity='+15555555555')}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_query_header_lists_the_queries(self):
+        response = self.client.get('/api/v1/overview?date=2020-06', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        count = int(response.headers['X-Query-Count'])
+        self.assertGreater(count, 0)
+        self.assertEqual(len(response.headers['X-Queries'].split(' ; ')), count)
+        self.assertIn('monthly_category_total', response.headers['X-Queries'])
+
+    def test_metrics_are_exposed_by_route(self):
+        self.client.get('/api/v1/overview?date=2020-06', headers=self.headers)
+        self.client.get('/api/v1/overview?date=2020-07', headers=self.headers)
+
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer scraper-token'})
+        self.assertEqual(response.status_code, 200)
+        body = response.get_data(as_text=True)
+        self.assertIn('centsable_requests_total{endpoint="/api/v1/overview",method="GET",status="200"} 2', body)
+        self.assertIn('centsable_request_duration_seconds_count{endpoint="/api/v1/overview",method="GET"} 2', body)
+        self.assertIn('centsable_request_db_queries_bucket{endpoint="/api/v1/overview",method="GET",le="+Inf"} 2', body)
+        self.assertIn('# TYPE centsable_response_size_bytes histogram', body)
+
+    def test_metrics_need_the_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', headers=self.headers).status_code, 401)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 401)
+
+        # Without a token configured, the metrics are not served at all
+        self.app.config['METRICS_TOKEN'] = None
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer scraper-token'}).status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
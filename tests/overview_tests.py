@@ -0,0 +1,101 @@
+import unittest
+import json
+import datetime
+
+from app import create_app, db, rollups
+from app.models import User, Transaction, RecurringTransaction, Settings
+from config import Config
+from flask_jwt_extended import create_access_token
+
+class TEST_CONFIG(Config):
+    TESTING = 1
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    RESPONSE_CACHE_BACKEND = 'local'
+
+
+class OverviewTestCases(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TEST_CONFIG)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        user = User(first_name='David', last_name='Acevedo', country_calling_code='1', phone_number='5555555555', full_phone_number='+15555555555')
+        db.session.add(user)
+        db.session.add(Settings(user=user, needs_percentage=0.5, wants_percentage=0.3, savings_percentage=0.2, income=1000, effective_at=datetime.datetime(2020, 1, 1)))
+        db.session.add(Transaction(author=user, name='Rent', category='Needs', price=300, created_at=datetime.datetime(2020, 6, 1)))
+        db.session.add(Transaction(author=user, name='Food', category='Needs', price=50, created_at=datetime.datetime(2020, 6, 15)))
+        db.session.add(Transaction(author=user, name='Movies', category='Wants', price=20, created_at=datetime.datetime(2020, 6, 20)))
+        db.session.add(Transaction(author=user, name='Old', category='Wants', price=999, created_at=datetime.datetime(2020, 5, 20)))
+        db.session.add(RecurringTransaction(recurring_author=user, name='Gym', category='Wants', price=30, effective_at=datetime.datetime(2020, 2, 1)))
+        db.session.add(RecurringTransaction(recurring_author=user, name='Later', category='Needs', price=500, effective_at=datetime.datetime(2020, 7, 1)))
+        db.session.commit()
+        rollups.rebuild()
+        db.session.commit()
+
+        self.headers = {'Authorization': 'Bearer ' + create_access_token(identity='+15555555555')}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_overview_sums_by_category(self):
+        response = self.client.get('/api/v1/overview?date=2020-06', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        data = json.loads(response.data)
+        self.assertEqual(data['settings']['needs']['spent'], 350)
+        self.assertEqual(data['settings']['wants']['spent'], 50)
+        self.assertEqual(data['settings']['savings']['spent'], 0)
+        self.assertEqual(data['amountSpent'], 400)
+        self.assertEqual(data['monthlyIncome'], 1000)
+        self.assertEqual(data['header'], 'Well Done!')
+
+    def test_unpadded_months_share_the_cached_month(self):
+        self.assertEqual(json.loads(self.client.get('/api/v1/overview?date=2020-6', headers=self.headers).data)['amountSpent'], 400)
+
+        self.client.post('/api/v1/transactions', headers=self.headers, data=json.dumps({'transactions': [
+            {'name': 'Lunch', 'category': 'Wants', 'price': 12.5, 'createdAt': '2020-06-21'}
+        ]}))
+        for date in ('2020-06', '2020-6'):
+            response = self.client.get('/api/v1/overview?date=' + date, headers=self.headers)
+            self.assertEqual(json.loads(response.data)['amountSpent'], 412.5)
+
+        self.assertEqual(self.client.get('/api/v1/overview?date=June', headers=self.headers).status_code, 400)
+
+    def test_future_months_are_not_cached(self):
+        response = self.client.get('/api/v1/overview?date=2999-01', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response.headers)
+
+    def test_trend_matches_the_overview_of_each_month(self):
+        db.session.add(Settings(user_id=1, needs_percentage=0.6, wants_percentage=0.2, savings_percentage=0.2, income=2000, effective_at=datetime.datetime(2020, 7, 1)))
+        db.session.commit()
+
+        response = self.client.get('/api/v1/overview/trend?months=3&to=2020-07', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        months = json.loads(response.data)['months']
+        self.assertEqual([month['month'] for month in months], ['2020-05', '2020-06', '2020-07'])
+        self.assertEqual([month['needs']['spent'] for month in months], [0, 350, 500])
+        self.assertEqual([month['wants']['spent'] for month in months], [1029, 50, 30])
+        self.assertEqual([month['monthlyIncome'] for month in months], [1000, 1000, 2000])
+        self.assertEqual(months[1]['needs']['allowed'], 500)
+        self.assertEqual(months[2]['needs']['allowed'], 1200)
+        self.assertEqual(months[1]['needs']['percentage'], 70)
+
+        # Each month agrees with the overview endpoint
+        for month in months:
+            overview = json.loads(self.client.get('/api/v1/overview?date=' + month['month'], headers=self.headers).data)
+            self.assertEqual(overview['amountSpent'], month['amountSpent'])
+
+    def test_trend_validates_months(self):
+        self.assertEqual(self.client.get('/api/v1/overview/trend?months=0', headers=self.headers).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/overview/trend?months=abc', headers=self.headers).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/overview/trend?to=2020', headers=self.headers).status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+import unittest
+import json
+import datetime
+import os
+import time
+
+from app import create_app, db, rollups
+from app.models import Transaction, RecurringTransaction
+from app.seed import seed
+from config import Config
+from flask_jwt_extended import create_access_token, create_refresh_token
+from tests.helpers import count_queries, clear_caches, QueryBudgetMixin
+
+class TEST_CONFIG(Config):
+    TESTING = 1
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    RESPONSE_CACHE_BACKEND = 'null'
+    RATE_LIMIT_BACKEND = 'null'
+    VERIFICATION_PROVIDER = 'fake'
+    PASSWORD_HASH_ROUNDS = 1000
+
+# The most queries each route may run, with cold caches so the identity and
+# settings lookups are counted. Raising one of these should come with a
+# reason in the commit that does it
+QUERY_BUDGETS = {
+    'GET /overview': 4,
+    'GET /overview/trend': 3,
+    'GET /transactions': 4,
+    'GET /transactions range': 4,
+    'GET /transactions page': 4,
+    'GET /transactions stream': 4,
+    'POST /transactions': 5,
+    'PUT /transactions/<id>': 5,
+    'DELETE /transactions/<id>': 4,
+    'POST /transactions/import': 7,
+    'GET /recurring-transactions': 2,
+    'POST /recurring-transactions': 5,
+    'PUT /recurring-transactions/<id>': 5,
+    'DELETE /recurring-transactions/<id>': 4,
+    'GET /settings': 2,
+    'POST /settings': 3,
+    'POST /login': 1,
+    'GET /refresh': 1,
+    'POST /users/exists': 1,
+    'GET /users': 2,
+    'POST /users': 3,
+    'PUT /users': 4,
+    'POST /users/verification': 0,
+    'POST /users/verification/check': 1,
+    'POST /users/reset-password': 3,
+    'POST /users/refresh': 1
+}
+
+# The latency budget of the read routes on a seeded dataset, in milliseconds
+# at the 95th percentile. Raise the scale to check a change against more data
+LATENCY_BUDGET_MS = float(os.environ.get('LATENCY_BUDGET_MS', 250))
+LATENCY_BUDGET_TRANSACTIONS = int(os.environ.get('LATENCY_BUDGET_TRANSACTIONS', 20000))
+LATENCY_BUDGET_REQUESTS = int(os.environ.get('LATENCY_BUDGET_REQUESTS', 20))
+
+
+class QueryBudgetTestCases(QueryBudgetMixin, unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TEST_CONFIG)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        seed(users=5, transactions=2000, months=12, end=datetime.datetime(2020, 12, 1))
+        db.session.commit()
+
+        self.headers = {'Authorization': 'Bearer ' + create_access_token(identity='+15550000001')}
+        self.transaction_id = Transaction.query.filter(Transaction.user_id == 1).first().id
+        self.recurring_transaction_id = RecurringTransaction.query.filter(RecurringTransaction.user_id == 1).first().id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def requests(self):
+        '''
+        Builds one request for every route in app/api, as (name, method, path,
+        body, headers, expected status code) tuples
+        '''
+
+        transaction = {'name': 'Food', 'category': 'Needs', 'price': 50, 'createdAt': '2020-06-15'}
+        recurring_transaction = {'name': 'Gym', 'category': 'Wants', 'price': 30, 'createdAt': '2020-05-01', 'effectiveAt': '2020-05'}
+        settings = {'needsPercentage': 0.5, 'wantsPercentage': 0.3, 'savingsPercentage': 0.2, 'income': 3000, 'effectiveAt': '2020-06'}
+        phone = {'countryCode': '1', 'phoneNumber': '5550000001'}
+        new_user = {'Authorization': 'Bearer ' + create_access_token(identity='+15559999999')}
+        refresh = {'Authorization': 'Bearer ' + create_refresh_token(identity='+15550000001')}
+
+        return [
+            ('GET /overview', 'GET', '/api/v1/overview?date=2020-06', None, self.headers, 200),
+            ('GET /overview/trend', 'GET', '/api/v1/overview/trend?months=12&to=2020-12', None, self.headers, 200),
+            ('GET /transactions', 'GET', '/api/v1/transactions?date=2020-06', None, self.headers, 200),
+            ('GET /transactions range', 'GET', '/api/v1/transactions?from=2020-01&to=2020-12', None, self.headers, 200),
+            ('GET /transactions page', 'GET', '/api/v1/transactions?date=2020-06&limit=10', None, self.headers, 200),
+            ('GET /transactions stream', 'GET', '/api/v1/transactions?date=2020-06&stream=1', None, self.headers, 200),
+            ('POST /transactions', 'POST', '/api/v1/transactions', {'transactions': [transaction, dict(transaction, name='Rent')]}, self.headers, 201),
+            ('PUT /transactions/<id>', 'PUT', '/api/v1/transactions/{0}'.format(self.transaction_id), dict(transaction, createdAt='2020-07-15'), self.headers, 204),
+            ('DELETE /transactions/<id>', 'DELETE', '/api/v1/transactions/{0}'.format(self.transaction_id), None, self.headers, 204),
+            ('POST /transactions/import', 'POST', '/api/v1/transactions/import?format=csv', 'Date,Description,Amount\n2020-06-01,Coffee,-2.50\n2020-06-02,Groceries,-40\n', self.headers, 200),
+            ('GET /recurring-transactions', 'GET', '/api/v1/recurring-transactions', None, self.headers, 200),
+            ('POST /recurring-transactions', 'POST', '/api/v1/recurring-transactions', {'transactions': [recurring_transaction]}, self.headers, 201),
+            ('PUT /recurring-transactions/<id>', 'PUT', '/api/v1/recurring-transactions/{0}'.format(self.recurring_transaction_id), dict(recurring_transaction, effectiveAt='2020-08'), self.headers, 204),
+            ('DELETE /recurring-transactions/<id>', 'DELETE', '/api/v1/recurring-transactions/{0}'.format(self.recurring_transaction_id), None, self.headers, 204),
+            ('GET /settings', 'GET', '/api/v1/settings?date=2020-06', None, self.headers, 200),
+            ('POST /settings', 'POST', '/api/v1/settings', settings, self.headers, 201),
+            ('POST /login', 'POST', '/api/v1/login', dict(phone, password='password'), {}, 200),
+            ('GET /refresh', 'GET', '/api/v1/refresh', None, refresh, 200),
+            ('POST /users/exists', 'POST', '/api/v1/users/exists', phone, {}, 200),
+            ('GET /users', 'GET', '/api/v1/users', None, self.headers, 200),
+            ('POST /users', 'POST', '/api/v1/users', {'firstName': 'Jane', 'lastName': 'Doe', 'password': 'password', 'countryCode': '1', 'phoneNumber': '5559999999'}, new_user, 201),
+            ('PUT /users', 'PUT', '/api/v1/users', dict(phone, firstName='Dave', lastName='Acevedo'), self.headers, 200),
+            ('POST /users/verification', 'POST', '/api/v1/users/verification', phone, {}, 204),
+            ('POST /users/verification/check', 'POST', '/api/v1/users/verification/check', dict(phone, code='123456'), {}, 200),
+            ('POST /users/reset-password', 'POST', '/api/v1/users/reset-password', dict(phone, newPassword='password'), self.headers, 200),
+            ('POST /users/refresh', 'POST', '/api/v1/users/refresh', None, refresh, 200)
+        ]
+
+    def run_request(self, method, path, body, headers, status_code):
+        # Runs the request with cold caches, and returns the queries it ran
+        clear_caches()
+        with count_queries() as statements:
+            if isinstance(body, dict):
+                response = self.client.open(path, method=method, json=body, headers=headers)
+            else:
+                response = self.client.open(path, method=method, data=body, headers=headers)
+            response.get_data()
+        self.assertEqual(response.status_code, status_code, path)
+        return statements
+
+    def test_every_route_is_within_its_query_budget(self):
+        for name, method, path, body, headers, status_code in self.requests():
+            statements = self.run_request(method, path, body, headers, status_code)
+            self.assertQueryBudget(statements, QUERY_BUDGETS[name], name)
+
+    def test_read_queries_do_not_grow_with_the_data(self):
+        reads = [request for request in self.requests() if request[1] == 'GET']
+        before = {request[0]: len(self.run_request(*request[1:])) for request in reads}
+
+        # Gives the user ten times as many transactions and recurring transactions
+        db.session.execute(Transaction.__table__.insert(), [
+            {'user_id': 1, 'name': 'Coffee', 'category': 'Wants', 'price_cents': 500, 'created_at': datetime.datetime(2020, month, 1 + day)}
+            for month in range(1, 13) for day in range(28) for _ in range(6)
+        ])
+        db.session.execute(RecurringTransaction.__table__.insert(), [
+            {'user_id': 1, 'name': 'Gym', 'category': 'Wants', 'price_cents': 3000, 'effective_at': datetime.datetime(2020, month, 1)}
+            for month in range(1, 13)
+        ])
+        db.session.commit()
+        rollups.rebuild(1)
+        db.session.commit()
+
+        after = {request[0]: len(self.run_request(*request[1:])) for request in reads}
+        self.assertEqual(after, before)
+
+
+class LatencyBudgetTestCases(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TEST_CONFIG)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        # Seeds a single busy user, which is the worst case for every read
+        seed(users=1, transactions=LATENCY_BUDGET_TRANSACTIONS, months=24, end=datetime.datetime(2020, 12, 1))
+        db.session.commit()
+
+        self.headers = {'Authorization': 'Bearer ' + create_access_token(identity='+15550000001')}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_reads_are_within_the_latency_budget(self):
+        for path in ('/api/v1/overview?date=2020-06', '/api/v1/overview/trend?months=12&to=2020-12', '/api/v1/transactions?date=2020-06',
+                     '/api/v1/recurring-transactions', '/api/v1/settings?date=2020-06', '/api/v1/users'):
+            latencies = []
+            for _ in range(LATENCY_BUDGET_REQUESTS):
+                clear_caches()
+                start = time.perf_counter()
+                response = self.client.get(path, headers=self.headers)
+                latencies.append((time.perf_counter() - start) * 1000)
+                self.assertEqual(response.status_code, 200)
+
+            latencies.sort()
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            self.assertLessEqual(p95, LATENCY_BUDGET_MS, '{0} took {1:.1f}ms at p95 over {2} transactions'.format(path, p95, LATENCY_BUDGET_TRANSACTIONS))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import json
+import datetime
+import os
+import tempfile
+
+from app import create_app, db, settings_history, response_cache
+from app.models import User, Settings
+from app.routing import WRITE_COOKIE
+from config import Config
+from flask_jwt_extended import create_access_token
+
+directory = tempfile.mkdtemp()
+
+class TEST_CONFIG(Config):
+    TESTING = 1
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(directory, 'primary.db')
+    SQLALCHEMY_BINDS = {'replica': 'sqlite:///' + os.path.join(directory, 'replica.db')}
+    SQLALCHEMY_REPLICA_BIND = 'replica'
+    RESPONSE_CACHE_BACKEND = 'local'
+
+
+class ReadReplicaTestCases(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TEST_CONFIG)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+
+        # Gives the replica different settings, so it shows which one was read
+        for engine, income in ((db.get_engine(self.app), 1000), (db.get_engine(self.app, 'replica'), 2000)):
+            db.Model.metadata.create_all(engine)
+            engine.execute(User.__table__.insert(), {'id': 1, 'first_name': 'David', 'last_name': 'Acevedo', 'country_calling_code': '1', 'phone_number': '5555555555', 'full_phone_number': '+15555555555'})
+            engine.execute(Settings.__table__.insert(), {'user_id': 1, 'needs_percentage': 0.5, 'wants_percentage': 0.3, 'savings_percentage': 0.2, 'income_cents': income * 100, 'effective_at': datetime.datetime(2020, 1, 1)})
+
+        self.headers = {'Authorization': 'Bearer ' + create_access_token(identity='+15555555555')}
+
+    def tearDown(self):
+        db.session.remove()
+        for engine in (db.get_engine(self.app), db.get_engine(self.app, 'replica')):
+            db.Model.metadata.drop_all(engine)
+        self.app_context.pop()
+
+    def get_income(self):
+        response = self.client.get('/api/v1/settings?date=2020-06', headers=self.headers)
+        return json.loads(response.data)['settings']['income']
+
+    def test_reads_go_to_the_replica(self):
+        self.assertEqual(self.get_income(), 2000)
+
+        response = self.client.get('/api/v1/users', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+    def test_writes_and_reads_after_writes_stay_on_the_primary(self):
+        data = {'needsPercentage': 0.5, 'wantsPercentage': 0.3, 'savingsPercentage': 0.2, 'income': 3000, 'effectiveAt': '2020-06'}
+        response = self.client.post('/api/v1/settings', headers=self.headers, data=json.dumps(data))
+        self.assertEqual(response.status_code, 201)
+
+        # The write only reached the primary, and the client reads from it while the replica catches up
+        self.assertIn(WRITE_COOKIE, response.headers['Set-Cookie'])
+        self.assertEqual(Settings.query.filter(Settings.income_cents == 300000).count(), 1)
+        self.assertEqual(self.get_income(), 3000)
+
+        # Once that window is over the cookie is gone, and the replica is read again
+        self.client = self.app.test_client()
+        settings_history.history_cache.clear()
+        self.assertEqual(self.get_income(), 2000)
+
+    def test_replica_reads_are_not_cached_right_after_a_write(self):
+        data = {'needsPercentage': 0.5, 'wantsPercentage': 0.3, 'savingsPercentage': 0.2, 'income': 3000, 'effectiveAt': '2020-06'}
+        self.client.post('/api/v1/settings', headers=self.headers, data=json.dumps(data))
+
+        # A read without the cookie, say from another client of the user, goes to the lagging replica
+        client = self.app.test_client()
+        response = client.get('/api/v1/overview?date=2020-05', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response.headers)
+
+        # Once the replica had the time to catch up, its reads are cached again
+        response_cache.backend.delete('written:1')
+        response = client.get('/api/v1/overview?date=2020-05', headers=self.headers)
+        self.assertIn('ETag', response.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import datetime
+
+from app import create_app, db, rollups
+from app.models import User, Transaction, RecurringTransaction, Settings
+from app.seed import seed
+from config import Config
+
+class TEST_CONFIG(Config):
+    TESTING = 1
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+class SeedTestCases(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TEST_CONFIG)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_seeds_consistent_data(self):
+        counts = seed(users=10, transactions=2000, recurring=2, settings=3, months=6, chunk_size=300, end=datetime.datetime(2020, 6, 1))
+        db.session.commit()
+
+        self.assertEqual(User.query.count(), counts['users'])
+        self.assertEqual(Transaction.query.count(), 2000)
+        self.assertEqual(RecurringTransaction.query.count(), 20)
+        self.assertEqual(Settings.query.count(), 30)
+        self.assertEqual(rollups.check(), {})
+
+        # Every user has settings from the first month and can log in
+        self.assertEqual(Settings.query.filter(Settings.effective_at == datetime.datetime(2020, 1, 1)).count(), 10)
+        response = self.client.post('/api/v1/login', json={'countryCode': '1', 'phoneNumber': '5550000001', 'password': 'password'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_seeding_again_appends_users(self):
+        seed(users=3, transactions=10, months=2)
+        seed(users=2, transactions=10, months=2)
+        db.session.commit()
+
+        self.assertEqual(sorted(user_id for user_id, in db.session.query(User.id)), [1, 2, 3, 4, 5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import json
+import datetime
+import decimal
+
+from app import create_app, db
+from app.models import User, Transaction
+from app.serialization import OrjsonSerializer, StandardSerializer, dumps, orjson
+from config import Config
+from flask_jwt_extended import create_access_token
+
+class TEST_CONFIG(Config):
+    TESTING = 1
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+class SerializationTestCases(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TEST_CONFIG)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        user = User(first_name='David', last_name='Acevedo', country_calling_code='1', phone_number='5555555555', full_phone_number='+15555555555')
+        db.session.add(user)
+        db.session.add(Transaction(author=user, name='Café', category='Wants', price=4.5, created_at=datetime.datetime(2020, 6, 1, 8, 30)))
+        db.session.commit()
+
+        self.headers = {'Authorization': 'Bearer ' + create_access_token(identity='+15555555555')}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_serializers_agree(self):
+        value = {
+            'createdAt': datetime.datetime(2020, 6, 1, 8, 30, 0, 250),
+            'checkedAt': datetime.datetime(2020, 6, 1, tzinfo=datetime.timezone.utc),
+            'month': datetime.date(2020, 6, 1),
+            'price': decimal.Decimal('12.5'),
+            'name': 'Café',
+            'items': [1, 2.5, None, True]
+        }
+
+        expected = b'{"createdAt":"2020-06-01T08:30:00.000250Z","checkedAt":"2020-06-01T00:00:00Z","month":"2020-06-01","price":12.5,"name":"Caf\xc3\xa9","items":[1,2.5,null,true]}'
+        backends = [StandardSerializer] + ([OrjsonSerializer] if orjson is not None else [])
+        self.app.config['JSON_SORT_KEYS'] = False
+        for serializer in [backend(self.app) for backend in backends]:
+            self.assertEqual(serializer.dumps(value), expected)
+
+        # Pretty output still parses to the same value
+        self.app.config['JSONIFY_PRETTYPRINT_REGULAR'] = True
+        for serializer in [backend(self.app) for backend in backends]:
+            self.assertIn(b'\n', serializer.dumps(value))
+            self.assertEqual(json.loads(serializer.dumps(value)), json.loads(expected))
+
+            # Newline delimited lines stay on one line either way
+            line = serializer.dumps_line(value)
+            self.assertEqual(line.count(b'\n'), 1)
+            self.assertEqual(json.loads(line), json.loads(expected))
+
+    def test_responses_use_iso_dates(self):
+        response = self.client.get('/api/v1/transactions?date=2020-06', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/json')
+        self.assertEqual(json.loads(response.data)['transactions'][0]['createdAt'], '2020-06-01T08:30:00Z')
+
+        streamed = self.client.get('/api/v1/transactions?date=2020-06&stream=1', headers=self.headers)
+        self.assertEqual(json.loads(streamed.data), json.loads(response.data))
+
+        self.assertEqual(dumps({'month': datetime.date(2020, 6, 1)}), b'{"month":"2020-06-01"}')
+
+
+if __name__ == '__main__':
+    unittest.main()
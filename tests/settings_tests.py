@@ -0,0 +1,84 @@
+import unittest
+import json
+import datetime
+
+from app import create_app, db, settings_history, response_cache
+from app.models import User, Settings
+from app.response_cache import NullCacheBackend
+from config import Config
+from flask_jwt_extended import create_access_token
+
+class TEST_CONFIG(Config):
+    TESTING = 1
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    RESPONSE_CACHE_BACKEND = 'local'
+
+
+class SettingsHistoryTestCases(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TEST_CONFIG)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        user = User(first_name='David', last_name='Acevedo', country_calling_code='1', phone_number='5555555555', full_phone_number='+15555555555')
+        db.session.add(user)
+        db.session.add(Settings(user=user, needs_percentage=0.5, wants_percentage=0.3, savings_percentage=0.2, income=1000, effective_at=datetime.datetime(2020, 1, 1)))
+        db.session.add(Settings(user=user, needs_percentage=0.5, wants_percentage=0.3, savings_percentage=0.2, income=2000, effective_at=datetime.datetime(2020, 6, 1)))
+        db.session.commit()
+
+        self.headers = {'Authorization': 'Bearer ' + create_access_token(identity='+15555555555')}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_resolves_the_settings_in_effect(self):
+        history = settings_history.get_history(1)
+        self.assertEqual(history.at(datetime.datetime(2019, 12, 1)), {})
+        self.assertEqual(history.at(datetime.datetime(2020, 1, 1))['income'], 1000)
+        self.assertEqual(history.at(datetime.datetime(2020, 5, 1))['income'], 1000)
+        self.assertEqual(history.at(datetime.datetime(2020, 6, 1))['income'], 2000)
+        self.assertEqual(history.at(datetime.datetime(2030, 1, 1))['income'], 2000)
+        self.assertEqual([settings.get('income') for settings in history.between(datetime.datetime(2019, 12, 1), 3)], [None, 1000, 1000])
+
+    def test_creating_settings_invalidates_the_history(self):
+        response = self.client.get('/api/v1/settings?date=2020-07', headers=self.headers)
+        self.assertEqual(json.loads(response.data)['settings']['income'], 2000)
+
+        data = {'needsPercentage': 0.6, 'wantsPercentage': 0.2, 'savingsPercentage': 0.2, 'income': 3000, 'effectiveAt': '2020-07'}
+        response = self.client.post('/api/v1/settings', headers=self.headers, data=json.dumps(data))
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.get('/api/v1/settings?date=2020-07', headers=self.headers)
+        self.assertEqual(json.loads(response.data)['settings']['income'], 3000)
+        response = self.client.get('/api/v1/settings?date=2020-06', headers=self.headers)
+        self.assertEqual(json.loads(response.data)['settings']['income'], 2000)
+
+    def test_a_write_in_another_worker_invalidates_the_history(self):
+        self.assertEqual(settings_history.settings_at(1, datetime.datetime(2020, 7, 1))['income'], 2000)
+
+        # Another worker only shares the response cache backend with this one, so
+        # all this worker sees of its write is the new generation
+        db.session.add(Settings(user_id=1, needs_percentage=0.6, wants_percentage=0.2, savings_percentage=0.2, income=3000, effective_at=datetime.datetime(2020, 7, 1)))
+        db.session.commit()
+        self.assertEqual(settings_history.settings_at(1, datetime.datetime(2020, 7, 1))['income'], 2000)
+        response_cache.invalidate(1)
+
+        self.assertEqual(settings_history.settings_at(1, datetime.datetime(2020, 7, 1))['income'], 3000)
+
+    def test_history_is_cached_per_process_without_a_shared_generation(self):
+        self.app.extensions['response_cache'] = NullCacheBackend(self.app)
+        self.assertEqual(settings_history.settings_at(1, datetime.datetime(2020, 7, 1))['income'], 2000)
+        self.assertIn((1, None), settings_history.history_cache)
+
+        # A write in this worker still invalidates it
+        data = {'needsPercentage': 0.6, 'wantsPercentage': 0.2, 'savingsPercentage': 0.2, 'income': 3000, 'effectiveAt': '2020-07'}
+        self.client.post('/api/v1/settings', headers=self.headers, data=json.dumps(data))
+        self.assertEqual(settings_history.settings_at(1, datetime.datetime(2020, 7, 1))['income'], 3000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,16 @@
 import unittest
 import json
 import os
+import datetime
+import io
 
-from app import create_app
+from app import create_app, db, rollups, response_cache
+from app.api.errors import error_response
+from app.models import User, Transaction, RecurringTransaction, MonthlyCategoryTotal
 from config import Config
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 class TEST_CONFIG(Config):
     TESTING = 1
@@ -22,5 +29,244 @@ class UserManagementTestCases(unittest.TestCase):
         self.assertEqual(200, 200)
 
 
+class ROLLUP_TEST_CONFIG(Config):
+    TESTING = 1
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    RESPONSE_CACHE_BACKEND = 'local'
+
+
+class TransactionRollupTestCases(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(ROLLUP_TEST_CONFIG)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        db.session.add(User(first_name='David', last_name='Acevedo', country_calling_code='1', phone_number='5555555555', full_phone_number='+15555555555'))
+        db.session.commit()
+
+        self.headers = {'Authorization': 'Bearer ' + create_access_token(identity='+15555555555')}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_writes_keep_rollups_consistent(self):
+        response = self.client.post('/api/v1/transactions', headers=self.headers, data=json.dumps({'transactions': [
+            {'name': 'Rent', 'category': 'Needs', 'price': 300, 'createdAt': '2020-06-01'},
+            {'name': 'Food', 'category': 'Needs', 'price': 50, 'createdAt': '2020-06-15'},
+            {'name': 'Movies', 'category': 'Wants', 'price': 20, 'createdAt': '2020-07-02'}
+        ]}))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(rollups.check(), {})
+
+        transaction = Transaction.query.filter(Transaction.name == 'Food').first()
+        response = self.client.put('/api/v1/transactions/{0}'.format(transaction.id), headers=self.headers, data=json.dumps(
+            {'name': 'Food', 'category': 'Wants', 'price': 60, 'createdAt': '2020-07-15'}
+        ))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(rollups.check(), {})
+
+        response = self.client.delete('/api/v1/transactions/{0}'.format(transaction.id), headers=self.headers)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(rollups.check(), {})
+
+        response = self.client.post('/api/v1/recurring-transactions', headers=self.headers, data=json.dumps({'transactions': [
+            {'name': 'Gym', 'category': 'Wants', 'price': 30, 'createdAt': '2020-05-01', 'effectiveAt': '2020-05'}
+        ]}))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(rollups.check(), {})
+
+        response = self.client.get('/api/v1/transactions?date=2020-07', headers=self.headers)
+        self.assertEqual(json.loads(response.data)['amountSpent'], 50)
+
+
+    def test_concurrent_first_writes_to_a_rollup(self):
+        # Creates the rollup row right after the increment found none, the way a concurrent writer would
+        inserted = []
+
+        def insert_concurrently(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('UPDATE monthly_category_total') and cursor.rowcount == 0 and not inserted:
+                inserted.append(True)
+                conn.execute(MonthlyCategoryTotal.__table__.insert(), {'user_id': 1, 'month': datetime.datetime(2020, 6, 1), 'category': 'Needs', 'spent_cents': 5000, 'recurring_cents': 0})
+
+        event.listen(Engine, 'after_cursor_execute', insert_concurrently)
+        try:
+            response = self.client.post('/api/v1/transactions', headers=self.headers, data=json.dumps({'transactions': [
+                {'name': 'Rent', 'category': 'Needs', 'price': 300, 'createdAt': '2020-06-01'}
+            ]}))
+        finally:
+            event.remove(Engine, 'after_cursor_execute', insert_concurrently)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(inserted, [True])
+        self.assertEqual([(rollup.spent_cents, rollup.recurring_cents) for rollup in MonthlyCategoryTotal.query], [(35000, 0)])
+
+    def test_cached_listing_is_invalidated_by_writes(self):
+        response = self.client.get('/api/v1/transactions?date=2020-06', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+
+        response = self.client.get('/api/v1/transactions?date=2020-06', headers=dict(self.headers, **{'If-None-Match': etag}))
+        self.assertEqual(response.status_code, 304)
+
+        self.client.post('/api/v1/transactions', headers=self.headers, data=json.dumps({'transactions': [
+            {'name': 'Rent', 'category': 'Needs', 'price': 300, 'createdAt': '2020-06-01'}
+        ]}))
+
+        response = self.client.get('/api/v1/transactions?date=2020-06', headers=dict(self.headers, **{'If-None-Match': etag}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.data)['transactions']), 1)
+
+    def test_current_month_is_not_cached(self):
+        month = datetime.datetime.today().strftime('%Y-%m')
+        response = self.client.get('/api/v1/transactions?date=' + month, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response.headers)
+
+    def test_cache_passes_error_responses_through(self):
+        # The views' error paths return a bare response rather than a tuple
+        with self.app.test_request_context('/api/v1/transactions?date=2020-06'):
+            response, status_code = response_cache.response(1, 'transactions', '2020-06', lambda: error_response(500))
+        self.assertEqual(status_code, 500)
+        self.assertEqual(json.loads(response.data)['error'], 'Internal Server Error')
+
+        response = self.client.get('/api/v1/transactions?date=2020-06', headers=self.headers)
+        self.assertEqual(json.loads(response.data)['transactions'], [])
+
+    def test_bulk_create_returns_ids(self):
+        transactions = [{'name': 'Coffee {0}'.format(i), 'category': 'Wants', 'price': 2, 'createdAt': '2020-06-{0:02d}'.format(i % 28 + 1)} for i in range(2500)]
+        response = self.client.post('/api/v1/transactions', headers=self.headers, data=json.dumps({'transactions': transactions}))
+        self.assertEqual(response.status_code, 201)
+
+        ids = json.loads(response.data)['ids']
+        self.assertEqual(len(ids), 2500)
+        self.assertEqual([transaction.name for transaction in Transaction.query.order_by(Transaction.id)], [item['name'] for item in transactions])
+        self.assertEqual(rollups.check(), {})
+
+    def test_bulk_create_validates_whole_payload(self):
+        response = self.client.post('/api/v1/transactions', headers=self.headers, data=json.dumps({'transactions': [
+            {'name': 'Rent', 'category': 'Needs', 'price': 300, 'createdAt': '2020-06-01'},
+            {'name': 'Food', 'category': 'Needs', 'price': 50}
+        ]}))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Transaction.query.count(), 0)
+
+    def test_import_csv_skips_existing_rows(self):
+        self.app.config['IMPORT_CHUNK_SIZE'] = 2
+        statement = 'Date,Description,Amount\n2020-06-01,Coffee,-2.50\n2020-06-01,Coffee,-2.50\n2020-06-02,Paycheck,1000\n2020-06-03,Groceries,-40\nnot a date,Broken,-1\n'
+
+        response = self.client.post('/api/v1/transactions/import?format=csv', headers=self.headers, data=statement)
+        lines = [json.loads(line) for line in response.data.decode().splitlines()]
+        self.assertTrue(lines[-1]['done'])
+        self.assertEqual(lines[-1]['imported'], 3)
+        self.assertEqual(lines[-1]['invalid'], 1)
+        self.assertEqual(rollups.check(), {})
+
+        response = self.client.post('/api/v1/transactions/import?format=csv', headers=self.headers, data=statement)
+        lines = [json.loads(line) for line in response.data.decode().splitlines()]
+        self.assertEqual(lines[-1]['imported'], 0)
+        self.assertEqual(lines[-1]['duplicates'], 3)
+        self.assertEqual(Transaction.query.count(), 3)
+
+    def test_import_ofx_upload(self):
+        statement = (
+            'OFXHEADER:100\nDATA:OFXSGML\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>'
+            '<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20200601120000[-5:EST]<TRNAMT>-12.50<NAME>Lunch</STMTTRN>'
+            '<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20200602<TRNAMT>500.00<NAME>Refund</STMTTRN>'
+            '</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>'
+        )
+
+        response = self.client.post('/api/v1/transactions/import?category=Wants', headers=self.headers, data={'file': (io.BytesIO(statement.encode()), 'statement.ofx')})
+        lines = [json.loads(line) for line in response.data.decode().splitlines()]
+        self.assertEqual(lines[-1]['imported'], 1)
+
+        transaction = Transaction.query.first()
+        self.assertEqual((transaction.name, transaction.category, transaction.price, transaction.created_at), ('Lunch', 'Wants', 12.5, datetime.datetime(2020, 6, 1)))
+
+    def test_cursor_pagination_and_streaming(self):
+        transactions = [{'name': 'Coffee {0}'.format(i), 'category': 'Wants', 'price': 2, 'createdAt': '2020-06-{0:02d}'.format(i % 3 + 1)} for i in range(7)]
+        self.client.post('/api/v1/transactions', headers=self.headers, data=json.dumps({'transactions': transactions}))
+
+        names = []
+        url = '/api/v1/transactions?date=2020-06&limit=3'
+        while url:
+            data = json.loads(self.client.get(url, headers=self.headers).data)
+            names.extend(transaction['name'] for transaction in data['transactions'])
+            url = '/api/v1/transactions?date=2020-06&limit=3&cursor=' + data['nextCursor'] if data['nextCursor'] else None
+        self.assertEqual(names, ['Coffee 0', 'Coffee 3', 'Coffee 6', 'Coffee 1', 'Coffee 4', 'Coffee 2', 'Coffee 5'])
+
+        streamed = json.loads(self.client.get('/api/v1/transactions?date=2020-06&stream=1', headers=self.headers).data)
+        listed = json.loads(self.client.get('/api/v1/transactions?date=2020-06', headers=self.headers).data)
+        self.assertEqual(streamed, listed)
+
+    def test_december_and_ranges_across_years(self):
+        self.client.post('/api/v1/transactions', headers=self.headers, data=json.dumps({'transactions': [
+            {'name': 'Gifts', 'category': 'Wants', 'price': 100, 'createdAt': '2019-12-24'},
+            {'name': 'Party', 'category': 'Wants', 'price': 40, 'createdAt': '2020-01-01'}
+        ]}))
+        self.client.post('/api/v1/recurring-transactions', headers=self.headers, data=json.dumps({'transactions': [
+            {'name': 'Gym', 'category': 'Wants', 'price': 30, 'createdAt': '2019-10-01', 'effectiveAt': '2019-10'}
+        ]}))
+
+        data = json.loads(self.client.get('/api/v1/transactions?date=2019-12', headers=self.headers).data)
+        self.assertEqual([transaction['name'] for transaction in data['transactions']], ['Gifts'])
+        self.assertEqual(data['amountSpent'], 130)
+
+        data = json.loads(self.client.get('/api/v1/transactions?from=2019-11&to=2020-02', headers=self.headers).data)
+        self.assertEqual(data['months'], [
+            {'month': '2019-11', 'amountSpent': 30},
+            {'month': '2019-12', 'amountSpent': 130},
+            {'month': '2020-01', 'amountSpent': 70},
+            {'month': '2020-02', 'amountSpent': 30}
+        ])
+        self.assertEqual(data['amountSpent'], 260)
+        self.assertEqual(len(data['transactions']), 2)
+
+        self.assertEqual(self.client.get('/api/v1/transactions?from=2020-02&to=2019-11', headers=self.headers).status_code, 400)
+
+    def test_listings_match_the_entities(self):
+        self.client.post('/api/v1/transactions', headers=self.headers, data=json.dumps({'transactions': [
+            {'name': 'Rent', 'category': 'Needs', 'price': 300, 'createdAt': '2020-06-01'},
+            {'name': 'Food', 'category': 'Needs', 'price': 50.25, 'createdAt': '2020-06-15'}
+        ]}))
+        self.client.post('/api/v1/recurring-transactions', headers=self.headers, data=json.dumps({'transactions': [
+            {'name': 'Gym', 'category': 'Wants', 'price': 30, 'createdAt': '2020-05-01', 'effectiveAt': '2020-05'}
+        ]}))
+
+        # The listings read rows, and still send what the entities would
+        data = json.loads(self.client.get('/api/v1/transactions?date=2020-06', headers=self.headers).data)
+        entities = json.loads(self.app.json_encoder().encode({
+            'transactions': [transaction.to_dict() for transaction in Transaction.query.order_by(Transaction.created_at)],
+            'recurringTransactions': [recurring_transaction.to_dict() for recurring_transaction in RecurringTransaction.query]
+        }))
+        self.assertEqual(data['transactions'], entities['transactions'])
+        self.assertEqual(data['recurringTransactions'], entities['recurringTransactions'])
+
+        data = json.loads(self.client.get('/api/v1/recurring-transactions', headers=self.headers).data)
+        self.assertEqual(data['recurringTransactions'], entities['recurringTransactions'])
+        self.assertEqual(data['amountSpent'], 30)
+
+    def test_money_is_summed_exactly(self):
+        # 0.1 + 0.2 is not 0.3 in floats, but it is in cents
+        response = self.client.post('/api/v1/transactions', headers=self.headers, data=json.dumps({'transactions': [
+            {'name': 'Gum', 'category': 'Wants', 'price': 0.1, 'createdAt': '2020-06-01'},
+            {'name': 'Mints', 'category': 'Wants', 'price': 0.2, 'createdAt': '2020-06-02'}
+        ]}))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([transaction.price_cents for transaction in Transaction.query.order_by(Transaction.id)], [10, 20])
+
+        data = json.loads(self.client.get('/api/v1/transactions?date=2020-06', headers=self.headers).data)
+        self.assertEqual(data['amountSpent'], 0.3)
+        self.assertEqual([transaction['price'] for transaction in data['transactions']], [0.1, 0.2])
+        self.assertEqual(rollups.check(), {})
+
+        response = self.client.post('/api/v1/transactions', headers=self.headers, data=json.dumps({'transactions': [
+            {'name': 'Gum', 'category': 'Wants', 'price': 'a lot', 'createdAt': '2020-06-01'}
+        ]}))
+        self.assertEqual(response.status_code, 400)
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,9 +1,15 @@
 import unittest
 import json
+import gc
 import os
+import time
 
-from app import create_app
+from app import create_app, db
+from app.api.auth import identity_cache
+from app.models import User
+from app.verification import Dispatcher, VerificationRejected, VerificationFailed
 from config import Config
+from flask_jwt_extended import create_access_token
 
 class TEST_CONFIG(Config):
     TESTING = 1
@@ -22,5 +28,122 @@ class UserManagementTestCases(unittest.TestCase):
         self.assertEqual(200, 200)
 
 
+class IDENTITY_TEST_CONFIG(Config):
+    TESTING = 1
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+class IdentityCacheTestCases(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(IDENTITY_TEST_CONFIG)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        db.session.add(User(first_name='David', last_name='Acevedo', country_calling_code='1', phone_number='5555555555', full_phone_number='+15555555555'))
+        db.session.commit()
+
+    def tearDown(self):
+        identity_cache.clear()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_phone_number_change_invalidates_identity(self):
+        headers = {'Authorization': 'Bearer ' + create_access_token(identity='+15555555555')}
+
+        response = self.client.get('/api/v1/users', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(identity_cache.get('+15555555555'), 1)
+
+        response = self.client.put('/api/v1/users', headers=headers, data=json.dumps(
+            {'firstName': 'David', 'lastName': 'Acevedo', 'countryCode': '1', 'phoneNumber': '5555550000'}
+        ))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('+15555555555', identity_cache)
+
+        response = self.client.put('/api/v1/users', headers=headers, data=json.dumps(
+            {'firstName': 'David', 'lastName': 'Acevedo', 'countryCode': '1', 'phoneNumber': '5555551111'}
+        ))
+        self.assertEqual(response.status_code, 403)
+
+
+class VERIFICATION_TEST_CONFIG(IDENTITY_TEST_CONFIG):
+    VERIFICATION_PROVIDER = 'fake'
+    VERIFICATION_WORKERS = 1
+    VERIFICATION_QUEUE_SIZE = 0
+    VERIFICATION_TIMEOUT = 0.2
+
+
+class VerificationTestCases(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(VERIFICATION_TEST_CONFIG)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        self.provider = self.app.extensions['verification'].provider
+        self.phone = {'countryCode': '1', 'phoneNumber': '5555555555'}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def wait_for_pending(self):
+        deadline = time.time() + 1
+        while '+15555555555' not in self.provider.pending and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_send_and_check_with_the_fake_provider(self):
+        response = self.client.post('/api/v1/users/verification', data=json.dumps(self.phone))
+        self.assertEqual(response.status_code, 204)
+        self.assertIn('+15555555555', self.provider.pending)
+
+        response = self.client.post('/api/v1/users/verification/check', data=json.dumps(dict(self.phone, code='000000')))
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/api/v1/users/verification/check', data=json.dumps(dict(self.phone, code='123456')))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('token', json.loads(response.data))
+
+    def test_full_queue_is_shed_and_slow_checks_time_out(self):
+        self.provider.latency = 0.5
+
+        response = self.client.post('/api/v1/users/verification', data=json.dumps(self.phone))
+        self.assertEqual(response.status_code, 504)
+
+        # The only worker is still busy with the send and there is no room to queue
+        response = self.client.post('/api/v1/users/verification', data=json.dumps(self.phone))
+        self.assertEqual(response.status_code, 503)
+
+        self.wait_for_pending()
+        time.sleep(0.05)
+        response = self.client.post('/api/v1/users/verification/check', data=json.dumps(dict(self.phone, code='123456')))
+        self.assertEqual(response.status_code, 504)
+
+    def test_provider_errors_are_returned_to_the_client(self):
+        def reject(full_phone_number, channel):
+            raise VerificationRejected('invalid phone number')
+
+        def fail(full_phone_number, channel):
+            raise VerificationFailed('provider is down')
+
+        self.provider.send = reject
+        response = self.client.post('/api/v1/users/verification', data=json.dumps(self.phone))
+        self.assertEqual(response.status_code, 400)
+
+        self.provider.send = fail
+        response = self.client.post('/api/v1/users/verification', data=json.dumps(self.phone))
+        self.assertEqual(response.status_code, 502)
+
+    def test_dispatcher_threads_are_shut_down(self):
+        executor = Dispatcher(self.app, self.provider).executor
+        gc.collect()
+        with self.assertRaises(RuntimeError):
+            executor.submit(time.sleep, 0)
+
+
 if __name__ == '__main__':
     unittest.main()